@@ -0,0 +1,361 @@
+"""Reads cosign and sigstore bundles and verifies them without the network"""
+
+import base64
+import binascii
+import json
+import os
+import sys
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    wait,
+)
+
+from cryptography import x509
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from util import (
+    available_cores,
+    check_digest_signature,
+    hash_artifact,
+    load_public_key,
+)
+from merkle_proof import (
+    FastDefaultHasher,
+    RootMismatchError,
+    compute_leaf_hash,
+    verify_inclusion,
+)
+from checkpoint_note import CheckpointError, load_log_key, verify_checkpoint
+
+
+# the suffix of the bundle that sits next to each artifact
+BUNDLE_SUFFIX = ".bundle"
+# how many pairs are queued per worker, more only costs memory
+PAIRS_PER_WORKER = 4
+
+
+class BundleError(ValueError):
+    """raised when a bundle can't be read or doesn't verify"""
+
+
+def _b64decode(value, what):
+    try:
+        return base64.b64decode(value, validate=True)
+    except (binascii.Error, TypeError) as e:
+        raise BundleError(f"{what} is not base64: {e}") from e
+
+
+def _der_to_pem(der):
+    try:
+        certificate = x509.load_der_x509_certificate(der)
+    except ValueError as e:
+        raise BundleError(f"bundle certificate can't be loaded: {e}") from e
+    return certificate.public_bytes(serialization.Encoding.PEM)
+
+
+class Bundle:
+    """
+    the parts of a bundle needed to verify an artifact offline, the
+    inclusion proof is in the format of the rekor api and is None
+    for bundles that only carry a signed entry timestamp
+    """
+
+    def __init__(self, signature, certificate, body, log_index, **tlog):
+        self.signature = signature
+        self.certificate = certificate
+        self.body = body
+        self.log_index = log_index
+        self.integrated_time = tlog.get("integrated_time")
+        self.log_id = tlog.get("log_id")
+        self.signed_entry_timestamp = tlog.get("signed_entry_timestamp")
+        self.inclusion_proof = tlog.get("inclusion_proof")
+
+
+def _parse_cosign_bundle(data):
+    # the bundle written by cosign sign-blob --bundle
+    payload = data["rekorBundle"]["Payload"]
+    return Bundle(
+        _b64decode(data["base64Signature"], "bundle signature"),
+        _b64decode(data["cert"], "bundle certificate"),
+        payload["body"],
+        payload["logIndex"],
+        integrated_time=payload["integratedTime"],
+        log_id=payload["logID"],
+        signed_entry_timestamp=_b64decode(
+            data["rekorBundle"]["SignedEntryTimestamp"], "signed entry timestamp"
+        ),
+    )
+
+
+def _parse_sigstore_bundle(data):
+    # the protobuf sigstore bundle in its json form, int64 fields are strings
+    material = data["verificationMaterial"]
+    if "certificate" in material:
+        raw_cert = material["certificate"]["rawBytes"]
+    else:
+        raw_cert = material["x509CertificateChain"]["certificates"][0]["rawBytes"]
+    tlog_entry = material["tlogEntries"][0]
+
+    inclusion_proof = None
+    proof = tlog_entry.get("inclusionProof")
+    if proof is not None:
+        inclusion_proof = {
+            "logIndex": int(proof["logIndex"]),
+            "treeSize": int(proof["treeSize"]),
+            "rootHash": _b64decode(proof["rootHash"], "root hash").hex(),
+            "hashes": [_b64decode(h, "proof hash").hex() for h in proof["hashes"]],
+            "checkpoint": proof.get("checkpoint", {}).get("envelope"),
+        }
+    promise = tlog_entry.get("inclusionPromise")
+    return Bundle(
+        _b64decode(data["messageSignature"]["signature"], "bundle signature"),
+        _der_to_pem(_b64decode(raw_cert, "bundle certificate")),
+        tlog_entry["canonicalizedBody"],
+        int(tlog_entry["logIndex"]),
+        integrated_time=int(tlog_entry["integratedTime"]),
+        log_id=_b64decode(tlog_entry["logId"]["keyId"], "log id").hex(),
+        signed_entry_timestamp=(
+            _b64decode(promise["signedEntryTimestamp"], "signed entry timestamp")
+            if promise
+            else None
+        ),
+        inclusion_proof=inclusion_proof,
+    )
+
+
+def parse_bundle(data):
+    """returns a Bundle from a cosign or a sigstore bundle in json format"""
+
+    try:
+        if "rekorBundle" in data:
+            return _parse_cosign_bundle(data)
+        if "verificationMaterial" in data:
+            return _parse_sigstore_bundle(data)
+    except BundleError:
+        raise
+    except (KeyError, IndexError, TypeError, ValueError) as e:
+        raise BundleError(f"bundle is missing {e}") from e
+    raise BundleError("not a cosign or sigstore bundle")
+
+
+def load_bundle(bundle_filepath):
+    """reads and parses a bundle file"""
+
+    with open(bundle_filepath, "r", encoding="utf-8") as bundle_file:
+        try:
+            data = json.load(bundle_file)
+        except ValueError as e:
+            raise BundleError(f"bundle is not json: {e}") from e
+    return parse_bundle(data)
+
+
+def _same_certificate(first, second):
+    # compares the certificates themselves so that
+    # differences in the pem line endings don't matter
+    try:
+        first = x509.load_pem_x509_certificate(first)
+        second = x509.load_pem_x509_certificate(second)
+    except ValueError:
+        return False
+    return first == second
+
+
+def verify_signed_entry_timestamp(bundle, log_key):
+    """
+    verifies the log's promise to include the entry, a signature over
+    the canonical json of the body, integrated time, log id and log index
+    """
+
+    key, _, _ = load_log_key(log_key)
+    payload = json.dumps(
+        {
+            "body": bundle.body,
+            "integratedTime": bundle.integrated_time,
+            "logID": bundle.log_id,
+            "logIndex": bundle.log_index,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+    ).encode()
+    try:
+        key.verify(bundle.signed_entry_timestamp, payload, ec.ECDSA(hashes.SHA256()))
+    except InvalidSignature as e:
+        raise BundleError("signed entry timestamp is not signed by the log") from e
+
+
+def verify_bundle(bundle, artifact_filepath, log_key):
+    """
+    verifies an artifact against a bundle without contacting rekor and
+    returns the names of the checks that passed, the first check that
+    fails raises a BundleError
+
+    everything in a bundle comes from the same file, so the log entry is
+    only trusted once the log's public key (in pem format) authenticates
+    it, an inclusion proof needs a checkpoint signed by the log and a
+    bundle without one needs the log's signed entry timestamp
+    """
+
+    if log_key is None:
+        raise BundleError("the log entry can't be authenticated without the log key")
+    try:
+        load_log_key(log_key)
+    except CheckpointError as e:
+        raise BundleError(str(e)) from e
+
+    # the log entry has to be about this signature, certificate and artifact
+    try:
+        spec = json.loads(base64.b64decode(bundle.body))["spec"]
+        body_signature = base64.b64decode(spec["signature"]["content"])
+        body_certificate = base64.b64decode(spec["signature"]["publicKey"]["content"])
+        body_digest = spec["data"]["hash"]["value"]
+    except (KeyError, TypeError, ValueError) as e:
+        raise BundleError(f"log entry body can't be decoded: {e}") from e
+    if body_signature != bundle.signature:
+        raise BundleError("log entry is for another signature")
+    if not _same_certificate(body_certificate, bundle.certificate):
+        raise BundleError("log entry is for another certificate")
+    # the artifact is read once, its digest is what the signature is over
+    digest = hash_artifact(artifact_filepath)
+    if digest.hex() != body_digest:
+        raise BundleError("log entry is for another artifact")
+
+    try:
+        public_key = load_public_key(bundle.certificate)
+    except ValueError as e:
+        raise BundleError(f"extracting the public key failed: {e}") from e
+    try:
+        valid = check_digest_signature(bundle.signature, public_key, digest)
+    except (TypeError, ValueError) as e:
+        raise BundleError(f"signature can't be verified: {e}") from e
+    if not valid:
+        raise BundleError("signature is invalid")
+    checks = ["signature", "body"]
+
+    proof = bundle.inclusion_proof
+    if proof is not None:
+        try:
+            verify_inclusion(
+                FastDefaultHasher,
+                proof["logIndex"],
+                proof["treeSize"],
+                compute_leaf_hash(bundle.body),
+                proof["hashes"],
+                proof["rootHash"],
+            )
+        except (ValueError, RootMismatchError) as e:
+            raise BundleError(f"inclusion verification failed: {e}") from e
+        checks.append("inclusion")
+
+    # the root hash of a proof is only trusted with the checkpoint the log
+    # signed for it, the signed entry timestamp is the log's promise for
+    # bundles that carry no proof
+    if proof is not None:
+        if not proof.get("checkpoint"):
+            raise BundleError("inclusion proof has no checkpoint signed by the log")
+        try:
+            note = verify_checkpoint(proof["checkpoint"], log_key)
+        except CheckpointError as e:
+            raise BundleError(f"checkpoint verification failed: {e}") from e
+        if note.size != proof["treeSize"] or note.root_hash.hex() != proof["rootHash"]:
+            raise BundleError("checkpoint is for another tree than the proof")
+        checks.append("checkpoint")
+    elif bundle.signed_entry_timestamp is None:
+        raise BundleError(
+            "bundle has neither an inclusion proof nor a signed entry timestamp"
+        )
+    if bundle.signed_entry_timestamp is not None:
+        verify_signed_entry_timestamp(bundle, log_key)
+        checks.append("signedEntryTimestamp")
+    return checks
+
+
+def walk_bundle_pairs(root):
+    """
+    lazily yields (artifact filepath, bundle filepath) for every bundle
+    under root, the artifact is the bundle's path without its suffix,
+    directories are only listed when the walk reaches them
+    """
+
+    directories = [root]
+    while directories:
+        directory = directories.pop()
+        subdirectories = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.is_file() and entry.name.endswith(BUNDLE_SUFFIX):
+                    yield entry.path[: -len(BUNDLE_SUFFIX)], entry.path
+        # reversed so that the walk goes through them in listing order
+        directories.extend(reversed(subdirectories))
+
+
+def verify_bundle_pair(pair, log_key=None):
+    """
+    verifies an (artifact filepath, bundle filepath) pair and returns a
+    result dict instead of raising, it is kept at module level so that
+    a process pool can pickle it
+    """
+
+    artifact_filepath, bundle_filepath = pair
+    result = {
+        "artifact": artifact_filepath,
+        "bundle": bundle_filepath,
+        "verified": False,
+        "checks": [],
+        "error": None,
+    }
+    if not os.path.isfile(artifact_filepath):
+        result["error"] = "The bundle has no artifact next to it"
+        return result
+    try:
+        result["checks"] = verify_bundle(
+            load_bundle(bundle_filepath), artifact_filepath, log_key
+        )
+    except (OSError, BundleError) as e:
+        result["error"] = str(e)
+        return result
+    result["verified"] = True
+    return result
+
+
+def verify_bundle_tree(
+    root, output=None, max_workers=None, log_key=None, use_processes=True
+):
+    """
+    verifies every artifact and bundle pair under root across a pool and
+    writes one json line per pair as soon as it finishes, only a few
+    pairs per worker are queued at once so memory stays flat however
+    large the tree is, returns the number of failures
+    """
+
+    if output is None:
+        output = sys.stdout
+    if not max_workers:
+        max_workers = available_cores()
+    pool = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+
+    failures = 0
+    pending = set()
+    pairs = walk_bundle_pairs(root)
+    with pool(max_workers=max_workers) as executor:
+        while True:
+            # tops the queue up from the walk before waiting on it
+            for pair in pairs:
+                pending.add(executor.submit(verify_bundle_pair, pair, log_key))
+                if len(pending) >= max_workers * PAIRS_PER_WORKER:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if not result["verified"]:
+                    failures += 1
+                output.write(json.dumps(result) + "\n")
+            output.flush()
+    return failures
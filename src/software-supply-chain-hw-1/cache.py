@@ -0,0 +1,254 @@
+"""On-disk cache of rekor log entries"""
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from util import write_json
+
+# the cache is bounded to this many bytes of entry json by default
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+CACHE_FILENAME = "entries.sqlite3"
+# how many hits are kept in memory before their access times are written
+ACCESS_FLUSH_SIZE = 1024
+
+# how many seconds a fetched checkpoint is reused by default
+DEFAULT_CHECKPOINT_TTL = 10
+
+
+class EntryCache:  # pylint: disable=too-many-instance-attributes
+    """
+    keeps log entries in a sqlite database keyed by log index and uuid,
+    entries are immutable once logged so they never need to be refetched,
+    the least recently used entries are evicted past max_bytes
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_BYTES):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, CACHE_FILENAME)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # the access times of hits by uuid, a hit only reads and the times
+        # are written with the next put, every ACCESS_FLUSH_SIZE hits or on close
+        self._accessed = {}
+
+        # the async engine reads and writes from several threads
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "uuid TEXT PRIMARY KEY, "
+            "log_index INTEGER UNIQUE, "
+            "raw TEXT NOT NULL, "
+            "body TEXT NOT NULL, "
+            "size INTEGER NOT NULL, "
+            "last_access REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)"
+        )
+        self._db.commit()
+        self._size = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def _get(self, column, key):
+        with self._lock:
+            row = self._db.execute(
+                f"SELECT uuid, raw FROM entries WHERE {column} = ?",  # nosec B608
+                (key,),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._accessed[row[0]] = time.time()
+            if len(self._accessed) >= ACCESS_FLUSH_SIZE:
+                self._flush_accesses()
+                self._db.commit()
+        # returns the entry in the json format request_log_entry returns
+        return {row[0]: json.loads(row[1])}
+
+    def get_by_index(self, log_index):
+        """returns the cached entry for a log index or None"""
+        return self._get("log_index", log_index)
+
+    def get_by_uuid(self, uuid):
+        """returns the cached entry for a uuid or None"""
+        return self._get("uuid", uuid)
+
+    def get_body(self, log_index):
+        """returns the decoded body of a cached entry or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body FROM entries WHERE log_index = ?", (log_index,)
+            ).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def put(self, data_json):
+        """stores every entry of a response in the request_log_entry json format"""
+
+        with self._lock:
+            for uuid, entry in data_json.items():
+                # an entry whose body can't be decoded is never cached
+                # so that it is reported the same way on every fetch
+                try:
+                    body = base64.b64decode(entry["body"]).decode()
+                except (KeyError, TypeError, ValueError):
+                    continue
+                raw = json.dumps(entry)
+                size = len(raw) + len(body)
+                log_index = entry.get("logIndex")
+                # the insert replaces the row with the same uuid and the
+                # row with the same log index, whichever exist
+                replaced = self._db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM entries"
+                    " WHERE uuid = ? OR log_index = ?",
+                    (uuid, log_index),
+                ).fetchone()[0]
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                    (uuid, log_index, raw, body, size, time.time()),
+                )
+                self._size += size - replaced
+            # the eviction goes by the access times of the hits so far
+            self._flush_accesses()
+            self._evict()
+            self._db.commit()
+
+    def _flush_accesses(self):
+        # writes the access times of the hits since the last flush
+        if self._accessed:
+            self._db.executemany(
+                "UPDATE entries SET last_access = ? WHERE uuid = ?",
+                [(accessed, uuid) for uuid, accessed in self._accessed.items()],
+            )
+            self._accessed.clear()
+
+    def _evict(self):
+        # drops the least recently used entries until the cache fits again
+        while self._size > self.max_bytes:
+            row = self._db.execute(
+                "SELECT uuid, size FROM entries ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self._db.execute("DELETE FROM entries WHERE uuid = ?", (row[0],))
+            self._size -= row[1]
+
+    def size(self):
+        """returns the number of bytes of entries in the cache"""
+        return self._size
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def close(self):
+        """writes the pending access times and closes the database"""
+        with self._lock:
+            self._flush_accesses()
+            self._db.commit()
+            self._db.close()
+
+
+class CheckpointCache:  # pylint: disable=too-many-instance-attributes
+    """
+    reuses the latest checkpoint for ttl seconds, callers that ask while
+    it is being fetched wait for that fetch instead of sending their own,
+    it also remembers the most recently verified checkpoint of each tree,
+    with a path everything is kept in a json file between runs
+    """
+
+    def __init__(self, ttl=DEFAULT_CHECKPOINT_TTL, path=None):
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._flight = None
+        self._checkpoint = None
+        self._fetched_at = 0.0
+        self._verified = {}
+        if path is not None and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as cache_file:
+                state = json.load(cache_file)
+            self._checkpoint = state.get("checkpoint")
+            self._fetched_at = state.get("fetchedAt", 0.0)
+            self._verified = state.get("verified", {})
+
+    def get(self, fetch):
+        """
+        returns the cached checkpoint while it is fresh and otherwise
+        the result of fetch(), which is shared by concurrent callers
+        """
+
+        with self._lock:
+            if (
+                self._checkpoint is not None
+                and time.time() - self._fetched_at < self.ttl
+            ):
+                self.hits += 1
+                return self._checkpoint
+            flight = self._flight
+            leader = flight is None
+            if leader:
+                flight = self._flight = Future()
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        # every other caller waits for the one fetch in flight and gets
+        # its checkpoint or the exception it raised
+        if not leader:
+            return flight.result()
+
+        try:
+            checkpoint = fetch()
+        except BaseException as e:
+            with self._lock:
+                self._flight = None
+            flight.set_exception(e)
+            raise
+        with self._lock:
+            self._checkpoint = checkpoint
+            self._fetched_at = time.time()
+            self._flight = None
+            self._save()
+        flight.set_result(checkpoint)
+        return checkpoint
+
+    def remember_verified(self, checkpoint):
+        """records a checkpoint that was verified as consistent"""
+
+        with self._lock:
+            previous = self._verified.get(str(checkpoint["treeID"]))
+            # an older checkpoint never replaces a newer one
+            if previous is None or previous["treeSize"] <= checkpoint["treeSize"]:
+                self._verified[str(checkpoint["treeID"])] = {
+                    "treeID": str(checkpoint["treeID"]),
+                    "treeSize": checkpoint["treeSize"],
+                    "rootHash": checkpoint["rootHash"],
+                }
+                self._save()
+
+    def last_verified(self, tree_id):
+        """returns the most recently verified checkpoint of a tree or None"""
+
+        with self._lock:
+            return self._verified.get(str(tree_id))
+
+    def _save(self):
+        if self.path is None:
+            return
+        state = {
+            "checkpoint": self._checkpoint,
+            "fetchedAt": self._fetched_at,
+            "verified": self._verified,
+        }
+        write_json(self.path, state)
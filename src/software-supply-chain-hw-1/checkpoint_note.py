@@ -0,0 +1,216 @@
+"""Parses rekor checkpoint notes and verifies the log's signature on them"""
+
+import base64
+import binascii
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any
+
+from metrics import METRICS
+
+# cryptography is imported by the functions that verify signatures so
+# that importing this module for CheckpointError stays cheap
+
+# every signature line of a note starts with an em dash and a space
+SIGNATURE_PREFIX = "— "
+# the first bytes of a signature are the key hash of the key that made it
+KEY_HASH_SIZE = 4
+
+# how many verified notes are remembered
+VERIFIED_NOTES_SIZE = 4096
+
+# log public keys keyed by the sha256 of their pem
+_log_keys: dict[bytes, tuple[Any, bytes, bytes]] = {}
+# notes that were verified keyed by the sha256 of the note and the
+# full fingerprint of the key they were verified with, the 4 byte
+# key hash alone could be shared by two keys
+_verified_notes: OrderedDict[tuple[bytes, bytes], bool] = OrderedDict()
+_lock = threading.Lock()
+note_cache_stats = {"hits": 0, "misses": 0}
+METRICS.register_cache(
+    "checkpoint_note", lambda: (note_cache_stats["hits"], note_cache_stats["misses"])
+)
+
+
+class CheckpointError(ValueError):
+    """raised when a checkpoint note can't be parsed or isn't signed by the log"""
+
+
+class CheckpointNote:
+    """
+    a parsed checkpoint note, the text is the signed part of the note
+    and signatures is a list of (name, key hash, signature)
+    """
+
+    def __init__(self, origin, size, root_hash, extensions, text, signatures):
+        self.origin = origin
+        self.size = size
+        self.root_hash = root_hash
+        self.extensions = extensions
+        self.text = text
+        self.signatures = signatures
+
+    def tree_id(self):
+        """returns the tree id rekor appends to the origin line or None"""
+
+        _, sep, tree_id = self.origin.rpartition(" - ")
+        return tree_id if sep else None
+
+
+def parse_checkpoint(note):
+    """
+    parses a checkpoint note, the signed text holds the origin, the tree
+    size, the base64 root hash and optional extension lines and is
+    followed by a blank line and one signature line per signer
+    """
+
+    if isinstance(note, bytes):
+        note = note.decode()
+    text, sep, signature_block = note.partition("\n\n")
+    if not sep:
+        raise CheckpointError("checkpoint has no signatures")
+    text += "\n"
+
+    lines = text.splitlines()
+    if len(lines) < 3:
+        raise CheckpointError("checkpoint needs an origin, a size and a root hash")
+    origin, size, root_hash = lines[:3]
+    if not size.isdigit():
+        raise CheckpointError(f"checkpoint size is not a number: {size}")
+    try:
+        root_hash = base64.b64decode(root_hash, validate=True)
+    except binascii.Error as e:
+        raise CheckpointError(f"checkpoint root hash is not base64: {e}") from e
+
+    signatures = []
+    for line in signature_block.splitlines():
+        if not line:
+            continue
+        if not line.startswith(SIGNATURE_PREFIX):
+            raise CheckpointError(f"malformed signature line: {line}")
+        name, _, encoded = line[len(SIGNATURE_PREFIX) :].rpartition(" ")
+        try:
+            raw = base64.b64decode(encoded, validate=True)
+        except binascii.Error as e:
+            raise CheckpointError(f"signature of {name} is not base64: {e}") from e
+        if len(raw) <= KEY_HASH_SIZE:
+            raise CheckpointError(f"signature of {name} is too short")
+        signatures.append((name, raw[:KEY_HASH_SIZE], raw[KEY_HASH_SIZE:]))
+    if not signatures:
+        raise CheckpointError("checkpoint has no signatures")
+
+    return CheckpointNote(origin, int(size), root_hash, lines[3:], text, signatures)
+
+
+def load_log_key(public_key):
+    """
+    returns (key object, key hash, fingerprint) for a pem public key,
+    parsed once, the fingerprint is the sha256 of the der public key and
+    the key hash its start the way rekor names the key that signed a
+    checkpoint, a key that can't be loaded raises CheckpointError
+    """
+
+    fingerprint = hashlib.sha256(public_key).digest()
+    with _lock:
+        log_key = _log_keys.get(fingerprint)
+    if log_key is not None:
+        return log_key
+
+    # pylint: disable=import-outside-toplevel
+    from cryptography.exceptions import UnsupportedAlgorithm
+    from cryptography.hazmat.primitives import serialization
+    from cryptography.hazmat.primitives.serialization import load_pem_public_key
+
+    try:
+        key = load_pem_public_key(public_key)
+    except (TypeError, ValueError, UnsupportedAlgorithm) as e:
+        raise CheckpointError(f"the log public key can't be loaded: {e}") from e
+    der = key.public_bytes(
+        encoding=serialization.Encoding.DER,
+        format=serialization.PublicFormat.SubjectPublicKeyInfo,
+    )
+    key_fingerprint = hashlib.sha256(der).digest()
+    log_key = (key, key_fingerprint[:KEY_HASH_SIZE], key_fingerprint)
+    with _lock:
+        _log_keys[fingerprint] = log_key
+    return log_key
+
+
+def _verify_signature(key, signature, text):
+    # pylint: disable=import-outside-toplevel
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+
+    if isinstance(key, ed25519.Ed25519PublicKey):
+        key.verify(signature, text)
+    else:
+        key.verify(signature, text, ec.ECDSA(hashes.SHA256()))
+
+
+def verify_checkpoint(note, public_key):
+    """
+    parses a checkpoint note and verifies the signature the log made
+    with public_key (in pem format) over it, returns the CheckpointNote,
+    a note already verified with the same key isn't verified again
+    """
+
+    if isinstance(note, str):
+        note = note.encode()
+    parsed = parse_checkpoint(note)
+    key, key_hash, key_fingerprint = load_log_key(public_key)
+
+    memo_key = (hashlib.sha256(note).digest(), key_fingerprint)
+    with _lock:
+        if memo_key in _verified_notes:
+            _verified_notes.move_to_end(memo_key)
+            note_cache_stats["hits"] += 1
+            return parsed
+        note_cache_stats["misses"] += 1
+
+    # pylint: disable=import-outside-toplevel
+    from cryptography.exceptions import InvalidSignature
+
+    # only the signatures that name the log key are checked
+    text = parsed.text.encode()
+    for _, signature_key_hash, signature in parsed.signatures:
+        if signature_key_hash != key_hash:
+            continue
+        try:
+            with METRICS.stage("checkpoint_verify"):
+                _verify_signature(key, signature, text)
+        except InvalidSignature:
+            continue
+        with _lock:
+            _verified_notes[memo_key] = True
+            if len(_verified_notes) > VERIFIED_NOTES_SIZE:
+                _verified_notes.popitem(last=False)
+        return parsed
+    raise CheckpointError("checkpoint is not signed by the log key")
+
+
+def verify_signed_tree_head(checkpoint, public_key):
+    """
+    verifies the signedTreeHead of a checkpoint from /api/v1/log and that
+    the tree size and root hash next to it are the ones the log signed
+    """
+
+    signed_tree_head = checkpoint.get("signedTreeHead")
+    if not signed_tree_head:
+        raise CheckpointError("checkpoint has no signed tree head")
+    note = verify_checkpoint(signed_tree_head, public_key)
+    if note.size != checkpoint["treeSize"]:
+        raise CheckpointError(
+            f"signed tree size {note.size} doesn't match {checkpoint['treeSize']}"
+        )
+    if note.root_hash.hex() != checkpoint["rootHash"]:
+        raise CheckpointError(
+            f"signed root hash {note.root_hash.hex()} doesn't match "
+            f"{checkpoint['rootHash']}"
+        )
+    tree_id = note.tree_id()
+    if tree_id is not None and tree_id != str(checkpoint["treeID"]):
+        raise CheckpointError(
+            f"signed tree id {tree_id} doesn't match {checkpoint['treeID']}"
+        )
+    return note
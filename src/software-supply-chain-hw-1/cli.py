@@ -0,0 +1,555 @@
+"""Parses the command line and runs the commands it asks for"""
+
+import argparse
+import json
+import sys
+
+# newer pythons ship a profiling package of their own, so pylint orders
+# this module with the standard library ones
+from profiling import AUTO, DEFAULT_TOP, PROFILERS, pick_profiler, profile_call
+from rekor_client import (
+    RekorClient,
+    DEFAULT_BASE_URL,
+    DEFAULT_TIMEOUT,
+    DEFAULT_RETRIES,
+    DEFAULT_BACKOFF_FACTOR,
+    DEFAULT_POOL_SIZE,
+)
+from cache import (
+    EntryCache,
+    CheckpointCache,
+    DEFAULT_CACHE_BYTES,
+    DEFAULT_CHECKPOINT_TTL,
+)
+from metrics import METRICS, FORMATS, JSON, format_from_env
+from main import (
+    bundle_inclusion,
+    consistency,
+    consistency_chain,
+    get_latest_checkpoint,
+    inclusion,
+    inclusion_batch,
+    read_batch_file,
+)
+
+
+def register_client_caches(client):
+    """exports the hit rates of the caches the client uses"""
+
+    if client.cache is not None:
+        METRICS.register_cache(
+            "entry", lambda: (client.cache.hits, client.cache.misses)
+        )
+    if client.checkpoint_cache is not None:
+        METRICS.register_cache(
+            "checkpoint",
+            lambda: (client.checkpoint_cache.hits, client.checkpoint_cache.misses),
+        )
+
+
+def write_metrics(path=None, output_format=None):
+    """
+    writes the recorded metrics to path or to stderr, in the format
+    given, the one the environment asks for or json
+    """
+
+    output_format = output_format or format_from_env() or JSON
+    dump = METRICS.export(output_format)
+    if path is None:
+        sys.stderr.write(dump)
+        return
+    with open(path, "w", encoding="utf-8") as metrics_file:
+        metrics_file.write(dump)
+
+
+# every command below returns False when its arguments are incomplete,
+# which stops the commands after it from running
+
+
+def run_checkpoint(_args, client, _log_key):
+    """prints the latest checkpoint"""
+
+    # get and print latest checkpoint from server
+    # if debug is enabled, store it in a file checkpoint.json
+    checkpoint = get_latest_checkpoint(client)
+    print(json.dumps(checkpoint, indent=4))
+
+
+def run_inclusion(args, client, _log_key):
+    """verifies the inclusion of one entry"""
+    inclusion(args.inclusion, args.artifact, client)
+
+
+def run_bundle(args, _client, log_key):
+    """verifies an artifact against its bundle offline"""
+
+    if not args.artifact:
+        print("please specify the artifact the bundle is for")
+        return False
+    bundle_inclusion(args.bundle, args.artifact, log_key)
+    return True
+
+
+def run_bundle_dir(args, _client, log_key):
+    """verifies every artifact of a directory tree against its bundle"""
+
+    # the pairs are verified across --workers processes,
+    # one per available core by default
+    from bundle import verify_bundle_tree  # pylint: disable=import-outside-toplevel
+
+    if log_key is None:
+        sys.exit(
+            "Error: verifying bundles offline needs the log's public key,"
+            " pass it with --log-pubkey\n"
+        )
+    failures = verify_bundle_tree(args.bundle_dir, sys.stdout, args.workers, log_key)
+    if failures:
+        sys.exit(f"Error: {failures} artifacts failed verification\n")
+
+
+def run_inclusion_batch(args, client, _log_key):
+    """verifies the inclusion of every entry listed in a file"""
+
+    # one json line is written per entry and a failed entry
+    # doesn't stop the rest of the batch
+    # with more than one request in flight or with worker processes
+    # the asyncio engine overlaps the requests and the checks and
+    # writes the results as they finish
+    if args.max_in_flight > 1 or args.workers is not None:
+        # imported here as rekor_async imports main
+        # pylint: disable=import-outside-toplevel
+        from concurrent.futures import ProcessPoolExecutor
+        from rekor_async import inclusion_batch_async
+        from util import available_cores
+
+        def run_batch(pairs):
+            if args.workers is None:
+                return inclusion_batch_async(
+                    pairs, sys.stdout, client, args.max_in_flight
+                )
+            workers = args.workers or available_cores()
+            with ProcessPoolExecutor(max_workers=workers) as cpu_executor:
+                return inclusion_batch_async(
+                    pairs, sys.stdout, client, args.max_in_flight, cpu_executor
+                )
+
+    else:
+
+        def run_batch(pairs):
+            return inclusion_batch(pairs, client=client)
+
+    if args.inclusion_batch == "-":
+        failures = run_batch(read_batch_file(sys.stdin))
+    else:
+        with open(args.inclusion_batch, "r", encoding="utf-8") as batch_file:
+            failures = run_batch(read_batch_file(batch_file))
+    if failures:
+        sys.exit(f"Error: {failures} entries failed verification\n")
+
+
+def run_serve(args, client, _log_key):
+    """answers verification queries until interrupted"""
+
+    # imported here as daemon imports main
+    from daemon import serve  # pylint: disable=import-outside-toplevel
+
+    try:
+        serve(args.serve, client, args.debug, args.artifact_root)
+    except ValueError as e:
+        sys.exit(f"Error: {e}\n")
+
+
+def run_tail(args, client, _log_key):
+    """mirrors the new entries of the log until interrupted"""
+
+    # imported here as mirror imports main
+    from mirror import (  # pylint: disable=import-outside-toplevel
+        LogMirror,
+        MirrorError,
+    )
+
+    try:
+        LogMirror(args.tail, client).run(args.poll_interval)
+    except MirrorError as e:
+        sys.exit(f"Error: {e}\n")
+
+
+def run_consistency_chain(args, client, _log_key):
+    """verifies every hop of a list of checkpoints"""
+
+    with open(args.consistency_chain, "r", encoding="utf-8") as chain_file:
+        checkpoints = json.load(chain_file)
+    report = consistency_chain(checkpoints, client)
+    print(json.dumps(report, indent=4))
+    divergence = report["divergence"]
+    if divergence is not None:
+        sys.exit(f"Error: hop {divergence['hop']} is not consistent\n")
+    fetch_error = report["fetchError"]
+    if fetch_error is not None:
+        sys.exit(
+            f"Error: the proof of hop {fetch_error['hop']} could not be"
+            f" fetched: {fetch_error['error']}\n"
+        )
+
+
+def run_consistency(args, client, _log_key):
+    """verifies a previous checkpoint against the latest one"""
+
+    # without a previous checkpoint the last one verified for the
+    # current tree is used if there is a checkpoint cache to keep it
+    if args.checkpoint_cache and not (args.tree_id or args.tree_size or args.root_hash):
+        tree_id = get_latest_checkpoint(client)["treeID"]
+        last_verified = client.checkpoint_cache.last_verified(tree_id)
+        if last_verified is not None:
+            args.tree_id = last_verified["treeID"]
+            args.tree_size = last_verified["treeSize"]
+            args.root_hash = last_verified["rootHash"]
+    if not args.tree_id:
+        print("please specify tree id for prev checkpoint")
+        return False
+    if not args.tree_size:
+        print("please specify tree size for prev checkpoint")
+        return False
+    if not args.root_hash:
+        print("please specify root hash for prev checkpoint")
+        return False
+
+    prev_checkpoint = {}
+    prev_checkpoint["treeID"] = args.tree_id
+    prev_checkpoint["treeSize"] = args.tree_size
+    prev_checkpoint["rootHash"] = args.root_hash
+
+    consistency(prev_checkpoint, client)
+    return True
+
+
+# the commands in the order they run in, keyed by the argument asking for them
+COMMANDS = (
+    ("checkpoint", run_checkpoint),
+    ("inclusion", run_inclusion),
+    ("bundle", run_bundle),
+    ("bundle_dir", run_bundle_dir),
+    ("inclusion_batch", run_inclusion_batch),
+    ("serve", run_serve),
+    ("tail", run_tail),
+    ("consistency_chain", run_consistency_chain),
+    ("consistency", run_consistency),
+)
+
+
+def run_command(args, client, log_key):
+    """runs every command the arguments ask for"""
+
+    for argument, command in COMMANDS:
+        if getattr(args, argument) and command(args, client, log_key) is False:
+            return
+
+
+def add_command_arguments(parser):
+    """adds the arguments that pick the commands and their inputs"""
+
+    parser.add_argument(
+        "-c",
+        "--checkpoint",
+        help="Obtain latest checkpoint\
+                        from Rekor Server public instance",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--inclusion",
+        help="Verify inclusion of an\
+                        entry in the Rekor Transparency Log using log index\
+                        and artifact filename.\
+                        Usage: --inclusion 126574567",
+        required=False,
+        type=int,
+    )
+    parser.add_argument(
+        "--inclusion-batch",
+        help="Verify inclusion of every entry\
+                        listed in a file with one log index and artifact\
+                        filepath per line, use - to read from stdin.\
+                        Usage: --inclusion-batch entries.txt",
+        required=False,
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        help="Number of bulk batch requests fetched and verified\
+                        concurrently, 1 verifies them one at a time",
+        required=False,
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--workers",
+        help="Number of processes the signature and inclusion\
+                        checks of a batch or a bundle directory are spread across,\
+                        0 uses one per available core",
+        required=False,
+        type=int,
+    )
+    parser.add_argument(
+        "--bundle",
+        help="Verify the artifact given by --artifact against a\
+                        cosign or sigstore bundle without contacting\
+                        the Rekor server, needs --log-pubkey.\
+                        Usage: --bundle artifact.bundle",
+        required=False,
+    )
+    parser.add_argument(
+        "--bundle-dir",
+        help="Verify every artifact in a directory tree against the\
+                        .bundle file next to it and write one json line\
+                        per artifact, needs --log-pubkey.\
+                        Usage: --bundle-dir release/",
+        required=False,
+    )
+    parser.add_argument(
+        "--artifact",
+        help="Artifact filepath for verifying\
+                        signature",
+        required=False,
+    )
+    parser.add_argument(
+        "--consistency",
+        help="Verify consistency of a given\
+                        checkpoint with the latest checkpoint.",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--consistency-chain",
+        help="Verify that every checkpoint in a json file holding\
+                        an ordered list of checkpoints is consistent with\
+                        the one before it. Usage: --consistency-chain history.json",
+        required=False,
+    )
+    parser.add_argument(
+        "--tree-id", help="Tree ID for consistency proof", required=False
+    )
+    parser.add_argument(
+        "--tree-size", help="Tree size for consistency proof", required=False, type=int
+    )
+    parser.add_argument(
+        "--root-hash", help="Root hash for consistency proof", required=False
+    )
+
+
+def add_client_arguments(parser):
+    """adds the arguments that configure the client, its caches and the log key"""
+
+    parser.add_argument(
+        "--rekor-url",
+        help="Base url of the Rekor server to query",
+        required=False,
+        default=DEFAULT_BASE_URL,
+    )
+    parser.add_argument(
+        "--timeout",
+        help="Timeout in seconds for each request to the Rekor server",
+        required=False,
+        type=float,
+        default=DEFAULT_TIMEOUT,
+    )
+    parser.add_argument(
+        "--retries",
+        help="Number of times a timed out or 5xx request is retried",
+        required=False,
+        type=int,
+        default=DEFAULT_RETRIES,
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="Directory of the on-disk cache that log entries\
+                        are served from and stored in",
+        required=False,
+    )
+    parser.add_argument(
+        "--cache-size",
+        help="Size in megabytes the entry cache is kept under",
+        required=False,
+        type=int,
+        default=DEFAULT_CACHE_BYTES // (1024 * 1024),
+    )
+    parser.add_argument(
+        "--offline",
+        help="Only serve log entries from the cache given by\
+                        --cache-dir and never contact the Rekor server",
+        required=False,
+        action="store_true",
+    )
+    parser.add_argument(
+        "--checkpoint-cache",
+        help="File the latest checkpoint and the last verified\
+                        checkpoint of each tree are kept in between runs",
+        required=False,
+    )
+    parser.add_argument(
+        "--checkpoint-ttl",
+        help="Seconds a fetched checkpoint is reused for",
+        required=False,
+        type=float,
+        default=DEFAULT_CHECKPOINT_TTL,
+    )
+    parser.add_argument(
+        "--log-pubkey",
+        help="Public key of the Rekor log in pem format, every\
+                        checkpoint's signed tree head is verified with it",
+        required=False,
+    )
+
+
+def add_service_arguments(parser):
+    """adds the arguments of the server and of tail mode"""
+
+    parser.add_argument(
+        "--serve",
+        nargs="?",
+        const="127.0.0.1:8089",
+        help="Keep running and answer checkpoint, inclusion and\
+                        consistency queries over http on host:port or on\
+                        a unix socket, 127.0.0.1:8089 by default.\
+                        Usage: --serve 127.0.0.1:8089 or\
+                        --serve unix:/run/verifier.sock",
+        required=False,
+    )
+    parser.add_argument(
+        "--artifact-root",
+        help="Directory the artifacts of the --serve inclusion queries\
+                        are read from, paths leading out of it are\
+                        rejected, the working directory by default",
+        required=False,
+    )
+    parser.add_argument(
+        "--tail",
+        help="Keep polling the latest checkpoint and mirror the new\
+                        entries, the last verified checkpoint is kept in\
+                        the given state file. Usage: --tail mirror.json",
+        required=False,
+    )
+    parser.add_argument(
+        "--poll-interval",
+        help="Seconds between two polls in tail mode",
+        required=False,
+        type=float,
+        default=30,
+    )
+
+
+def add_diagnostic_arguments(parser):
+    """adds the arguments of the metrics and the profiler"""
+
+    parser.add_argument(
+        "--metrics-format",
+        help="Format the metrics recorded in debug mode or with\
+                        REKOR_METRICS set are written in",
+        required=False,
+        choices=FORMATS,
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help="File the metrics are written to instead of stderr",
+        required=False,
+    )
+    parser.add_argument(
+        "--profile",
+        help="Run the command under a profiler, write its stats to the\
+                        given file and print the hottest functions.\
+                        Usage: --profile inclusion.prof",
+        required=False,
+    )
+    parser.add_argument(
+        "--profile-top",
+        help="How many functions the profile summary lists",
+        required=False,
+        type=int,
+        default=DEFAULT_TOP,
+    )
+    parser.add_argument(
+        "--profiler",
+        help="cprofile, sampling (needs pyinstrument) or auto, which\
+                        uses the sampling profiler when it is installed",
+        required=False,
+        choices=PROFILERS,
+        default=AUTO,
+    )
+
+
+def build_parser():
+    """returns the parser of every command line argument"""
+
+    parser = argparse.ArgumentParser(description="Rekor Verifier")
+    parser.add_argument(
+        "-d",
+        "--debug",
+        help="Debug mode, records the time spent in every stage, the bytes\
+                        fetched, the cache hit rates and the hashes computed\
+                        and writes them out once the command is done",
+        required=False,
+        action="store_true",
+    )  # Default false
+    add_command_arguments(parser)
+    add_client_arguments(parser)
+    add_service_arguments(parser)
+    add_diagnostic_arguments(parser)
+    return parser
+
+
+def make_client(args, log_key):
+    """returns the pooled client every request of the run shares"""
+
+    cache = None
+    if args.cache_dir:
+        cache = EntryCache(args.cache_dir, args.cache_size * 1024 * 1024)
+    return RekorClient(
+        args.rekor_url,
+        args.timeout,
+        args.retries,
+        DEFAULT_BACKOFF_FACTOR,
+        max(DEFAULT_POOL_SIZE, args.max_in_flight),
+        cache,
+        args.offline,
+        CheckpointCache(args.checkpoint_ttl, args.checkpoint_cache),
+        log_key,
+    )
+
+
+def main():
+    """parses the command line and runs the commands it asks for"""
+
+    args = build_parser().parse_args()
+    if args.offline and not args.cache_dir:
+        print("please specify a cache directory for offline mode")
+        return
+    log_key = None
+    if args.log_pubkey:
+        with open(args.log_pubkey, "rb") as key_file:
+            log_key = key_file.read()
+    client = make_client(args, log_key)
+    if args.debug:
+        print("enabled debug mode")
+        METRICS.enable()
+    if METRICS.enabled:
+        register_client_caches(client)
+    try:
+        if args.profile:
+            try:
+                profiler = pick_profiler(args.profiler)
+            except ValueError as e:
+                sys.exit(f"Error: {e}\n")
+            # the stats are written even when the command exits with an error
+            profile_call(
+                run_command,
+                (args, client, log_key),
+                args.profile,
+                args.profile_top,
+                profiler,
+            )
+        else:
+            run_command(args, client, log_key)
+    finally:
+        # the metrics are written even when the command exits with an error
+        if METRICS.enabled:
+            write_metrics(args.metrics_file, args.metrics_format)
+        # closes the pooled connections and the entry cache
+        client.close()
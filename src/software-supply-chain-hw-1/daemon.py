@@ -0,0 +1,218 @@
+"""Resident verification server with a local http or unix socket api"""
+
+import json
+import os
+import socket
+import socketserver
+import stat
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+import requests
+
+from checkpoint_note import CheckpointError
+from metrics import METRICS
+from rekor_client import get_default_client
+from results import (
+    CHECKPOINT,
+    CONSISTENCY,
+    FAILED,
+    INCLUSION,
+    INPUT,
+    KEY,
+    SIGNATURE,
+)
+from main import check_consistency, check_inclusion, request_checkpoint
+
+# the server only listens on the loopback interface unless told otherwise
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8089
+# addresses starting with this are unix socket paths
+UNIX_PREFIX = "unix:"
+
+# the http status a failed check is answered with by category, a check
+# that ran and failed verification is a 422 and one whose entry or
+# checkpoint couldn't be fetched is a 502
+FAILURE_STATUSES = {
+    INPUT: 400,
+    KEY: 422,
+    SIGNATURE: 422,
+    INCLUSION: 422,
+    CONSISTENCY: 422,
+    CHECKPOINT: 422,
+}
+FETCH_FAILURE_STATUS = 502
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class UnixThreadingHTTPServer(ThreadingHTTPServer):
+    """a ThreadingHTTPServer listening on a unix socket path"""
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # HTTPServer.server_bind looks the address up as a host and port
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+
+class VerifierHandler(BaseHTTPRequestHandler):
+    """
+    answers GET /checkpoint, /inclusion and /consistency, the parameters
+    are taken from the query string or from a json object posted to
+    the same path, every answer is a json object except /metrics which
+    is in the prometheus text format
+    """
+
+    server_version = "RekorVerifier/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def _params(self):
+        params = dict(parse_qsl(urlparse(self.path).query))
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            body = json.loads(self.rfile.read(length))
+            if not isinstance(body, dict):
+                raise ValueError("the request body has to be a json object")
+            params.update(body)
+        return params
+
+    def _send(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_text(self, status, text, content_type):
+        data = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_result(self, result):
+        status = 200
+        if result.status == FAILED:
+            status = FAILURE_STATUSES.get(result.category, FETCH_FAILURE_STATUS)
+        self._send(status, result.to_dict())
+
+    def _handle(self):
+        route = urlparse(self.path).path.rstrip("/")
+        try:
+            params = self._params()
+            if route == "/health":
+                self._send(200, {"status": "ok"})
+            elif route == "/metrics":
+                self._send_text(200, METRICS.to_prometheus(), PROMETHEUS_CONTENT_TYPE)
+            elif route == "/checkpoint":
+                self._checkpoint()
+            elif route == "/inclusion":
+                self._inclusion(params)
+            elif route == "/consistency":
+                self._consistency(params)
+            else:
+                self._send(404, {"error": f"no such path: {route}"})
+        except (KeyError, TypeError, ValueError) as e:
+            self._send(400, {"error": f"bad request: {e}"})
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def _checkpoint(self):
+        try:
+            self._send(200, request_checkpoint(self.server.client))
+        except CheckpointError as e:
+            self._send(FETCH_FAILURE_STATUS, {"error": str(e)})
+        except requests.exceptions.RequestException as e:
+            self._send(FETCH_FAILURE_STATUS, {"error": f"request failed: {e}"})
+
+    def _inclusion(self, params):
+        artifact = resolve_artifact(self.server.artifact_root, params["artifact"])
+        result = check_inclusion(int(params["logIndex"]), artifact, self.server.client)
+        self._send_result(result)
+
+    def _consistency(self, params):
+        prev_checkpoint = {
+            "treeID": str(params["treeID"]),
+            "treeSize": int(params["treeSize"]),
+            "rootHash": params["rootHash"],
+        }
+        self._send_result(check_consistency(prev_checkpoint, self.server.client))
+
+    def address_string(self):
+        # unix socket clients have no address
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def resolve_artifact(artifact_root, artifact):
+    """
+    returns the path of an artifact named relative to artifact_root,
+    absolute paths, .. and symlinks leading out of the root are
+    rejected so a query can't read any other file of the host
+    """
+
+    if not isinstance(artifact, str) or not artifact:
+        raise ValueError("the artifact has to be a path relative to the artifact root")
+    if os.path.isabs(artifact) or ".." in artifact.replace("\\", "/").split("/"):
+        raise ValueError("the artifact has to be a path within the artifact root")
+    path = os.path.realpath(os.path.join(artifact_root, artifact))
+    if os.path.commonpath([artifact_root, path]) != artifact_root:
+        raise ValueError("the artifact has to be a path within the artifact root")
+    return path
+
+
+def make_server(address, client=None, verbose=False, artifact_root=None):
+    """
+    returns a server bound to address, "host:port" or "unix:/path",
+    that answers with one shared client so its connection pool,
+    entry cache and checkpoint cache stay warm between requests,
+    /inclusion only reads artifacts under artifact_root which is
+    the working directory by default
+    """
+
+    if address.startswith(UNIX_PREFIX):
+        path = address[len(UNIX_PREFIX) :]
+        # a socket left behind by a previous run is replaced,
+        # anything else at the path is left alone
+        if os.path.lexists(path):
+            if not stat.S_ISSOCK(os.lstat(path).st_mode):
+                raise ValueError(f"{path} exists and is not a socket")
+            os.unlink(path)
+        server = UnixThreadingHTTPServer(path, VerifierHandler)
+    else:
+        host, _, port = address.rpartition(":")
+        server = ThreadingHTTPServer(
+            (host or DEFAULT_HOST, int(port or DEFAULT_PORT)), VerifierHandler
+        )
+    server.daemon_threads = True
+    server.client = client if client is not None else get_default_client()
+    server.verbose = verbose
+    server.artifact_root = os.path.realpath(
+        artifact_root if artifact_root is not None else os.getcwd()
+    )
+    return server
+
+
+def serve(address, client=None, verbose=False, artifact_root=None):
+    """serves until interrupted"""
+
+    server = make_server(address, client, verbose, artifact_root)
+    print(f"serving on {address}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if address.startswith(UNIX_PREFIX):
+            os.unlink(address[len(UNIX_PREFIX) :])
@@ -3,20 +3,86 @@
 import os
 import sys
 import base64
-import argparse
 import json
+import threading
+from collections import OrderedDict
 import requests
-from util import extract_public_key, verify_artifact_signature
-from merkle_proof import (
-    DefaultHasher,
-    verify_consistency,
-    verify_inclusion,
-    compute_leaf_hash,
+from rekor_client import (
+    MAX_RETRIEVE_BATCH,
+    OfflineError,
+    chunked,
+    get_default_client,
 )
+from checkpoint_note import CheckpointError
+from metrics import METRICS
+from results import (
+    TIMEOUT,
+    OFFLINE,
+    CONNECTION,
+    UNAVAILABLE,
+    HTTP,
+    DECODE,
+    INPUT,
+    KEY,
+    CHECKPOINT,
+    INCLUSION,
+    CONSISTENCY,
+    InclusionResult,
+    ConsistencyResult,
+)
+
+# util, merkle_proof, bundle and the executors pull in cryptography and
+# multiprocessing, they are imported by the functions that use them so
+# that commands like --checkpoint start without loading them
+
 
+class LogEntry:  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """
+    a log entry fetched from rekor with its body, spec,
+    signature, certificate and inclusion proof decoded once
+    """
 
-def get_log_entry(log_index):
-    """returns the log entry in json format"""
+    def __init__(self, data_json):
+        # the rekor api returns a dict with the entry uuid as its only key
+        self.uuid, self.raw = next(iter(data_json.items()))
+        self.log_index = self.raw.get("logIndex")
+
+        # the raw body needs to be decoded first as it contains the signature
+        # as can be seen by the file stucture on search.sigstore.dev
+        # it then needs to be made into json again for ease of use
+        self.body = self.raw["body"]
+        self.body_decoded = json.loads(base64.b64decode(self.body))
+        self.spec = self.body_decoded["spec"]
+
+        # gets the signature and the certificate and decodes them
+        self.signature = base64.b64decode(self.spec["signature"]["content"])
+        self.certificate = base64.b64decode(
+            self.spec["signature"]["publicKey"]["content"]
+        )
+
+        # the inclusion proof is part of the same response
+        # so it never needs to be fetched again
+        self.inclusion_proof = self.raw["verification"]["inclusionProof"]
+
+
+# the errors that mean a log entry couldn't be decoded
+DECODE_ERRORS = (StopIteration, KeyError, TypeError, ValueError)
+
+
+def request_log_entry(log_index, client=None):
+    """
+    returns the log entry in json format and lets
+    the requests exceptions propagate
+    """
+
+    if client is None:
+        client = get_default_client()
+
+    # entries never change once logged so a cached one is always current
+    if client.cache is not None:
+        cached = client.cache.get_by_index(log_index)
+        if cached is not None:
+            return cached
 
     # from the rekor api /api/v1/log/entries is used to get the
     # log entry by logindex
@@ -24,269 +90,763 @@ def get_log_entry(log_index):
     # https://rekor.sigstore.dev/api/v1/log/entries
     # gives code 602 and states how the logindex is
     # needed for the query to be done
-    # constructs the rl for the request
-    request_url = "https://rekor.sigstore.dev/api/v1/log/entries?logIndex="
-    request_url += str(log_index)
+    # a status >= 400 indicates that the request was a failure
+    # and therefore the client raises an exception
+    data_json = client.get("/api/v1/log/entries", params={"logIndex": log_index})
+    if client.cache is not None:
+        client.cache.put(data_json)
+    return data_json
+
+
+def get_verification_proof(log_index, entry=None, client=None):
+    """returns the inculsion proof, raises EntryError if it can't be fetched"""
+
+    # an already fetched entry is reused instead of fetching it again
+    if entry is None:
+        entry = load_entry(log_index, client)
+    # returns the proof
+    return entry.inclusion_proof
+
+
+def request_category(e):
+    """returns the result category of a failed request"""
+
+    if isinstance(e, requests.exceptions.Timeout):
+        return TIMEOUT
+    if isinstance(e, OfflineError):
+        return OFFLINE
+    # raise_for_status raises HTTPError for a status >= 400, only a 4xx
+    # means the log rejected the request itself
+    if isinstance(e, requests.exceptions.HTTPError) and e.response is not None:
+        return UNAVAILABLE if e.response.status_code >= 500 else HTTP
+    return CONNECTION
+
+
+# the message each kind of failed entry request is reported with
+ENTRY_REQUEST_ERRORS = {
+    TIMEOUT: "The request timed out",
+    OFFLINE: "The log entry is not in the cache in offline mode",
+    CONNECTION: "Could not connect to the rekor server",
+    UNAVAILABLE: "The rekor server is unavailable",
+    HTTP: "The log index was not sane",
+}
+
+
+def get_log_entry(log_index, client=None):
+    """returns the log entry in json format, exits if it can't be fetched"""
+
     # verify that log index value is sane and returns the log entry if it is
-    # this is determined by the status code for the request as
-    # a status >= 400
-    # indicates that the request was a failure and therefore raise_for_status
-    # from the request import would raise an exception
+    # a status >= 400 indicates that the request was a failure and
+    # the client raises an exception
     try:
-        data = requests.get(request_url, timeout=3)
-        data.raise_for_status()
-    except requests.exceptions.Timeout:
-        sys.exit("Error: The request timed out\n")
-    # raise for status raises this type of exception
-    # upon a bad HTTP request
-    except requests.exceptions.HTTPError:
-        sys.exit("Error: The log index was not sane\n")
-    # if there was no exception, converts the data to a json
-    # format and returns it
-    return data.json()
-
-
-def get_verification_proof(log_index):
-    """returns the inculsion proof"""
-
-    # gets the log entry in json format
-    data_json = get_log_entry(log_index)
-    # returns the proof
-    return (list(data_json.values())[0])["verification"]["inclusionProof"]
+        return request_log_entry(log_index, client)
+    except requests.exceptions.RequestException as e:
+        sys.exit(f"Error: {ENTRY_REQUEST_ERRORS[request_category(e)]}\n")
 
 
-def inclusion(log_index, artifact_filepath):
-    """ "verifies inclusion"""
+def merkle_hasher():
+    """
+    returns the hasher the proofs are verified with, it counts
+    its hashes while the metrics are recorded
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from merkle_proof import FastDefaultHasher, CountingHasher
 
-    # gets the log entry in json format
-    data_json = get_log_entry(log_index)
+    if METRICS.enabled:
+        return CountingHasher(FastDefaultHasher)
+    return FastDefaultHasher
+
+
+def count_hashes(hasher):
+    """adds the hashes a counting hasher computed to the metrics"""
+    METRICS.count("merkle_hashes", getattr(hasher, "hashes", 0))
+
+
+def check_inclusion(log_index, artifact_filepath, client=None, entry=None):
+    """
+    verifies the signature and inclusion of an entry and returns an
+    InclusionResult instead of printing or exiting, call
+    raise_for_status on it to get a VerificationError instead,
+    an entry that was already fetched isn't fetched again
+    """
+
+    # every check that fails returns its own result
+    # pylint: disable=too-many-locals,too-many-return-statements
+    # pylint: disable=import-outside-toplevel
+    from util import load_public_key, check_artifact_signature
+    from merkle_proof import (
+        verify_inclusion,
+        compute_leaf_hash,
+        RootMismatchError,
+    )
+
+    result = InclusionResult(log_index, artifact_filepath)
 
     # verify that the artifact filepath is sane
     # its not sane if either the artifact doesn't exist
     # or if its not a valid file
+    if not artifact_is_sane(artifact_filepath):
+        return result.fail(INPUT, "The filepath is not sane")
+
+    # gets the decoded log entry, it is the only fetch
+    # needed for the whole verification
+    if entry is None:
+        try:
+            with result.timed("fetch"):
+                data_json = request_log_entry(log_index, client)
+                with METRICS.stage("decode"):
+                    entry = LogEntry(data_json)
+        except requests.exceptions.RequestException as e:
+            category = request_category(e)
+            return result.fail(category, ENTRY_REQUEST_ERRORS[category])
+        except DECODE_ERRORS:
+            return result.fail(DECODE, "The log entry could not be decoded")
+
+    # load_public_key(certificate)
+    # loads the public key object from the certificate, it is
+    # passed on as is so the pem round trip is skipped
+    try:
+        pk = load_public_key(entry.certificate)
+    except ValueError:
+        return result.fail(KEY, "Extracting the public key failed")
+
+    # check_artifact_signature(signature, public_key, artifact_filepath)
+    # checks whether the signature is valid, an invalid signature
+    # is recorded and the inclusion is still checked
+    signature = check_artifact_signature(entry.signature, pk, artifact_filepath)
+    result.timings.update(signature.timings)
+    result.signature_valid = signature.valid
+    if not signature.ok:
+        result.fail(signature.category, signature.error)
+
+    # gets the inclusion proof from the entry that was already fetched
+    # and the leaf hash which is calculated with the original body
+    # as compute_leaf_hash does the decoding itself
+    ver_proof = get_verification_proof(log_index, entry)
+    try:
+        with METRICS.stage("leaf_hash"):
+            result.leaf_hash = compute_leaf_hash(entry.body)
+        METRICS.count("merkle_hashes")
+        result.tree_size = ver_proof["treeSize"]
+        result.expected_root = ver_proof["rootHash"]
+    except (KeyError, TypeError, ValueError):
+        return result.fail(DECODE, "Computing the leaf hash failed")
+
+    # verify_inclusion(FastDefaultHasher, index, tree_size,
+    # leaf_hash, hashes, root_hash)
+    # verifies inclusion
+    hasher = merkle_hasher()
+    try:
+        with result.timed("inclusion"), METRICS.stage("merkle"):
+            verify_inclusion(
+                hasher,
+                ver_proof["logIndex"],
+                ver_proof["treeSize"],
+                result.leaf_hash,
+                ver_proof["hashes"],
+                ver_proof["rootHash"],
+            )
+    except RootMismatchError as e:
+        result.computed_root = e.calculated_root.decode()
+        result.included = False
+        return result.fail(INCLUSION, "Inclusion verification failed")
+    except (KeyError, TypeError, ValueError):
+        result.included = False
+        return result.fail(INCLUSION, "Inclusion verification failed")
+    finally:
+        count_hashes(hasher)
+    result.computed_root = result.expected_root
+    result.included = True
+    return result
+
+
+def inclusion(log_index, artifact_filepath, client=None):
+    """ "verifies inclusion"""
+
+    # the check itself is done by check_inclusion
+    # and only rendered here
+    result = check_inclusion(log_index, artifact_filepath, client)
+    if result.category == INPUT:
+        print(f"Error: {result.error}")
+        return
+    # the entry couldn't be fetched or its key couldn't be loaded
+    if result.signature_valid is None:
+        sys.exit(f"Error: {result.error}\n")
+    # an invalid signature is the first failure so its message is kept
+    print("Signature is valid" if result.signature_valid else result.error)
+    if result.included is None:
+        sys.exit("Error: Computing the leaf hash failed\n")
+    if not result.included:
+        sys.exit("Inclusion verification failed\n")
+    print("Offline root hash calculation for inclusion verified")
+    if not result.ok:
+        sys.exit(1)
+
+
+def bundle_inclusion(bundle_filepath, artifact_filepath, log_key=None):
+    """
+    verifies an artifact against a cosign or sigstore bundle
+    with everything read from the bundle instead of rekor, the
+    log's public key is needed to trust the log entry in it
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from bundle import BundleError, load_bundle, verify_bundle
+
+    # the proof and root hash in a bundle prove nothing on their own
+    if log_key is None:
+        sys.exit(
+            "Error: verifying a bundle offline needs the log's public key,"
+            " pass it with --log-pubkey\n"
+        )
     if not (os.path.exists(artifact_filepath) and os.path.isfile(artifact_filepath)):
         print("Error: The filepath is not sane")
         return
 
-    # the raw body needs to be decoded first as it contains the signature
-    # as can be seen by the file stucture on search.sigstore.dev
-    # it then needs to be made into json again for ease of use
-    list_body = list(data_json.values())[0]
-    body = list_body.get("body")
-    body_decode = json.loads(base64.b64decode(body))
+    try:
+        checks = verify_bundle(load_bundle(bundle_filepath), artifact_filepath, log_key)
+    except OSError as e:
+        sys.exit(f"Error: The bundle could not be read: {e}\n")
+    except BundleError as e:
+        sys.exit(f"Bundle verification failed: {e}\n")
+    print("Signature is valid")
+    if "inclusion" in checks:
+        print("Offline root hash calculation for inclusion verified")
+    for check in ("checkpoint", "signedEntryTimestamp"):
+        if check in checks:
+            print(f"The {check} is signed by the log")
+
+
+class EntryError(Exception):
+    """raised when a log entry can't be fetched or decoded"""
 
-    # gets the signature and decodes it
-    sig = body_decode["spec"]["signature"]["content"]
-    sig_decoded = base64.b64decode(sig)
 
-    # gets the certificate and decodes it
-    cert = body_decode["spec"]["signature"]["publicKey"]["content"]
-    cert_decoded = base64.b64decode(cert)
+def load_entry(log_index, client=None):
+    """
+    returns the decoded LogEntry for a log index, raises
+    EntryError with the reason instead of exiting
+    """
 
-    # extract_public_key(certificate)
-    # extracts the public key from the certificate
     try:
-        pk = extract_public_key(cert_decoded)
-    except ValueError:
-        sys.exit("Error: Extracting the public key failed\n")
+        return LogEntry(request_log_entry(log_index, client))
+    except requests.exceptions.RequestException as e:
+        raise EntryError(ENTRY_REQUEST_ERRORS[request_category(e)]) from e
+    except DECODE_ERRORS as e:
+        raise EntryError("The log entry could not be decoded") from e
 
-    # verify_artifact_signature(signature, public_key, artifact_filepath)
-    # verifies that the signature is valid
-    # already catches exceptions
-    verify_artifact_signature(sig_decoded, pk, artifact_filepath)
 
-    # get_verification_proof(log_index)
-    # gets the inclusion proof
-    ver_proof = get_verification_proof(log_index)
+def load_entries(log_indexes, client=None, chunk_size=MAX_RETRIEVE_BATCH):
+    """
+    fetches many log entries through the bulk retrieve endpoint and
+    returns a dict mapping every log index to its LogEntry or EntryError
+    """
 
-    # gets the leaf hash which is calculated with
-    # the original body as compute_leaf_hash does the decoding itself
-    try:
-        leaf_hash = compute_leaf_hash(body)
-    except TypeError:
-        sys.exit("Error: Computing the leaf hash failed\n")
-    except ValueError:
-        sys.exit("Error: Computing the leaf hash failed\n")
+    if client is None:
+        client = get_default_client()
+
+    entries = {}
+    # cached entries are served locally and only the rest are requested
+    if client.cache is not None:
+        for log_index in log_indexes:
+            cached = client.cache.get_by_index(log_index)
+            if cached is None:
+                continue
+            # the cache keeps any entry whose body decodes, so a cached
+            # entry of another kind is reported like a fetched one
+            try:
+                entries[log_index] = LogEntry(cached)
+            except DECODE_ERRORS:
+                entries[log_index] = EntryError("The log entry could not be decoded")
+    missing = [log_index for log_index in log_indexes if log_index not in entries]
 
-    # verify_inclusion(DefaultHasher, index, tree_size,
-    # leaf_hash, hashes, root_hash)
-    # verifies inclusion
     try:
-        verify_inclusion(
-            DefaultHasher,
-            ver_proof["logIndex"],
-            ver_proof["treeSize"],
-            leaf_hash,
-            ver_proof["hashes"],
-            ver_proof["rootHash"],
+        for _, data_list in client.retrieve_entries(missing, None, chunk_size):
+            for data_json in data_list:
+                if client.cache is not None:
+                    client.cache.put(data_json)
+                try:
+                    entry = LogEntry(data_json)
+                except DECODE_ERRORS:
+                    # the index is still read from the raw entry so that
+                    # only this entry is reported as undecodable
+                    raw = next(iter(data_json.values()), {})
+                    entries[raw.get("logIndex")] = EntryError(
+                        "The log entry could not be decoded"
+                    )
+                    continue
+                entries[entry.log_index] = entry
+    except requests.exceptions.RequestException as e:
+        error = EntryError(ENTRY_REQUEST_ERRORS[request_category(e)])
+    else:
+        # rekor leaves indexes it doesn't have out of the response
+        error = EntryError("The log index was not sane")
+    for log_index in log_indexes:
+        entries.setdefault(log_index, error)
+    return entries
+
+
+def fetch_entries(log_indexes, client=None, chunk_size=MAX_RETRIEVE_BATCH):
+    """
+    yields (log index, LogEntry or EntryError) for every log index in
+    input order, fetching chunk_size entries per bulk request
+    """
+
+    for chunk in chunked(log_indexes, chunk_size):
+        entries = load_entries(chunk, client, chunk_size)
+        for log_index in chunk:
+            yield log_index, entries[log_index]
+
+
+def artifact_is_sane(artifact_filepath):
+    """returns whether the artifact filepath points to an existing file"""
+
+    # its not sane if either the artifact doesn't exist
+    # or if its not a valid file
+    return bool(
+        artifact_filepath
+        and os.path.exists(artifact_filepath)
+        and os.path.isfile(artifact_filepath)
+    )
+
+
+def new_result(log_index, artifact_filepath, error=None):
+    """returns the result dict written for each verified entry"""
+
+    return {
+        "logIndex": log_index,
+        "artifact": artifact_filepath,
+        "verified": False,
+        "error": error,
+    }
+
+
+def verify_entry(log_index, artifact_filepath, entry=None, client=None):
+    """
+    verifies the signature and inclusion of a single entry with
+    check_inclusion and returns the result dict of the batch output
+    """
+
+    # a malformed line in a batch file leaves the log index as a string
+    if not isinstance(log_index, int):
+        return new_result(
+            log_index, artifact_filepath, "The log index was not an integer"
         )
-    except ValueError:
-        sys.exit("Inclusion verification failed\n")
-    print("Offline root hash calculation for inclusion verified")
 
+    result = check_inclusion(log_index, artifact_filepath, client, entry)
+    verified = new_result(log_index, artifact_filepath, result.error)
+    verified["verified"] = result.ok
+    return verified
 
-def get_latest_checkpoint():
-    """gets the latest checkpoint"""
+
+def read_batch_file(batch_file):
+    """
+    yields (log index, artifact filepath) pairs from a batch file
+    with one whitespace separated pair per line
+    """
+
+    for line in batch_file:
+        line = line.strip()
+        # blank lines and comments are skipped
+        if not line or line.startswith("#"):
+            continue
+        fields = line.split(None, 1)
+        artifact_filepath = fields[1] if len(fields) > 1 else None
+        # a log index that isn't an int is passed on as is so that
+        # verify_entry records it as a failure instead of stopping the run
+        try:
+            log_index = int(fields[0])
+        except ValueError:
+            log_index = fields[0]
+        yield log_index, artifact_filepath
+
+
+def verify_chunk(chunk, client=None):
+    """
+    verifies a list of (log index, artifact filepath) pairs whose
+    entries are fetched with a single bulk request, returns the results
+    """
+
+    # entries that verify_entry would reject before fetching aren't requested
+    wanted = [
+        log_index
+        for log_index, artifact_filepath in chunk
+        if isinstance(log_index, int) and artifact_is_sane(artifact_filepath)
+    ]
+    entries = load_entries(wanted, client) if wanted else {}
+
+    results = []
+    for log_index, artifact_filepath in chunk:
+        entry = entries.get(log_index) if isinstance(log_index, int) else None
+        if isinstance(entry, EntryError):
+            results.append(new_result(log_index, artifact_filepath, str(entry)))
+        else:
+            results.append(verify_entry(log_index, artifact_filepath, entry, client))
+    return results
+
+
+def inclusion_batch(pairs, output=None, client=None, chunk_size=MAX_RETRIEVE_BATCH):
+    """
+    verifies inclusion for every (log index, artifact filepath) pair
+    and writes one json line per entry, returns the number of failures
+    """
+
+    if output is None:
+        output = sys.stdout
+
+    failures = 0
+    # entries are fetched chunk_size at a time through the bulk retrieve
+    # endpoint instead of with one request each
+    for chunk in chunked(pairs, chunk_size):
+        for result in verify_chunk(chunk, client):
+            if not result["verified"]:
+                failures += 1
+            output.write(json.dumps(result) + "\n")
+        output.flush()
+    return failures
+
+
+def request_checkpoint(client=None):
+    """
+    returns the latest checkpoint in json format and lets
+    the requests exceptions propagate
+    """
+
+    if client is None:
+        client = get_default_client()
 
     # from the rekor api /api/v1/log is used to get the current state
     # of the transparency log aka the latest checkpoint
+    def fetch():
+        checkpoint = client.get("/api/v1/log/")
+        # with a log key the tree size and root hash are only
+        # trusted once the log's signature over them checks out
+        if client.log_key is not None:
+            # pylint: disable=import-outside-toplevel
+            from checkpoint_note import verify_signed_tree_head
 
-    # the latest checkpoint can be gotten at this url according
-    # to the api specifications
-    request_url = "https://rekor.sigstore.dev/api/v1/log/"
+            verify_signed_tree_head(checkpoint, client.log_key)
+        return checkpoint
 
-    # gets the checkpoint from the api and converts it to
-    # a json format so that it can be displayed when
-    # python main.py -c is done\
+    if client.checkpoint_cache is None:
+        return fetch()
+    # callers within the cache's ttl share a single request
+    return client.checkpoint_cache.get(fetch)
+
+
+def get_latest_checkpoint(client=None):
+    """gets the latest checkpoint"""
+
+    # gets the checkpoint from the api in a json format so that
+    # it can be displayed when python main.py -c is done
     try:
-        request = requests.get(request_url, timeout=3)
-        request.raise_for_status()
-    except requests.exceptions.Timeout:
-        sys.exit("Error: The request timed out\n")
-    # raise for status raises this type of exception
-    # upon a bad HTTP request
-    except requests.exceptions.HTTPError:
-        sys.exit("Error: Getting the latest checkpoint failed\n")
-    data = request.json()
+        data = request_checkpoint(client)
+    except CheckpointError as e:
+        sys.exit(f"Error: The signed tree head is invalid: {e}\n")
+    except requests.exceptions.RequestException as e:
+        sys.exit(f"Error: {CHECKPOINT_REQUEST_ERRORS[request_category(e)]}\n")
 
     # returns the checkpoint
     return data
 
 
-def consistency(
-    prev_checkpoint,
-):
+def request_consistency_proof(first_size, last_size, tree_id, client=None):
     """
-    verifies whether a previous checkpoint is
-    consitent with the current one
+    returns the hashes of the consistency proof between two
+    tree sizes and lets the requests exceptions propagate
+    """
+
+    if client is None:
+        client = get_default_client()
+
+    # builds the query for the proof
+    params = {"firstSize": first_size, "lastSize": last_size, "treeID": tree_id}
+    return client.get("/api/v1/log/proof", params=params)["hashes"]
+
+
+# the message each kind of failed checkpoint or proof request is reported with
+CHECKPOINT_REQUEST_ERRORS = {
+    TIMEOUT: "The request timed out",
+    OFFLINE: "The latest checkpoint can't be fetched in offline mode",
+    CONNECTION: "Could not connect to the rekor server",
+    UNAVAILABLE: "The rekor server is unavailable",
+    HTTP: "Getting the latest checkpoint failed",
+}
+PROOF_REQUEST_ERRORS = {
+    TIMEOUT: "The request timed out",
+    OFFLINE: "The consistency proof can't be fetched in offline mode",
+    CONNECTION: "Could not connect to the rekor server",
+    UNAVAILABLE: "The rekor server is unavailable",
+    HTTP: "The request to get the proof failed",
+}
+
+
+def check_consistency(prev_checkpoint, client=None):
     """
+    verifies whether a previous checkpoint is consistent with the
+    current one and returns a ConsistencyResult instead of printing
+    or exiting, call raise_for_status on it to get a VerificationError
+    """
+
+    # every check that fails returns its own result
+    # pylint: disable=too-many-return-statements
+    # pylint: disable=import-outside-toplevel
+    from merkle_proof import verify_consistency, RootMismatchError
+
+    result = ConsistencyResult(prev_checkpoint)
 
     # verify that prev checkpoint is not empty
     if len(prev_checkpoint) == 0:
-        print("previous checkpoint is empty")
-        return
+        return result.fail(INPUT, "previous checkpoint is empty")
 
-    # get_latest_checkpoint() so as to later
+    # gets the current checkpoint so as to later
     # extract its tree size
-    curr_checkpoint = get_latest_checkpoint()
-
-    # builds the url request for the proof
-    request_url = (
-        f"https://rekor.sigstore.dev/api/v1/log/proof?"
-        f"firstSize={prev_checkpoint['treeSize']}&"
-        f"lastSize={curr_checkpoint['treeSize']}&"
-        f"treeID={prev_checkpoint['treeID']}"
-    )
+    if client is None:
+        client = get_default_client()
+    try:
+        with result.timed("checkpoint"):
+            curr_checkpoint = request_checkpoint(client)
+    except CheckpointError as e:
+        return result.fail(CHECKPOINT, f"The signed tree head is invalid: {e}")
+    except requests.exceptions.RequestException as e:
+        category = request_category(e)
+        return result.fail(category, CHECKPOINT_REQUEST_ERRORS[category])
+    result.checkpoint = curr_checkpoint
 
     # gets the proof
     try:
-        request = requests.get(request_url, timeout=3)
-        request.raise_for_status()
-    except requests.exceptions.Timeout:
-        sys.exit("Error: The request timed out\n")
-    # raise for status raises this type of exception
-    # upon a bad HTTP request
-    except requests.exceptions.HTTPError:
-        sys.exit("Error: The request to get the proof failed")
-    proof = (request.json())["hashes"]
+        with result.timed("proof"):
+            proof = request_consistency_proof(
+                prev_checkpoint["treeSize"],
+                curr_checkpoint["treeSize"],
+                prev_checkpoint["treeID"],
+                client,
+            )
+    except requests.exceptions.RequestException as e:
+        category = request_category(e)
+        return result.fail(category, PROOF_REQUEST_ERRORS[category])
 
     # extracts the other root hash from the current checkpoint
     root2 = curr_checkpoint["rootHash"]
+    result.expected_root = root2
 
-    # uses the default hasher
+    # uses the fast sha256 hasher
     # verifies consistency with the function provided
     # in the template
     last_size = curr_checkpoint["treeSize"]
+    hasher = merkle_hasher()
     try:
-        verify_consistency(
-            DefaultHasher,
-            prev_checkpoint["treeSize"],
-            last_size,
-            proof,
-            prev_checkpoint["rootHash"],
-            root2,
-        )
+        with result.timed("consistency"), METRICS.stage("merkle"):
+            verify_consistency(
+                hasher,
+                prev_checkpoint["treeSize"],
+                last_size,
+                proof,
+                prev_checkpoint["rootHash"],
+                root2,
+            )
+    except RootMismatchError as e:
+        result.computed_root = e.calculated_root.decode()
+        result.expected_root = e.expected_root.decode()
+        return result.fail(CONSISTENCY, "Consitency verification failed")
     except ValueError:
-        sys.exit("Consitency verification failed")
+        return result.fail(CONSISTENCY, "Consitency verification failed")
+    finally:
+        count_hashes(hasher)
+    result.computed_root = root2
     # if no mismatch errors were raised then the
     # previous checkpoint is consistent
     # with the current one
+    # the current checkpoint is remembered as the starting
+    # point for the next consistency run on this tree
+    if client.checkpoint_cache is not None:
+        client.checkpoint_cache.remember_verified(curr_checkpoint)
+    return result
+
+
+def consistency(prev_checkpoint, client=None):
+    """
+    verifies whether a previous checkpoint is
+    consitent with the current one
+    """
+
+    # the check itself is done by check_consistency
+    # and only rendered here
+    result = check_consistency(prev_checkpoint, client)
+    if result.category == INPUT:
+        print(result.error)
+        return
+    if result.category == CONSISTENCY:
+        sys.exit(result.error)
+    if not result.ok:
+        sys.exit(f"Error: {result.error}\n")
     print("Consistency verification successful")
 
 
+# how many consistency proofs of a chain are fetched at once by default
+DEFAULT_CHAIN_WORKERS = 8
+# how many verified hops are remembered
+VERIFIED_HOPS_SIZE = 65536
+
+# hops that were verified as consistent keyed by
+# (tree id, size1, size2, root1, root2) and shared by every chain,
+# so that overlapping replays skip them
+_verified_hops: OrderedDict[tuple, bool] = OrderedDict()
+_verified_hops_lock = threading.Lock()
+
+
+def hop_key(first, second):
+    """returns the memo key of the hop between two checkpoints"""
+
+    # a hop between two trees is never verified so only the first tree id is kept
+    return (
+        str(first["treeID"]),
+        first["treeSize"],
+        second["treeSize"],
+        first["rootHash"],
+        second["rootHash"],
+    )
+
+
+def verify_hop(first, second, proof):
+    """
+    verifies that second is consistent with first,
+    raises ValueError or RootMismatchError if it isn't
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from merkle_proof import FastDefaultHasher, verify_consistency
+
+    if str(first["treeID"]) != str(second["treeID"]):
+        raise ValueError(f"tree id {second['treeID']} != {first['treeID']}")
+    verify_consistency(
+        FastDefaultHasher,
+        first["treeSize"],
+        second["treeSize"],
+        proof,
+        first["rootHash"],
+        second["rootHash"],
+    )
+
+
+def fetch_hop_proofs(hops, verified_before, client, max_workers):
+    """
+    requests the proofs of the hops concurrently, returns them keyed
+    by hop_key with the request exception in place of a proof that
+    couldn't be fetched
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ThreadPoolExecutor
+
+    # hops that were already verified or that start empty or keep the
+    # same size need no proof, every other proof is requested at once
+    requests_needed = {}
+    for first, second in hops:
+        key = hop_key(first, second)
+        if key in verified_before or key in requests_needed:
+            continue
+        if 0 < first["treeSize"] < second["treeSize"]:
+            requests_needed[key] = (
+                first["treeSize"],
+                second["treeSize"],
+                first["treeID"],
+            )
+    proofs = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            key: executor.submit(request_consistency_proof, *args, client)
+            for key, args in requests_needed.items()
+        }
+        for key, future in futures.items():
+            try:
+                proofs[key] = future.result()
+            except requests.exceptions.RequestException as e:
+                proofs[key] = e
+    return proofs
+
+
+def consistency_chain(checkpoints, client=None, max_workers=DEFAULT_CHAIN_WORKERS):
+    """
+    verifies every adjacent pair of an ordered list of checkpoints,
+    the proofs of every hop are fetched concurrently first, returns a
+    dict with the number of hops, how many were verified before the
+    first hop that diverged or whose proof couldn't be fetched, and
+    that divergence or fetch error or None, a proof that couldn't be
+    fetched says nothing about the log so it is not a divergence
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from merkle_proof import RootMismatchError
+
+    if client is None:
+        client = get_default_client()
+
+    checkpoints = list(checkpoints)
+    hops = list(zip(checkpoints, checkpoints[1:]))
+
+    # the memo is shared by every thread so its hits are taken once up front
+    with _verified_hops_lock:
+        verified_before = {
+            hop_key(first, second)
+            for first, second in hops
+            if hop_key(first, second) in _verified_hops
+        }
+    proofs = fetch_hop_proofs(hops, verified_before, client, max_workers)
+
+    report = {
+        "hops": len(hops),
+        "verified": 0,
+        "memoized": 0,
+        "divergence": None,
+        "fetchError": None,
+    }
+    for hop, (first, second) in enumerate(hops):
+        key = hop_key(first, second)
+        if key in verified_before:
+            with _verified_hops_lock:
+                if key in _verified_hops:
+                    _verified_hops.move_to_end(key)
+            report["memoized"] += 1
+            report["verified"] += 1
+            continue
+        proof = proofs.get(key, [])
+        if isinstance(proof, requests.exceptions.RequestException):
+            category = request_category(proof)
+            report["fetchError"] = {
+                "hop": hop,
+                "from": first,
+                "to": second,
+                "category": category,
+                "error": PROOF_REQUEST_ERRORS[category],
+            }
+            break
+        try:
+            verify_hop(first, second, proof)
+        except (ValueError, RootMismatchError) as e:
+            report["divergence"] = {
+                "hop": hop,
+                "from": first,
+                "to": second,
+                "error": str(e),
+            }
+            break
+        with _verified_hops_lock:
+            _verified_hops[key] = True
+            if len(_verified_hops) > VERIFIED_HOPS_SIZE:
+                _verified_hops.popitem(last=False)
+        report["verified"] += 1
+    return report
+
+
 def main():
     """Allows the user to enter commands and perform various
     operations with the rekor api and the funtions built into
     merkle_proof.py and util.py"""
-    parser = argparse.ArgumentParser(description="Rekor Verifier")
-    parser.add_argument(
-        "-d", "--debug", help="Debug mode", required=False, action="store_true"
-    )  # Default false
-    parser.add_argument(
-        "-c",
-        "--checkpoint",
-        help="Obtain latest checkpoint\
-                        from Rekor Server public instance",
-        required=False,
-        action="store_true",
-    )
-    parser.add_argument(
-        "--inclusion",
-        help="Verify inclusion of an\
-                        entry in the Rekor Transparency Log using log index\
-                        and artifact filename.\
-                        Usage: --inclusion 126574567",
-        required=False,
-        type=int,
-    )
-    parser.add_argument(
-        "--artifact",
-        help="Artifact filepath for verifying\
-                        signature",
-        required=False,
-    )
-    parser.add_argument(
-        "--consistency",
-        help="Verify consistency of a given\
-                        checkpoint with the latest checkpoint.",
-        action="store_true",
-    )
-    parser.add_argument(
-        "--tree-id", help="Tree ID for consistency proof", required=False
-    )
-    parser.add_argument(
-        "--tree-size", help="Tree size for consistency proof", required=False, type=int
-    )
-    parser.add_argument(
-        "--root-hash", help="Root hash for consistency proof", required=False
-    )
-    args = parser.parse_args()
-    if args.debug:
-        print("enabled debug mode")
-    if args.checkpoint:
-        # get and print latest checkpoint from server
-        # if debug is enabled, store it in a file checkpoint.json
-        checkpoint = get_latest_checkpoint()
-        print(json.dumps(checkpoint, indent=4))
-    if args.inclusion:
-        inclusion(args.inclusion, args.artifact)
-    if args.consistency:
-        if not args.tree_id:
-            print("please specify tree id for prev checkpoint")
-            return
-        if not args.tree_size:
-            print("please specify tree size for prev checkpoint")
-            return
-        if not args.root_hash:
-            print("please specify root hash for prev checkpoint")
-            return
-
-        prev_checkpoint = {}
-        prev_checkpoint["treeID"] = args.tree_id
-        prev_checkpoint["treeSize"] = args.tree_size
-        prev_checkpoint["rootHash"] = args.root_hash
-
-        consistency(prev_checkpoint)
+    # the command line lives in cli, imported here as it imports this module
+    from cli import main as run_cli  # pylint: disable=import-outside-toplevel
+
+    run_cli()
 
 
 if __name__ == "__main__":
@@ -37,6 +37,102 @@ class Hasher:
 DefaultHasher = Hasher(hashlib.sha256)
 
 
+# the prefixes as bytes objects so they are never rebuilt per hash
+RFC6962_LEAF_PREFIX_BYTES = bytes([RFC6962_LEAF_HASH_PREFIX])
+RFC6962_NODE_PREFIX_BYTES = bytes([RFC6962_NODE_HASH_PREFIX])
+
+
+# a drop in replacement for Hasher on hot paths, it keeps one hash state
+# per prefix that already has the prefix written into it and copies it for
+# every hash, so no prefix or concatenated bytes are allocated per node
+class FastHasher:
+    __slots__ = ("hash_func", "_leaf_state", "_node_state", "_digest_size")
+
+    def __init__(self, hash_func=hashlib.sha256):
+        self.hash_func = hash_func
+        self._leaf_state = hash_func()
+        self._leaf_state.update(RFC6962_LEAF_PREFIX_BYTES)
+        self._node_state = hash_func()
+        self._node_state.update(RFC6962_NODE_PREFIX_BYTES)
+        self._digest_size = self._leaf_state.digest_size
+
+    def new(self):
+        return self.hash_func()
+
+    def empty_root(self):
+        return self.hash_func().digest()
+
+    def hash_leaf(self, leaf):
+        h = self._leaf_state.copy()
+        h.update(leaf)
+        return h.digest()
+
+    def hash_children(self, l, r):
+        h = self._node_state.copy()
+        h.update(l)
+        h.update(r)
+        return h.digest()
+
+    def size(self):
+        return self._digest_size
+
+    # hashes a list of leaves and returns their hashes in order
+    def hash_leaves(self, leaves):
+        copy = self._leaf_state.copy
+        hashes = []
+        append = hashes.append
+        for leaf in leaves:
+            h = copy()
+            h.update(leaf)
+            append(h.digest())
+        return hashes
+
+    # hashes a list of (left, right) pairs and returns their parents in order
+    def hash_pairs(self, pairs):
+        copy = self._node_state.copy
+        hashes = []
+        append = hashes.append
+        for l, r in pairs:
+            h = copy()
+            h.update(l)
+            h.update(r)
+            append(h.digest())
+        return hashes
+
+
+# FastDefaultHasher is the SHA256 based FastHasher
+FastDefaultHasher = FastHasher(hashlib.sha256)
+
+
+# wraps a hasher and counts the hashes computed with it, the checks use
+# it in place of the plain hasher only while the metrics are recorded
+class CountingHasher:
+    def __init__(self, hasher):
+        self.hasher = hasher
+        self.hashes = 0
+
+    def __getattr__(self, name):
+        return getattr(self.hasher, name)
+
+    def hash_leaf(self, leaf):
+        self.hashes += 1
+        return self.hasher.hash_leaf(leaf)
+
+    def hash_children(self, l, r):
+        self.hashes += 1
+        return self.hasher.hash_children(l, r)
+
+    def hash_leaves(self, leaves):
+        hashes = self.hasher.hash_leaves(leaves)
+        self.hashes += len(hashes)
+        return hashes
+
+    def hash_pairs(self, pairs):
+        hashes = self.hasher.hash_pairs(pairs)
+        self.hashes += len(hashes)
+        return hashes
+
+
 def verify_consistency(hasher, size1, size2, proof, root1, root2):
     # change format of args to be bytearray instead of hex strings
     root1 = bytes.fromhex(root1)
@@ -172,13 +268,135 @@ def verify_inclusion(hasher, index, size, leaf_hash, proof, root, debug=False):
 def compute_leaf_hash(body):
     entry_bytes = base64.b64decode(body)
 
-    # create a new sha256 hash object
-    h = hashlib.sha256()
-    # write the leaf hash prefix
-    h.update(bytes([RFC6962_LEAF_HASH_PREFIX]))
-
-    # write the actual leaf data
-    h.update(entry_bytes)
-
+    # the sha256 state with the leaf hash prefix already written
+    # is copied and the actual leaf data is written to it
     # return the computed hash
-    return h.hexdigest()
+    return FastDefaultHasher.hash_leaf(entry_bytes).hex()
+
+
+# verifies many inclusion proofs against the same root in one pass
+# items is a list of (index, size, leaf_hash, proof) where the hashes can be
+# hex strings or bytes, returns a list of bools in input order
+# once a proof is verified every node on its path and every sibling in it
+# is known to be in the tree, a later proof whose path reaches a known node
+# with the same hash only compares the rest of its hashes with the known
+# siblings instead of decoding and hashing them, nodes are only remembered
+# from the lowest level at which the path meets another item's path
+def verify_inclusion_batch(hasher, items, root):
+    items = list(items)
+    root = _as_bytes(root)
+    shared = _shared_levels(items)
+    memo = {}
+    results = []
+    for index, size, leaf_hash, proof in items:
+        try:
+            ok = _verify_batch_item(
+                hasher,
+                index,
+                size,
+                _as_bytes(leaf_hash),
+                proof,
+                root,
+                shared.get((size, index)),
+                memo,
+            )
+        except (TypeError, ValueError):
+            ok = False
+        results.append(ok)
+    return results
+
+
+def _as_bytes(h):
+    return bytes.fromhex(h) if isinstance(h, str) else bytes(h)
+
+
+def _shared_levels(items):
+    # the paths of two leaves of the same tree meet one level below the
+    # highest bit their indexes differ in, so only the nearest index on
+    # either side matters, an item alone in its tree shares nothing
+    indexes = {}
+    for item in items:
+        if len(item) == 4 and isinstance(item[0], int) and isinstance(item[1], int):
+            indexes.setdefault(item[1], []).append(item[0])
+    shared = {}
+    for size, group in indexes.items():
+        group.sort()
+        for before, index, after in zip(group, group[1:], group[2:]):
+            level = min((before ^ index).bit_length(), (index ^ after).bit_length())
+            shared[(size, index)] = max(level - 1, 0)
+        if len(group) > 1:
+            # the first and the last index only have one neighbour
+            first, last = group[0], group[-1]
+            shared[(size, first)] = max((first ^ group[1]).bit_length() - 1, 0)
+            shared[(size, last)] = max((last ^ group[-2]).bit_length() - 1, 0)
+    return shared
+
+
+def _verify_batch_item(hasher, index, size, leaf_hash, proof, root, shared, memo):
+    if index >= size:
+        raise ValueError(f"index is beyond size: {index} >= {size}")
+    if len(leaf_hash) != hasher.size():
+        raise ValueError(
+            f"leaf_hash has unexpected size {len(leaf_hash)}, want {hasher.size()}"
+        )
+    inner, border = decomp_incl_proof(index, size)
+    if len(proof) != inner + border:
+        raise ValueError(f"wrong proof size {len(proof)}, want {inner + border}")
+
+    if shared is None:
+        shared = inner
+    # for every level of the tree the known nodes by position, each as its
+    # hash and as the proofs wrote it, and the borders by the node they
+    # start at
+    if size not in memo:
+        memo[size] = ([{} for _ in range((size - 1).bit_length())], {})
+    levels, borders = memo[size]
+    hash_children = hasher.hash_children
+    new_nodes = []
+    seed = leaf_hash
+    level = 0
+    position = index
+    while level < inner:
+        if level >= shared:
+            node = levels[level].get(position)
+            if node is not None and node[0] == seed:
+                break
+        raw = proof[level]
+        h = _as_bytes(raw)
+        if level >= shared:
+            # the node is kept the way the proofs write their hashes so
+            # that a later proof holding it as a sibling compares as is
+            given = seed.hex() if isinstance(raw, str) else seed
+            new_nodes.append((level, position, (seed, given)))
+            new_nodes.append((level, position ^ 1, (h, raw)))
+        if position & 1 == 0:
+            seed = hash_children(seed, h)
+        else:
+            seed = hash_children(h, seed)
+        level += 1
+        position >>= 1
+
+    if level < inner:
+        # the path reached a known node, the rest of the proof has to be
+        # the siblings the earlier proofs already verified
+        while level < inner:
+            raw = proof[level]
+            node = levels[level][position ^ 1]
+            if node[1] != raw and node[0] != _as_bytes(raw):
+                return False
+            level += 1
+            position >>= 1
+        for i, h in enumerate(borders[position], inner):
+            if proof[i] != h and _as_bytes(proof[i]) != _as_bytes(h):
+                return False
+    else:
+        for raw in proof[inner:]:
+            seed = hash_children(_as_bytes(raw), seed)
+        if seed != root:
+            return False
+        if shared < inner:
+            borders[position] = proof[inner:]
+
+    for level, position, node in new_nodes:
+        levels[level][position] = node
+    return True
@@ -0,0 +1,270 @@
+"""A local RFC 6962 merkle tree that computes roots and proofs"""
+
+import json
+import os
+
+from merkle_proof import FastDefaultHasher, decomp_incl_proof
+from util import write_json
+
+
+# returns the largest power of two smaller than n
+def split_point(n):
+    return 1 << ((n - 1).bit_length() - 1)
+
+
+class MerkleTree:
+    """
+    an append only rfc 6962 merkle tree, the right edge frontier of
+    perfect subtrees is always kept so appending a leaf and computing
+    the current root are cheap, with store_leaves the leaf hashes and
+    every perfect subtree computed so far are kept as well so that roots
+    of older sizes and inclusion and consistency proofs can be computed,
+    with a path the tree is kept on disk and reloaded from it
+    """
+
+    def __init__(self, hasher=FastDefaultHasher, path=None, store_leaves=True):
+        self.hasher = hasher
+        self.path = path
+        self.store_leaves = store_leaves
+        self.size = 0
+        # (level, hash) of the perfect subtrees on the right edge
+        # from the largest on the left to the smallest on the right
+        self.frontier = []
+        self.leaves = []
+        # hashes of perfect subtrees keyed by (level, index)
+        self._nodes = {}
+        if path is not None:
+            self._load()
+
+    # loading and saving
+
+    def _frontier_path(self):
+        return self.path + ".frontier"
+
+    def _load(self):
+        if os.path.exists(self._frontier_path()):
+            with open(self._frontier_path(), "r", encoding="utf-8") as state_file:
+                state = json.load(state_file)
+            self.size = state["size"]
+            self.frontier = [
+                (level, bytes.fromhex(h)) for level, h in state["frontier"]
+            ]
+        if self.store_leaves and os.path.exists(self.path):
+            digest_size = self.hasher.size()
+            with open(self.path, "rb") as leaf_file:
+                data = leaf_file.read(self.size * digest_size)
+            if len(data) != self.size * digest_size:
+                raise ValueError(
+                    f"leaf file {self.path} holds fewer than {self.size} leaves"
+                )
+            self.leaves = [
+                data[i : i + digest_size] for i in range(0, len(data), digest_size)
+            ]
+
+    def flush(self):
+        """writes the frontier and any new leaf hashes to disk"""
+
+        if self.path is None:
+            return
+        if self.store_leaves:
+            # the leaf file is append only, so only the
+            # leaves past what is already on disk are written
+            digest_size = self.hasher.size()
+            on_disk = 0
+            if os.path.exists(self.path):
+                on_disk = os.path.getsize(self.path) // digest_size
+            # leaves past the tree size are left over from a truncated tree
+            on_disk = min(on_disk, len(self.leaves))
+            with open(self.path, "ab") as leaf_file:
+                leaf_file.truncate(on_disk * digest_size)
+                leaf_file.write(b"".join(self.leaves[on_disk:]))
+        state = {
+            "size": self.size,
+            "frontier": [[level, h.hex()] for level, h in self.frontier],
+        }
+        write_json(self._frontier_path(), state)
+
+    # appending
+
+    def append(self, data):
+        """appends a leaf by its data and returns its leaf hash"""
+
+        leaf_hash = self.hasher.hash_leaf(data)
+        self.append_hash(leaf_hash)
+        return leaf_hash
+
+    def append_hash(self, leaf_hash):
+        """appends a leaf by its leaf hash, bytes or a hex string"""
+
+        if isinstance(leaf_hash, str):
+            leaf_hash = bytes.fromhex(leaf_hash)
+        if len(leaf_hash) != self.hasher.size():
+            raise ValueError(
+                f"leaf_hash has unexpected size {len(leaf_hash)}, "
+                f"want {self.hasher.size()}"
+            )
+        if self.store_leaves:
+            self.leaves.append(leaf_hash)
+
+        # merges perfect subtrees of the same size on the right edge,
+        # the same way a binary counter carries
+        level, node = 0, leaf_hash
+        while self.frontier and self.frontier[-1][0] == level:
+            _, left = self.frontier.pop()
+            node = self.hasher.hash_children(left, node)
+            level += 1
+            if self.store_leaves:
+                self._nodes[(level, self.size >> level)] = node
+        self.frontier.append((level, node))
+        self.size += 1
+
+    def extend(self, leaf_hashes):
+        """appends many leaves by their leaf hashes"""
+
+        for leaf_hash in leaf_hashes:
+            self.append_hash(leaf_hash)
+
+    def start_from_inclusion_proof(self, index, size, leaf_hash, proof):
+        """
+        replaces the tree with one of index + 1 leaves whose right edge
+        comes from the inclusion proof of leaf index in a tree of any
+        size, the left siblings on the path of a leaf are the perfect
+        subtrees before it, the leaves before it stay unknown so this
+        needs a tree that doesn't store its leaves, the root of the
+        result has to be checked against a trusted one
+        """
+
+        if self.store_leaves:
+            raise ValueError("a tree that stores its leaves has to start empty")
+        if index < 0 or index >= size:
+            raise ValueError(f"index is beyond size: {index} >= {size}")
+        inner, border = decomp_incl_proof(index, size)
+        if len(proof) != inner + border:
+            raise ValueError(f"wrong proof size {len(proof)}, want {inner + border}")
+        proof = [bytes.fromhex(h) if isinstance(h, str) else h for h in proof]
+
+        # below level inner the left siblings are where the index has a 1
+        # bit, the border hashes are the left siblings of its higher 1 bits
+        left = [(level, proof[level]) for level in range(inner) if (index >> level) & 1]
+        border_levels = [
+            level for level in range(inner, index.bit_length()) if (index >> level) & 1
+        ]
+        left.extend(zip(border_levels, proof[inner:]))
+
+        self.frontier = sorted(left, key=lambda node: node[0], reverse=True)
+        self.size = index
+        self.append_hash(leaf_hash)
+
+    def truncate(self, size):
+        """drops the leaves after size, needs a tree that stores its leaves"""
+
+        self._check_size(size)
+        self.leaves = self.leaves[:size]
+        self._nodes = {
+            (level, index): node
+            for (level, index), node in self._nodes.items()
+            if (index + 1) << level <= size
+        }
+        self.frontier = []
+        start = 0
+        for level in reversed(range(size.bit_length())):
+            if (size >> level) & 1:
+                end = start + (1 << level)
+                self.frontier.append((level, self._subtree_root(start, end)))
+                start = end
+        self.size = size
+
+    # roots
+
+    def root(self, size=None):
+        """returns the root hash for the given size, the current one by default"""
+
+        if size is None or size == self.size:
+            if not self.frontier:
+                return self.hasher.empty_root()
+            node = self.frontier[-1][1]
+            for _, left in reversed(self.frontier[:-1]):
+                node = self.hasher.hash_children(left, node)
+            return node
+        self._check_size(size)
+        if size == 0:
+            return self.hasher.empty_root()
+        return self._subtree_root(0, size)
+
+    def _check_size(self, size):
+        if size < 0 or size > self.size:
+            raise ValueError(f"size {size} is beyond the tree size {self.size}")
+        if not self.store_leaves:
+            raise ValueError("this needs a tree that stores its leaves")
+
+    def _subtree_root(self, start, end):
+        # returns the root of the leaves in [start, end)
+        n = end - start
+        if n == 1:
+            return self.leaves[start]
+        perfect = n & (n - 1) == 0 and start % n == 0
+        if perfect:
+            key = (n.bit_length() - 1, start // n)
+            node = self._nodes.get(key)
+            if node is not None:
+                return node
+        k = split_point(n)
+        node = self.hasher.hash_children(
+            self._subtree_root(start, start + k), self._subtree_root(start + k, end)
+        )
+        if perfect:
+            self._nodes[key] = node
+        return node
+
+    # proofs, returned as lists of hex strings the way
+    # verify_inclusion and verify_consistency expect them
+
+    def inclusion_proof(self, index, size=None):
+        """returns the inclusion proof of a leaf in the tree of the given size"""
+
+        if size is None:
+            size = self.size
+        self._check_size(size)
+        if index < 0 or index >= size:
+            raise ValueError(f"index is beyond size: {index} >= {size}")
+        return [h.hex() for h in self._path(index, 0, size)]
+
+    def _path(self, index, start, end):
+        # rfc 6962 PATH(m, D[start:end]) from the leaf up
+        n = end - start
+        if n == 1:
+            return []
+        k = split_point(n)
+        if index < k:
+            proof = self._path(index, start, start + k)
+            proof.append(self._subtree_root(start + k, end))
+        else:
+            proof = self._path(index - k, start + k, end)
+            proof.append(self._subtree_root(start, start + k))
+        return proof
+
+    def consistency_proof(self, size1, size2=None):
+        """returns the consistency proof between two sizes of the tree"""
+
+        if size2 is None:
+            size2 = self.size
+        self._check_size(size2)
+        if size1 < 0 or size1 > size2:
+            raise ValueError(f"size2 ({size2}) < size1 ({size1})")
+        if size1 == 0 or size1 == size2:
+            return []
+        return [h.hex() for h in self._subproof(size1, 0, size2, True)]
+
+    def _subproof(self, m, start, end, complete):
+        # rfc 6962 SUBPROOF(m, D[start:end], b)
+        n = end - start
+        if m == n:
+            return [] if complete else [self._subtree_root(start, end)]
+        k = split_point(n)
+        if m <= k:
+            proof = self._subproof(m, start, start + k, complete)
+            proof.append(self._subtree_root(start + k, end))
+        else:
+            proof = self._subproof(m - k, start + k, end, False)
+            proof.append(self._subtree_root(start, start + k))
+        return proof
@@ -0,0 +1,192 @@
+"""Opt-in per-stage timings and counters for the verification pipeline"""
+
+import json
+import os
+import threading
+import time
+
+# setting this to json or prometheus enables the metrics for every run
+# and picks the format they are written in, any other value means json
+ENV_VAR = "REKOR_METRICS"
+JSON = "json"
+PROMETHEUS = "prometheus"
+FORMATS = (JSON, PROMETHEUS)
+
+# every prometheus metric name starts with this
+PROMETHEUS_PREFIX = "rekor_verifier"
+
+
+class _NullStage:
+    """what stage() returns while the metrics are off, it records nothing"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    """times one run of a stage and adds it to the metrics on exit"""
+
+    __slots__ = ("metrics", "name", "started")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.name, time.perf_counter() - self.started)
+        return False
+
+
+class Metrics:
+    """
+    keeps the count, total and longest seconds of every stage and a
+    set of counters, while disabled stage() and count() return at once
+    so the instrumented code pays next to nothing for them
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # stage name -> [count, total seconds, max seconds]
+        self.stages = {}
+        self.counters = {}
+        # cache name -> callable returning (hits, misses), read on export
+        # so the caches keep counting their hits the way they already do
+        self.caches = {}
+
+    def enable(self, enabled=True):
+        """turns the recording on or off"""
+        self.enabled = enabled
+
+    def reset(self):
+        """forgets every stage and counter, the registered caches are kept"""
+
+        with self._lock:
+            self.stages.clear()
+            self.counters.clear()
+
+    def stage(self, name):
+        """returns a context manager that times the wrapped stage"""
+
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def observe(self, name, seconds):
+        """adds one run of a stage that took seconds"""
+
+        with self._lock:
+            stage = self.stages.get(name)
+            if stage is None:
+                self.stages[name] = [1, seconds, seconds]
+            else:
+                stage[0] += 1
+                stage[1] += seconds
+                stage[2] = max(stage[2], seconds)
+
+    def count(self, name, value=1):
+        """adds value to a counter"""
+
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def register_cache(self, name, stats):
+        """registers a cache whose hit rate is exported, stats() is (hits, misses)"""
+        self.caches[name] = stats
+
+    def snapshot(self):
+        """returns every stage, counter and cache hit rate as a dict"""
+
+        with self._lock:
+            stages = {
+                name: {"count": count, "seconds": total, "maxSeconds": longest}
+                for name, (count, total, longest) in sorted(self.stages.items())
+            }
+            counters = dict(sorted(self.counters.items()))
+        caches = {}
+        for name, stats in sorted(self.caches.items()):
+            hits, misses = stats()
+            lookups = hits + misses
+            caches[name] = {
+                "hits": hits,
+                "misses": misses,
+                "hitRate": hits / lookups if lookups else None,
+            }
+        return {"stages": stages, "counters": counters, "caches": caches}
+
+    def to_json(self):
+        """returns the snapshot as a json document"""
+        return json.dumps(self.snapshot(), indent=4)
+
+    def to_prometheus(self):
+        """returns the snapshot in the prometheus text exposition format"""
+
+        snapshot = self.snapshot()
+        prefix = PROMETHEUS_PREFIX
+        lines = [
+            f"# HELP {prefix}_stage_seconds Seconds spent in each stage",
+            f"# TYPE {prefix}_stage_seconds summary",
+        ]
+        for name, stage in snapshot["stages"].items():
+            lines.append(
+                f'{prefix}_stage_seconds_count{{stage="{name}"}} {stage["count"]}'
+            )
+            lines.append(
+                f'{prefix}_stage_seconds_sum{{stage="{name}"}} {stage["seconds"]}'
+            )
+        lines += [
+            f"# HELP {prefix}_stage_max_seconds Longest run of each stage",
+            f"# TYPE {prefix}_stage_max_seconds gauge",
+        ]
+        for name, stage in snapshot["stages"].items():
+            lines.append(
+                f'{prefix}_stage_max_seconds{{stage="{name}"}} {stage["maxSeconds"]}'
+            )
+        for name, value in snapshot["counters"].items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        lines += [
+            f"# HELP {prefix}_cache_lookups_total Cache lookups by result",
+            f"# TYPE {prefix}_cache_lookups_total counter",
+        ]
+        for name, cache in snapshot["caches"].items():
+            for result, key in (("hit", "hits"), ("miss", "misses")):
+                lines.append(
+                    f'{prefix}_cache_lookups_total{{cache="{name}",result="{result}"}} '
+                    f"{cache[key]}"
+                )
+        return "\n".join(lines) + "\n"
+
+    def export(self, output_format=JSON):
+        """returns the snapshot in the given format, json or prometheus"""
+
+        if output_format == PROMETHEUS:
+            return self.to_prometheus()
+        return self.to_json()
+
+
+def format_from_env():
+    """returns the format the environment asks for or None if it doesn't"""
+
+    value = os.environ.get(ENV_VAR, "").strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return None
+    return value if value in FORMATS else JSON
+
+
+# the metrics every module records into, enabled by --debug or the
+# environment variable
+METRICS = Metrics(enabled=format_from_env() is not None)
@@ -0,0 +1,80 @@
+"""Runs a command under cProfile or a sampling profiler"""
+
+import importlib.util
+import sys
+
+# the profilers --profiler can ask for, auto uses the sampling one
+# when pyinstrument is installed and cProfile otherwise
+AUTO = "auto"
+CPROFILE = "cprofile"
+SAMPLING = "sampling"
+PROFILERS = (AUTO, CPROFILE, SAMPLING)
+
+DEFAULT_TOP = 25
+# how the cProfile summary is sorted
+SORT_KEY = "cumulative"
+# lines before the first function in the flat pyinstrument report
+FLAT_HEADER_LINES = 7
+
+
+def sampling_available():
+    """returns whether pyinstrument is installed"""
+    return importlib.util.find_spec("pyinstrument") is not None
+
+
+def pick_profiler(profiler=AUTO):
+    """returns the profiler auto stands for or the one asked for"""
+
+    if profiler == AUTO:
+        return SAMPLING if sampling_available() else CPROFILE
+    if profiler == SAMPLING and not sampling_available():
+        raise ValueError("the sampling profiler needs pyinstrument to be installed")
+    return profiler
+
+
+def _profile_cprofile(func, args, stats_path, top, output):
+    # pylint: disable=import-outside-toplevel
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args)
+    finally:
+        profiler.dump_stats(stats_path)
+        stats = pstats.Stats(profiler, stream=output)
+        stats.strip_dirs().sort_stats(SORT_KEY).print_stats(top)
+
+
+def _profile_sampling(func, args, stats_path, top, output):
+    # pylint: disable=import-outside-toplevel
+    from pyinstrument import Profiler  # type: ignore[import-not-found]
+
+    profiler = Profiler()
+    profiler.start()
+    try:
+        return func(*args)
+    finally:
+        session = profiler.stop()
+        session.save(stats_path)
+        # the flat report lists the functions by the time spent in them,
+        # its first lines are a header followed by the hottest functions
+        report = profiler.output_text(flat=True).splitlines()
+        output.write("\n".join(report[: top + FLAT_HEADER_LINES]) + "\n")
+
+
+def profile_call(
+    func, args=(), stats_path="profile.out", top=DEFAULT_TOP, profiler=AUTO, output=None
+):
+    """
+    calls func(*args) under the profiler and returns what it returns,
+    the stats are written to stats_path and a summary of the top
+    functions to output (stderr by default) even when func raises or exits
+    """
+
+    output = output if output is not None else sys.stderr
+    profiler = pick_profiler(profiler)
+    output.write(f"profiling with {profiler}, stats are written to {stats_path}\n")
+    if profiler == SAMPLING:
+        return _profile_sampling(func, args, stats_path, top, output)
+    return _profile_cprofile(func, args, stats_path, top, output)
@@ -0,0 +1,144 @@
+"""Asyncio counterparts of the rekor fetches and a concurrent batch verifier"""
+
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from rekor_client import MAX_RETRIEVE_BATCH, chunked, get_default_client
+from main import (
+    LogEntry,
+    EntryError,
+    artifact_is_sane,
+    load_entries,
+    new_result,
+    request_checkpoint,
+    request_log_entry,
+    verify_entry,
+)
+
+# how many bulk requests are in flight at the same time by default
+DEFAULT_MAX_IN_FLIGHT = 16
+
+
+# the pooled client is blocking, so every request runs on a thread
+# of its own while the event loop waits on many of them at once
+async def _run_io(executor, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
+
+
+async def get_log_entry_async(log_index, client=None, executor=None):
+    """
+    returns the log entry in json format, the requests
+    exceptions are raised instead of exiting
+    """
+
+    return await _run_io(executor, request_log_entry, log_index, client)
+
+
+async def fetch_entry_async(log_index, client=None, executor=None):
+    """returns the decoded LogEntry for a log index"""
+
+    return LogEntry(await get_log_entry_async(log_index, client, executor))
+
+
+async def get_verification_proof_async(log_index, client=None, executor=None):
+    """returns the inclusion proof"""
+
+    entry = await fetch_entry_async(log_index, client, executor)
+    return entry.inclusion_proof
+
+
+async def get_latest_checkpoint_async(client=None, executor=None):
+    """returns the latest checkpoint in json format"""
+
+    return await _run_io(executor, request_checkpoint, client)
+
+
+async def verify_chunk_async(chunk, semaphore, client, io_executor, cpu_executor):
+    """
+    fetches a chunk of entries with one bulk request on the io executor
+    and verifies them on the cpu executor, at most semaphore chunks
+    are handled at once
+    """
+
+    loop = asyncio.get_running_loop()
+    async with semaphore:
+        # entries that verify_entry would reject before fetching
+        # are passed straight through so it can record why
+        wanted = [
+            log_index
+            for log_index, artifact_filepath in chunk
+            if isinstance(log_index, int) and artifact_is_sane(artifact_filepath)
+        ]
+        entries = {}
+        if wanted:
+            entries = await _run_io(io_executor, load_entries, wanted, client)
+
+        # the signature checks and the merkle hashing are cpu bound
+        # so they run on the cpu executor instead of the event loop
+        futures = []
+        for log_index, artifact_filepath in chunk:
+            entry = entries.get(log_index) if isinstance(log_index, int) else None
+            if isinstance(entry, EntryError):
+                future = loop.create_future()
+                future.set_result(new_result(log_index, artifact_filepath, str(entry)))
+            else:
+                future = loop.run_in_executor(
+                    cpu_executor, verify_entry, log_index, artifact_filepath, entry
+                )
+            futures.append(future)
+        return await asyncio.gather(*futures)
+
+
+async def verify_batch_async(
+    pairs,
+    max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+    client=None,
+    cpu_executor=None,
+    output=None,
+    chunk_size=MAX_RETRIEVE_BATCH,
+):
+    """
+    verifies every (log index, artifact filepath) pair with at most
+    max_in_flight bulk requests in progress at once and returns the
+    results in input order, each result is also written to output as
+    a json line as soon as its chunk finishes
+    """
+
+    if client is None:
+        client = get_default_client()
+
+    semaphore = asyncio.Semaphore(max_in_flight)
+    with ThreadPoolExecutor(max_workers=max_in_flight) as io_executor:
+        tasks = [
+            asyncio.ensure_future(
+                verify_chunk_async(chunk, semaphore, client, io_executor, cpu_executor)
+            )
+            for chunk in chunked(pairs, chunk_size)
+        ]
+        if output is not None:
+            for finished in asyncio.as_completed(tasks):
+                for result in await finished:
+                    output.write(json.dumps(result) + "\n")
+                output.flush()
+        chunk_results = await asyncio.gather(*tasks)
+    return [result for results in chunk_results for result in results]
+
+
+def inclusion_batch_async(
+    pairs,
+    output=None,
+    client=None,
+    max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+    cpu_executor=None,
+):
+    """
+    runs verify_batch_async from synchronous code and
+    returns the number of failures like inclusion_batch
+    """
+
+    results = asyncio.run(
+        verify_batch_async(pairs, max_in_flight, client, cpu_executor, output)
+    )
+    return sum(1 for result in results if not result["verified"])
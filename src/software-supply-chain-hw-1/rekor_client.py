@@ -0,0 +1,179 @@
+"""Shared, pooled http client for the rekor api"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import MaxRetryError, ReadTimeoutError
+from urllib3.util.retry import Retry
+
+from metrics import METRICS
+
+# the public rekor instance every request went to before
+# the base url became configurable
+DEFAULT_BASE_URL = "https://rekor.sigstore.dev"
+DEFAULT_TIMEOUT = 3
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_POOL_SIZE = 10
+
+# server side errors that are worth retrying
+RETRY_STATUSES = (500, 502, 503, 504)
+
+# rekor rejects a retrieve request with more than
+# this many log indexes or uuids in it
+MAX_RETRIEVE_BATCH = 10
+
+
+class OfflineError(requests.exceptions.ConnectionError):
+    """raised instead of sending a request when the client is offline"""
+
+
+def chunked(items, chunk_size):
+    """yields lists of at most chunk_size items from any iterable"""
+
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class RekorClient:
+    """
+    keeps a single keep-alive session with a connection pool
+    so that repeated rekor requests reuse their tcp and tls connections
+    """
+
+    def __init__(
+        self,
+        base_url=DEFAULT_BASE_URL,
+        timeout=DEFAULT_TIMEOUT,
+        retries=DEFAULT_RETRIES,
+        backoff_factor=DEFAULT_BACKOFF_FACTOR,
+        pool_size=DEFAULT_POOL_SIZE,
+        cache=None,
+        offline=False,
+        checkpoint_cache=None,
+        log_key=None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        # an optional cache.EntryCache that log entries are served from,
+        # an offline client serves only from it and never sends a request
+        self.cache = cache
+        self.offline = offline
+        # an optional cache.CheckpointCache shared by every checkpoint request
+        self.checkpoint_cache = checkpoint_cache
+        # the log's public key in pem format, with it every checkpoint's
+        # signed tree head is verified before the checkpoint is used
+        self.log_key = log_key
+
+        # retries connection errors, read timeouts and 5xx responses
+        # with an exponential backoff, a 5xx that is still failing after
+        # the last retry is returned so raise_for_status reports it
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "POST"}),
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def url(self, path):
+        """returns the full url for an api path"""
+        return self.base_url + path
+
+    def request(self, method, path, **kwargs):
+        """
+        sends a request and returns the json response,
+        a status >= 400 raises requests.exceptions.HTTPError
+        """
+
+        if self.offline:
+            raise OfflineError(f"{method} {path} needs the network in offline mode")
+        try:
+            with METRICS.stage("http"):
+                response = self.session.request(
+                    method, self.url(path), timeout=self.timeout, **kwargs
+                )
+        except requests.exceptions.ConnectionError as e:
+            # requests reports read timeouts that ran out of retries as a
+            # connection error, they are raised as a timeout instead so
+            # that callers only need to handle one kind of timeout
+            reason = e.args[0] if e.args else None
+            if isinstance(reason, MaxRetryError) and isinstance(
+                reason.reason, ReadTimeoutError
+            ):
+                raise requests.exceptions.ReadTimeout(e, request=e.request) from e
+            raise
+        METRICS.count("http_requests")
+        METRICS.count("bytes_fetched", len(response.content))
+        response.raise_for_status()
+        with METRICS.stage("json"):
+            return response.json()
+
+    def get(self, path, params=None):
+        """sends a GET request and returns the json response"""
+        return self.request("GET", path, params=params)
+
+    def post(self, path, payload):
+        """sends a POST request with a json body and returns the json response"""
+        return self.request("POST", path, json=payload)
+
+    def retrieve_entries(
+        self, log_indexes=None, uuids=None, chunk_size=MAX_RETRIEVE_BATCH
+    ):
+        """
+        yields (requested keys, entries) for every chunk of log indexes
+        or uuids, each chunk is one POST to /api/v1/log/entries/retrieve
+        and the entries are in the json format request_log_entry returns
+        """
+
+        if log_indexes is not None:
+            field, keys = "logIndexes", log_indexes
+        else:
+            field, keys = "entryUUIDs", uuids
+        for chunk in chunked(keys, chunk_size):
+            yield chunk, self.post("/api/v1/log/entries/retrieve", {field: chunk})
+
+    def close(self):
+        """closes every pooled connection and the cache"""
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_DEFAULT_CLIENT = None
+
+
+def get_default_client():
+    """returns the client shared by every call that isn't given one"""
+
+    global _DEFAULT_CLIENT  # pylint: disable=global-statement
+    if _DEFAULT_CLIENT is None:
+        _DEFAULT_CLIENT = RekorClient()
+    return _DEFAULT_CLIENT
+
+
+def set_default_client(client):
+    """replaces the shared client, for example with one for a local server"""
+
+    global _DEFAULT_CLIENT  # pylint: disable=global-statement
+    _DEFAULT_CLIENT = client
@@ -0,0 +1,183 @@
+"""Result objects and exceptions returned by the verification checks"""
+
+import time
+from contextlib import contextmanager
+
+# the status of a check
+OK = "ok"
+FAILED = "failed"
+
+# the categories a failed check is put in
+TIMEOUT = "timeout"
+OFFLINE = "offline"
+CONNECTION = "connection"
+# the log answered with a server error that was still failing after the retries
+UNAVAILABLE = "unavailable"
+# the log rejected the request, for example an index it doesn't have
+HTTP = "http"
+DECODE = "decode"
+INPUT = "input"
+KEY = "key"
+SIGNATURE = "signature"
+INCLUSION = "inclusion"
+CONSISTENCY = "consistency"
+CHECKPOINT = "checkpoint"
+
+
+class VerificationError(Exception):
+    """raised by raise_for_status, the failed result is kept on it"""
+
+    def __init__(self, result):
+        super().__init__(result.error)
+        self.result = result
+        self.category = result.category
+
+
+class FetchError(VerificationError):
+    """the log entry or checkpoint couldn't be fetched or decoded"""
+
+
+class InputError(VerificationError):
+    """the artifact or checkpoint given to the check isn't usable"""
+
+
+class SignatureError(VerificationError):
+    """the artifact signature or the key it is checked with is invalid"""
+
+
+class InclusionError(VerificationError):
+    """the entry is not included in the tree it claims to be in"""
+
+
+class ConsistencyError(VerificationError):
+    """the tree is not consistent with the checkpoint it is checked against"""
+
+
+# the exception raise_for_status raises for each category
+ERRORS = {
+    TIMEOUT: FetchError,
+    OFFLINE: FetchError,
+    CONNECTION: FetchError,
+    UNAVAILABLE: FetchError,
+    HTTP: FetchError,
+    DECODE: FetchError,
+    INPUT: InputError,
+    KEY: SignatureError,
+    SIGNATURE: SignatureError,
+    INCLUSION: InclusionError,
+    CONSISTENCY: ConsistencyError,
+    CHECKPOINT: ConsistencyError,
+}
+
+
+class Result:
+    """
+    the outcome of a check, the status is OK until a step fails, then
+    it is FAILED with the category and message of the first failure,
+    timings holds the seconds each step of the check took
+    """
+
+    def __init__(self):
+        self.status = OK
+        self.category = None
+        self.error = None
+        self.timings = {}
+
+    @property
+    def ok(self):
+        """returns whether every step of the check passed"""
+        return self.status == OK
+
+    def fail(self, category, error):
+        """records a failed step, only the first failure is kept"""
+
+        if self.status == OK:
+            self.status = FAILED
+            self.category = category
+            self.error = error
+        return self
+
+    @contextmanager
+    def timed(self, step):
+        """records how many seconds the wrapped step took"""
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[step] = time.perf_counter() - started
+
+    def raise_for_status(self):
+        """raises the VerificationError of the category if the check failed"""
+
+        if not self.ok:
+            raise ERRORS.get(self.category, VerificationError)(self)
+        return self
+
+    def to_dict(self):
+        """returns the result as a json serializable dict"""
+
+        return dict(vars(self))
+
+
+class SignatureResult(Result):
+    """the outcome of checking an artifact signature"""
+
+    def __init__(self, artifact):
+        super().__init__()
+        self.artifact = artifact
+        self.valid = False
+
+
+class InclusionResult(Result):
+    """the outcome of checking the signature and inclusion of a log entry"""
+
+    def __init__(self, log_index, artifact):
+        super().__init__()
+        self.log_index = log_index
+        self.artifact = artifact
+        self.signature_valid = None
+        self.included = None
+        self.leaf_hash = None
+        self.tree_size = None
+        self.computed_root = None
+        self.expected_root = None
+
+    def to_dict(self):
+        return {
+            "logIndex": self.log_index,
+            "artifact": self.artifact,
+            "status": self.status,
+            "category": self.category,
+            "error": self.error,
+            "signatureValid": self.signature_valid,
+            "included": self.included,
+            "leafHash": self.leaf_hash,
+            "treeSize": self.tree_size,
+            "computedRoot": self.computed_root,
+            "expectedRoot": self.expected_root,
+            "timings": self.timings,
+        }
+
+
+class ConsistencyResult(Result):
+    """the outcome of checking a checkpoint against the latest one"""
+
+    def __init__(self, prev_checkpoint):
+        super().__init__()
+        self.prev_checkpoint = prev_checkpoint
+        self.checkpoint = None
+        self.computed_root = None
+        self.expected_root = None
+
+    def to_dict(self):
+        return {
+            "status": self.status,
+            "category": self.category,
+            "error": self.error,
+            "previous": self.prev_checkpoint,
+            "latest": self.checkpoint,
+            "computedRoot": self.computed_root,
+            "expectedRoot": self.expected_root,
+            "timings": self.timings,
+        }
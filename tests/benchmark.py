@@ -0,0 +1,494 @@
+"""Micro-benchmarks for the verification hot paths"""
+
+import argparse
+import contextlib
+import datetime
+import functools
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+
+from merkle_proof import (
+    DefaultHasher,
+    FastDefaultHasher,
+    compute_leaf_hash,
+    verify_consistency,
+    verify_inclusion,
+    verify_inclusion_batch,
+)
+from merkle_tree import MerkleTree
+
+# how many hashes each timing run computes by default
+DEFAULT_NODES = 100000
+DEFAULT_REPEAT = 5
+
+# the recorded bundle and artifact every offline benchmark runs against
+DEFAULT_BUNDLE = "artifact.bundle"
+DEFAULT_ARTIFACT = "artifact.md"
+
+# tree sizes the proofs are verified at, odd sizes so that
+# every proof has both full and partial subtrees in it
+DEFAULT_TREE_SIZES = (1023, 65537)
+# the size the consistency proofs end at
+DEFAULT_CONSISTENCY_SIZE = max(DEFAULT_TREE_SIZES)
+# the size of the tree whose proofs are verified in one batch
+DEFAULT_BATCH_TREE_SIZE = 4096
+# sizes of the older tree as a fraction of the newer one
+DEFAULT_SIZE_RATIOS = (0.01, 0.5, 0.99)
+# artifact sizes the signature is verified over, multi gigabyte
+# artifacts are left to --artifact-sizes as they take a while to write
+DEFAULT_ARTIFACT_SIZES = (1024, 64 * 1024 * 1024)
+
+# a benchmark slower than the baseline by more than this is a regression
+DEFAULT_THRESHOLD = 1.2
+# numbers in the results that are not timings
+NOT_TIMINGS = ("nodes", "speedup", "size", "proofs", "bodyBytes")
+
+
+def per_call_ns(func, number, repeat):
+    """returns the fastest time per call of func in nanoseconds"""
+
+    return min(timeit.repeat(func, number=1, repeat=repeat)) * 1e9 / number
+
+
+def _call_times(number, func, *args):
+    for _ in range(number):
+        func(*args)
+
+
+def repeated(number, func, *args):
+    """
+    returns a callable that calls func(*args) number times, the
+    arguments are bound now so a loop can't change them under it
+    """
+    return functools.partial(_call_times, number, func, *args)
+
+
+def bench_hasher(nodes=DEFAULT_NODES, repeat=DEFAULT_REPEAT):
+    """
+    times hash_leaf and hash_children of DefaultHasher against
+    FastDefaultHasher and its bulk entry points, returns the time
+    per hash in nanoseconds and the speedup of each fast path
+    """
+
+    left = bytes(range(32))
+    right = bytes(range(32, 64))
+    leaf = bytes(range(100))
+    leaves = [leaf] * nodes
+    pairs = [(left, right)] * nodes
+
+    def loop_leaves(hasher):
+        return lambda: [hasher.hash_leaf(data) for data in leaves]
+
+    def loop_children(hasher):
+        return lambda: [hasher.hash_children(l, r) for l, r in pairs]
+
+    results = {
+        "nodes": nodes,
+        "hash_leaf": {
+            "DefaultHasher": per_call_ns(loop_leaves(DefaultHasher), nodes, repeat),
+            "FastHasher": per_call_ns(loop_leaves(FastDefaultHasher), nodes, repeat),
+            "FastHasher.hash_leaves": per_call_ns(
+                lambda: FastDefaultHasher.hash_leaves(leaves), nodes, repeat
+            ),
+        },
+        "hash_children": {
+            "DefaultHasher": per_call_ns(loop_children(DefaultHasher), nodes, repeat),
+            "FastHasher": per_call_ns(loop_children(FastDefaultHasher), nodes, repeat),
+            "FastHasher.hash_pairs": per_call_ns(
+                lambda: FastDefaultHasher.hash_pairs(pairs), nodes, repeat
+            ),
+        },
+    }
+    for timings in (results["hash_leaf"], results["hash_children"]):
+        baseline = timings["DefaultHasher"]
+        timings["speedup"] = {
+            name: baseline / ns
+            for name, ns in timings.items()
+            if name != "DefaultHasher"
+        }
+    return results
+
+
+def load_fixture(bundle_filepath=DEFAULT_BUNDLE):
+    """returns the rekor payload and the bundle recorded in a bundle file"""
+
+    with open(bundle_filepath, "r", encoding="utf-8") as bundle_file:
+        bundle = json.load(bundle_file)
+    return bundle["rekorBundle"]["Payload"], bundle
+
+
+def bench_inclusion(sizes=DEFAULT_TREE_SIZES, repeat=DEFAULT_REPEAT, number=1000):
+    """
+    times verify_inclusion of the first, middle and last leaf
+    of trees of each size, returns the time per proof in nanoseconds
+    """
+
+    results = {}
+    tree = MerkleTree()
+    tree.extend(
+        FastDefaultHasher.hash_leaves(i.to_bytes(8, "big") for i in range(max(sizes)))
+    )
+    for size in sizes:
+        root = tree.root(size).hex()
+        timings = {}
+        for index in (0, size // 2, size - 1):
+            leaf_hash = tree.leaves[index].hex()
+            proof = tree.inclusion_proof(index, size)
+            timings[f"index={index}"] = per_call_ns(
+                repeated(
+                    number,
+                    verify_inclusion,
+                    FastDefaultHasher,
+                    index,
+                    size,
+                    leaf_hash,
+                    proof,
+                    root,
+                ),
+                number,
+                repeat,
+            )
+        results[f"size={size}"] = timings
+    return results
+
+
+def bench_inclusion_batch(size=DEFAULT_BATCH_TREE_SIZE, step=1, repeat=DEFAULT_REPEAT):
+    """
+    times verify_inclusion_batch over the proofs of every step-th leaf of
+    a tree against verifying the same proofs one at a time, returns the
+    time per proof in nanoseconds and the speedup of the batch
+    """
+
+    tree = MerkleTree()
+    tree.extend(
+        FastDefaultHasher.hash_leaves(i.to_bytes(8, "big") for i in range(size))
+    )
+    root = tree.root(size).hex()
+    items = [
+        (index, size, tree.leaves[index].hex(), tree.inclusion_proof(index, size))
+        for index in range(0, size, step)
+    ]
+    if not all(verify_inclusion_batch(FastDefaultHasher, items, root)):
+        raise ValueError("the batch doesn't verify against its own tree")
+
+    def verify_each():
+        for index, tree_size, leaf_hash, proof in items:
+            verify_inclusion(
+                FastDefaultHasher, index, tree_size, leaf_hash, proof, root
+            )
+
+    results = {
+        "size": size,
+        "proofs": len(items),
+        "verify_inclusion": per_call_ns(verify_each, len(items), repeat),
+        "verify_inclusion_batch": per_call_ns(
+            functools.partial(verify_inclusion_batch, FastDefaultHasher, items, root),
+            len(items),
+            repeat,
+        ),
+    }
+    results["speedup"] = results["verify_inclusion"] / results["verify_inclusion_batch"]
+    return results
+
+
+def bench_consistency(
+    size=DEFAULT_CONSISTENCY_SIZE,
+    ratios=DEFAULT_SIZE_RATIOS,
+    repeat=DEFAULT_REPEAT,
+    number=1000,
+):
+    """
+    times verify_consistency from trees of a fraction of size to size,
+    returns the time per proof in nanoseconds
+    """
+
+    tree = MerkleTree()
+    tree.extend(
+        FastDefaultHasher.hash_leaves(i.to_bytes(8, "big") for i in range(size))
+    )
+    root2 = tree.root().hex()
+    results = {"size": size}
+    for ratio in ratios:
+        size1 = max(1, int(size * ratio))
+        root1 = tree.root(size1).hex()
+        proof = tree.consistency_proof(size1, size)
+        results[f"ratio={ratio}"] = per_call_ns(
+            repeated(
+                number,
+                verify_consistency,
+                FastDefaultHasher,
+                size1,
+                size,
+                proof,
+                root1,
+                root2,
+            ),
+            number,
+            repeat,
+        )
+    return results
+
+
+def bench_leaf_hash(
+    bundle_filepath=DEFAULT_BUNDLE, repeat=DEFAULT_REPEAT, number=10000
+):
+    """times compute_leaf_hash on the recorded entry body"""
+
+    payload, _ = load_fixture(bundle_filepath)
+    body = payload["body"]
+    return {
+        "bodyBytes": len(body),
+        "compute_leaf_hash": per_call_ns(
+            lambda: [compute_leaf_hash(body) for _ in range(number)], number, repeat
+        ),
+    }
+
+
+def bench_signature(sizes=DEFAULT_ARTIFACT_SIZES, repeat=DEFAULT_REPEAT):
+    """
+    times extract_public_key and verify_artifact_signature over artifacts
+    of each size signed with a fresh key, returns nanoseconds per call and
+    the hashing throughput in bytes per second
+    """
+
+    # pylint: disable=import-outside-toplevel
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+    import util
+    from fake_rekor import self_signed_certificate
+
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    certificate = self_signed_certificate(private_key)
+
+    def extract():
+        # the parsed key would be served from the key cache otherwise
+        util._key_cache.clear()  # pylint: disable=protected-access
+        return util.extract_public_key(certificate)
+
+    results = {"extract_public_key": per_call_ns(extract, 1, repeat)}
+    public_key = util.extract_public_key(certificate)
+    block = os.urandom(1024 * 1024)
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            path = os.path.join(directory, f"artifact-{size}")
+            with open(path, "wb") as artifact_file:
+                for offset in range(0, size, len(block)):
+                    artifact_file.write(block[: size - offset])
+            signature = private_key.sign(
+                util.hash_artifact(path), ec.ECDSA(Prehashed(hashes.SHA256()))
+            )
+            ns = per_call_ns(
+                functools.partial(
+                    util.verify_artifact_signature, signature, public_key, path, False
+                ),
+                1,
+                repeat,
+            )
+            results[f"verify_artifact_signature bytes={size}"] = ns
+            results[f"bytesPerSecond bytes={size}"] = size * 1e9 / ns
+            os.remove(path)
+    return results
+
+
+class RecordedClient:
+    """a client stand-in that answers every entry request with a recorded one"""
+
+    def __init__(self, data_json):
+        self.data_json = data_json
+        self.cache = None
+        self.checkpoint_cache = None
+        self.log_key = None
+        self.requests = 0
+
+    def get(self, path, params=None):  # pylint: disable=unused-argument
+        """returns the recorded entry"""
+        self.requests += 1
+        return self.data_json
+
+
+def recorded_entry(bundle_filepath=DEFAULT_BUNDLE):
+    """
+    returns the recorded entry in the format the rekor api returns it,
+    its inclusion proof is a one leaf tree so it verifies offline
+    """
+
+    payload, _ = load_fixture(bundle_filepath)
+    return {
+        "recorded": {
+            "body": payload["body"],
+            "logIndex": payload["logIndex"],
+            "verification": {
+                "inclusionProof": {
+                    "logIndex": 0,
+                    "treeSize": 1,
+                    "hashes": [],
+                    "rootHash": compute_leaf_hash(payload["body"]),
+                }
+            },
+        }
+    }
+
+
+def bench_end_to_end(
+    bundle_filepath=DEFAULT_BUNDLE,
+    artifact_filepath=DEFAULT_ARTIFACT,
+    repeat=DEFAULT_REPEAT,
+    number=100,
+):
+    """
+    times inclusion() end to end against a recorded client, the key cache
+    is cleared before every call so each one parses the certificate
+    """
+
+    # pylint: disable=import-outside-toplevel
+    import util
+    from main import check_inclusion, inclusion
+
+    client = RecordedClient(recorded_entry(bundle_filepath))
+    log_index = client.data_json["recorded"]["logIndex"]
+    if not check_inclusion(log_index, artifact_filepath, client).ok:
+        raise ValueError(f"{artifact_filepath} doesn't verify against the fixture")
+
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(number):
+                util._key_cache.clear()  # pylint: disable=protected-access
+                inclusion(log_index, artifact_filepath, client)
+
+    return {
+        "inclusion": per_call_ns(run, number, repeat),
+        "check_inclusion": per_call_ns(
+            lambda: [
+                check_inclusion(log_index, artifact_filepath, client)
+                for _ in range(number)
+            ],
+            number,
+            repeat,
+        ),
+    }
+
+
+# the benchmarks run_suite knows by name
+BENCHMARKS = {
+    "hasher": bench_hasher,
+    "inclusion": bench_inclusion,
+    "inclusion_batch": bench_inclusion_batch,
+    "consistency": bench_consistency,
+    "leaf_hash": bench_leaf_hash,
+    "signature": bench_signature,
+    "end_to_end": bench_end_to_end,
+}
+
+
+def run_suite(names=None, options=None):
+    """
+    runs the named benchmarks, all of them by default, with the keyword
+    arguments in options[name] and returns the results with the details
+    of the machine they ran on
+    """
+
+    if names is None:
+        names = list(BENCHMARKS)
+    options = options or {}
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "benchmarks": {
+            name: BENCHMARKS[name](**options.get(name, {})) for name in names
+        },
+    }
+
+
+def flatten_timings(results, prefix=""):
+    """yields (name, nanoseconds) for every timing in nested results"""
+
+    for key, value in results.items():
+        name = f"{prefix}/{key}" if prefix else key
+        if key in NOT_TIMINGS or key.startswith("bytes"):
+            continue
+        if isinstance(value, dict):
+            yield from flatten_timings(value, name)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def compare(baseline, current, threshold=DEFAULT_THRESHOLD):
+    """
+    returns the timings of current that are more than threshold times
+    slower than in baseline as a list of (name, baseline ns, current ns)
+    """
+
+    before = dict(flatten_timings(baseline["benchmarks"]))
+    regressions = []
+    for name, ns in flatten_timings(current["benchmarks"]):
+        if name in before and ns > before[name] * threshold:
+            regressions.append((name, before[name], ns))
+    return regressions
+
+
+def main():
+    """runs the suite and writes the results as json"""
+
+    parser = argparse.ArgumentParser(description="Verification benchmarks")
+    parser.add_argument(
+        "--only",
+        help="Benchmarks to run, comma separated, out of " + ", ".join(BENCHMARKS),
+        required=False,
+    )
+    parser.add_argument(
+        "--artifact-sizes",
+        help="Comma separated artifact sizes in bytes the signature is\
+                        verified over",
+        required=False,
+    )
+    parser.add_argument(
+        "--output", help="File the json results are written to", required=False
+    )
+    parser.add_argument(
+        "--compare",
+        help="Results of an earlier run, the run fails if any timing\
+                        got slower than --threshold times the earlier one",
+        required=False,
+    )
+    parser.add_argument(
+        "--threshold",
+        help="Slowdown factor counted as a regression",
+        required=False,
+        type=float,
+        default=DEFAULT_THRESHOLD,
+    )
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else None
+    options = {}
+    if args.artifact_sizes:
+        sizes = [int(size) for size in args.artifact_sizes.split(",")]
+        options["signature"] = {"sizes": sizes}
+    results = run_suite(names, options)
+
+    data = json.dumps(results, indent=4)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output_file:
+            output_file.write(data + "\n")
+    else:
+        print(data)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as baseline_file:
+            regressions = compare(json.load(baseline_file), results, args.threshold)
+        for name, before, after in regressions:
+            print(f"{name}: {before:.0f} ns -> {after:.0f} ns", file=sys.stderr)
+        if regressions:
+            sys.exit(f"Error: {len(regressions)} benchmarks regressed\n")
+
+
+if __name__ == "__main__":
+    main()
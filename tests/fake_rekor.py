@@ -0,0 +1,396 @@
+"""A local stand-in for the rekor api serving synthetic signed entries"""
+
+import argparse
+import base64
+import datetime
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+from merkle_proof import compute_leaf_hash
+from merkle_tree import MerkleTree
+from rekor_client import MAX_RETRIEVE_BATCH
+
+DEFAULT_ENTRIES = 1000
+DEFAULT_PORT = 3000
+DEFAULT_TREE_ID = "1193050959916656506"
+# the name the fake log signs its checkpoints with
+ORIGIN = "rekor.local"
+
+
+def self_signed_certificate(private_key):
+    """returns a pem certificate for private_key, like a fulcio leaf"""
+
+    # pylint: disable=import-outside-toplevel
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.x509.oid import NameOID
+
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "synthetic")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    certificate = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(private_key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now)
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(private_key, hashes.SHA256())
+    )
+    return certificate.public_bytes(serialization.Encoding.PEM)
+
+
+def synthetic_artifact(index):
+    """returns the contents of the artifact signed by entry index"""
+    return f"synthetic artifact {index}\n".encode()
+
+
+class FakeLog:
+    """
+    an append only log of synthetic hashedrekord entries, every artifact
+    is signed by one signing certificate and every checkpoint by the
+    log key, the leaves are kept in a local rfc 6962 merkle tree
+    """
+
+    def __init__(self, entries=DEFAULT_ENTRIES, tree_id=DEFAULT_TREE_ID):
+        # pylint: disable=import-outside-toplevel
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+
+        self.tree_id = tree_id
+        self.signing_key = ec.generate_private_key(ec.SECP256R1())
+        self.certificate = self_signed_certificate(self.signing_key)
+        self.log_key = ec.generate_private_key(ec.SECP256R1())
+        public_key = self.log_key.public_key()
+        self.log_key_pem = public_key.public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        der = public_key.public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        self.log_id = hashlib.sha256(der).hexdigest()
+        self._key_hash = bytes.fromhex(self.log_id)[:4]
+
+        self.tree = MerkleTree()
+        self.bodies = []
+        self.uuids = {}
+        self._lock = threading.Lock()
+        self.grow(entries)
+
+    def _sign(self, data, prehashed=False):
+        # pylint: disable=import-outside-toplevel
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ec
+        from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+
+        algorithm = Prehashed(hashes.SHA256()) if prehashed else hashes.SHA256()
+        return self.signing_key.sign(data, ec.ECDSA(algorithm))
+
+    def grow(self, count):
+        """appends count new entries to the log"""
+
+        with self._lock:
+            for index in range(len(self.bodies), len(self.bodies) + count):
+                digest = hashlib.sha256(synthetic_artifact(index)).digest()
+                body = {
+                    "apiVersion": "0.0.1",
+                    "kind": "hashedrekord",
+                    "spec": {
+                        "data": {
+                            "hash": {"algorithm": "sha256", "value": digest.hex()}
+                        },
+                        "signature": {
+                            "content": base64.b64encode(
+                                self._sign(digest, prehashed=True)
+                            ).decode(),
+                            "publicKey": {
+                                "content": base64.b64encode(self.certificate).decode()
+                            },
+                        },
+                    },
+                }
+                encoded = base64.b64encode(
+                    json.dumps(body, separators=(",", ":")).encode()
+                ).decode()
+                leaf_hash = compute_leaf_hash(encoded)
+                self.tree.append_hash(leaf_hash)
+                self.bodies.append(encoded)
+                self.uuids[leaf_hash] = index
+
+    def size(self):
+        """returns the current tree size"""
+        with self._lock:
+            return self.tree.size
+
+    def signed_tree_head(self, size, root_hash):
+        """returns the checkpoint note the log signs for a tree size"""
+
+        # pylint: disable=import-outside-toplevel
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import ec
+
+        root = base64.b64encode(bytes.fromhex(root_hash)).decode()
+        text = f"{ORIGIN} - {self.tree_id}\n{size}\n{root}\n"
+        signature = self.log_key.sign(text.encode(), ec.ECDSA(hashes.SHA256()))
+        encoded = base64.b64encode(self._key_hash + signature).decode()
+        return f"{text}\n— {ORIGIN} {encoded}\n"
+
+    def checkpoint(self):
+        """returns the latest checkpoint the way /api/v1/log returns it"""
+
+        with self._lock:
+            size = self.tree.size
+            root_hash = self.tree.root().hex()
+        return {
+            "inactiveShards": [],
+            "rootHash": root_hash,
+            "signedTreeHead": self.signed_tree_head(size, root_hash),
+            "treeID": self.tree_id,
+            "treeSize": size,
+        }
+
+    def entry(self, index):
+        """returns an entry the way /api/v1/log/entries returns it"""
+
+        with self._lock:
+            size = self.tree.size
+            body = self.bodies[index]
+            root_hash = self.tree.root().hex()
+            hashes = self.tree.inclusion_proof(index, size)
+        return {
+            compute_leaf_hash(body): {
+                "body": body,
+                "integratedTime": 0,
+                "logID": self.log_id,
+                "logIndex": index,
+                "verification": {
+                    "inclusionProof": {
+                        "checkpoint": self.signed_tree_head(size, root_hash),
+                        "hashes": hashes,
+                        "logIndex": index,
+                        "rootHash": root_hash,
+                        "treeSize": size,
+                    }
+                },
+            }
+        }
+
+    def consistency_proof(self, first_size, last_size):
+        """returns a consistency proof the way /api/v1/log/proof returns it"""
+
+        with self._lock:
+            hashes = self.tree.consistency_proof(first_size, last_size)
+            root_hash = self.tree.root(last_size).hex()
+        return {"hashes": hashes, "rootHash": root_hash}
+
+
+class FakeRekor:
+    """
+    serves a FakeLog over http on a local port, every request waits
+    latency seconds plus up to jitter seconds and error_rate of them
+    are answered with a 503 instead, seed makes the errors repeatable
+    """
+
+    def __init__(
+        self,
+        log=None,
+        host="127.0.0.1",
+        port=0,
+        latency=0.0,
+        jitter=0.0,
+        error_rate=0.0,
+        seed=None,
+    ):
+        self.log = log if log is not None else FakeLog()
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f"http://{host}:{self.server.server_address[1]}"
+        self._thread = None
+
+    def _delay_and_fail(self):
+        # returns whether this request should fail after waiting for it
+        with self._random_lock:
+            self.requests += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        return fail
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """answers the rekor api paths from the fake log"""
+
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """answers a GET request"""
+                self.respond(dict(parse_qsl(urlparse(self.path).query)))
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                """answers a POST request"""
+                length = int(self.headers.get("Content-Length") or 0)
+                self.respond(json.loads(self.rfile.read(length) or b"{}"))
+
+            def respond(self, params):
+                """writes the answer of the api path"""
+                if fake._delay_and_fail():  # pylint: disable=protected-access
+                    status, body = 503, {"code": 503, "message": "injected error"}
+                else:
+                    try:
+                        status, body = fake.answer(urlparse(self.path).path, params)
+                    except (KeyError, TypeError, ValueError) as e:
+                        status, body = 400, {"code": 400, "message": str(e)}
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                """keeps the output quiet"""
+
+        return Handler
+
+    def answer(self, path, params):
+        """returns the (status, json) answer of an api path"""
+
+        log = self.log
+        size = log.size()
+        if path.rstrip("/") == "/api/v1/log":
+            return 200, log.checkpoint()
+        if path == "/api/v1/log/entries":
+            index = int(params["logIndex"])
+            if not 0 <= index < size:
+                return 404, {"code": 404, "message": "log index not found"}
+            return 200, log.entry(index)
+        if path == "/api/v1/log/entries/retrieve":
+            if "logIndexes" in params:
+                indexes = [int(index) for index in params["logIndexes"]]
+            else:
+                # a uuid may have the tree id in front of the leaf hash
+                indexes = [log.uuids.get(uuid[-64:]) for uuid in params["entryUUIDs"]]
+            if len(indexes) > MAX_RETRIEVE_BATCH:
+                return 422, {"code": 422, "message": "too many entries requested"}
+            # like rekor, entries that don't exist are left out
+            return 200, [
+                log.entry(index)
+                for index in indexes
+                if index is not None and 0 <= index < size
+            ]
+        if path == "/api/v1/log/proof":
+            first_size = int(params.get("firstSize", 1))
+            last_size = int(params.get("lastSize", size))
+            if params.get("treeID", log.tree_id) != log.tree_id:
+                return 400, {"code": 400, "message": "unknown tree id"}
+            if not 0 <= first_size <= last_size <= size:
+                return 400, {"code": 400, "message": "sizes out of range"}
+            return 200, log.consistency_proof(first_size, last_size)
+        return 404, {"code": 404, "message": f"no such path: {path}"}
+
+    def start(self):
+        """serves on a background thread and returns self"""
+
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """stops serving"""
+
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    """serves a fake log until interrupted"""
+
+    parser = argparse.ArgumentParser(description="Local fake Rekor server")
+    parser.add_argument(
+        "--entries",
+        help="Number of synthetic entries in the log",
+        type=int,
+        default=DEFAULT_ENTRIES,
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "--latency", help="Seconds every request waits", type=float, default=0.0
+    )
+    parser.add_argument(
+        "--jitter",
+        help="Up to this many more seconds every request waits",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--error-rate",
+        help="Fraction of requests answered with a 503",
+        type=float,
+        default=0.0,
+    )
+    parser.add_argument("--seed", help="Seed of the injected errors", type=int)
+    parser.add_argument(
+        "--log-pubkey",
+        help="File the log's public key is written to, for --log-pubkey\
+                        of main.py",
+    )
+    parser.add_argument(
+        "--artifacts-dir",
+        help="Directory the synthetic artifacts are written to,\
+                        named by their log index",
+    )
+    args = parser.parse_args()
+
+    log = FakeLog(args.entries)
+    if args.log_pubkey:
+        with open(args.log_pubkey, "wb") as key_file:
+            key_file.write(log.log_key_pem)
+    if args.artifacts_dir:
+        os.makedirs(args.artifacts_dir, exist_ok=True)
+        for index in range(args.entries):
+            path = os.path.join(args.artifacts_dir, str(index))
+            with open(path, "wb") as artifact_file:
+                artifact_file.write(synthetic_artifact(index))
+
+    fake = FakeRekor(
+        log,
+        args.host,
+        args.port,
+        args.latency,
+        args.jitter,
+        args.error_rate,
+        args.seed,
+    )
+    print(f"serving {args.entries} entries on {fake.url}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        fake.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
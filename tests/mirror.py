@@ -0,0 +1,228 @@
+"""Incremental mirror that tails the rekor log and keeps it consistent"""
+
+import json
+import os
+import sys
+import time
+
+import requests
+
+from rekor_client import get_default_client
+from merkle_proof import (
+    FastDefaultHasher,
+    RootMismatchError,
+    compute_leaf_hash,
+    verify_consistency,
+)
+from merkle_tree import MerkleTree
+from checkpoint_note import CheckpointError
+from util import write_json
+from main import (
+    EntryError,
+    fetch_entries,
+    request_checkpoint,
+    request_consistency_proof,
+)
+
+# seconds between two polls of the latest checkpoint by default
+DEFAULT_POLL_INTERVAL = 30
+
+
+class MirrorError(Exception):
+    """raised when the log is not consistent with the mirrored state"""
+
+
+def log_index_offset(checkpoint):
+    """
+    returns how many log indexes come before the active tree,
+    entries of inactive shards keep their log indexes so the log
+    index of a leaf is its index in the tree plus this offset
+    """
+
+    return sum(shard["treeSize"] for shard in checkpoint.get("inactiveShards") or [])
+
+
+class LogMirror:
+    """
+    keeps the last verified tree size, root hash and tree id in a state
+    file and the right edge of the log's merkle tree in a local tree,
+    each tick fetches only the entries added since the last verified
+    size, checks that the new checkpoint is consistent with it and
+    that the local tree with the new leaves has the checkpoint's root
+    """
+
+    def __init__(self, state_path, client=None, store_leaves=False):
+        self.state_path = state_path
+        self.client = client if client is not None else get_default_client()
+        self.store_leaves = store_leaves
+        self.state = None
+        if os.path.exists(state_path):
+            with open(state_path, "r", encoding="utf-8") as state_file:
+                self.state = json.load(state_file)
+        # the local tree has the log's size and root, a mirror that
+        # started on a non empty log only knows the right edge of it
+        self.tree = MerkleTree(
+            FastDefaultHasher, state_path + ".tree", store_leaves=store_leaves
+        )
+
+    def _save(self):
+        # the tree is written first, a crash before the state is written
+        # leaves the tree ahead of it and _sync_tree brings it back
+        self.tree.flush()
+        write_json(self.state_path, self.state)
+
+    def _check_root(self, size, root_hash):
+        if self.tree.root().hex() != root_hash:
+            raise MirrorError(f"local root does not match the root at {size}")
+
+    def _seed_tree(self, size, root_hash, offset):
+        """
+        rebuilds the right edge of the tree at size from the inclusion
+        proof of its last leaf and checks it against the root hash
+        """
+
+        if size == 0:
+            self.tree.frontier, self.tree.size = [], 0
+            return
+        log_index = offset + size - 1
+        for _, entry in fetch_entries([log_index], self.client):
+            if isinstance(entry, EntryError):
+                raise MirrorError(f"log index {log_index}: {entry}")
+            proof = entry.inclusion_proof
+            try:
+                if proof["logIndex"] != size - 1:
+                    raise ValueError(
+                        f"log index {log_index} is at tree index "
+                        f"{proof['logIndex']}, want {size - 1}"
+                    )
+                self.tree.start_from_inclusion_proof(
+                    size - 1,
+                    proof["treeSize"],
+                    compute_leaf_hash(entry.body),
+                    proof["hashes"],
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                raise MirrorError(f"can't start the tree at {size}: {e}") from e
+        self._check_root(size, root_hash)
+
+    def _sync_tree(self, offset):
+        """brings a tree that doesn't match the saved state back to it"""
+
+        size = self.state["treeSize"]
+        if self.tree.size == size:
+            return
+        if self.store_leaves:
+            if self.tree.size < size:
+                raise MirrorError(
+                    f"the tree holds {self.tree.size} leaves, want {size}"
+                )
+            self.tree.truncate(size)
+            self._check_root(size, self.state["rootHash"])
+        else:
+            self._seed_tree(size, self.state["rootHash"], offset)
+        self.tree.flush()
+
+    def tick(self):
+        """
+        polls the latest checkpoint once, mirrors the new entries and
+        verifies consistency, returns a dict describing the tick
+        """
+
+        try:
+            checkpoint = request_checkpoint(self.client)
+        except CheckpointError as e:
+            raise MirrorError(f"checkpoint is not signed by the log: {e}") from e
+        new_size = checkpoint["treeSize"]
+        new_root = checkpoint["rootHash"]
+        offset = log_index_offset(checkpoint)
+
+        # the first tick only records where the mirror starts
+        if self.state is None:
+            if self.store_leaves and new_size:
+                raise MirrorError("a mirror that stores its leaves has to start at 0")
+            self._seed_tree(new_size, new_root, offset)
+            self.state = {
+                "treeID": str(checkpoint["treeID"]),
+                "treeSize": new_size,
+                "rootHash": new_root,
+                "startSize": new_size,
+            }
+            self._save()
+            return {"treeSize": new_size, "newEntries": 0, "consistent": True}
+
+        self._sync_tree(offset)
+        old_size = self.state["treeSize"]
+        old_root = self.state["rootHash"]
+        if str(checkpoint["treeID"]) != self.state["treeID"]:
+            raise MirrorError(
+                f"tree id changed from {self.state['treeID']} to {checkpoint['treeID']}"
+            )
+        if new_size < old_size:
+            raise MirrorError(f"tree size shrank from {old_size} to {new_size}")
+        if new_size == old_size:
+            if new_root != old_root:
+                raise MirrorError(f"root hash changed at tree size {old_size}")
+            return {"treeSize": new_size, "newEntries": 0, "consistent": True}
+
+        # only the entries added since the last verified size are fetched
+        log_indexes = range(offset + old_size, offset + new_size)
+        leaf_hashes = []
+        for log_index, entry in fetch_entries(log_indexes, self.client):
+            if isinstance(entry, EntryError):
+                raise MirrorError(f"log index {log_index}: {entry}")
+            tree_index = entry.inclusion_proof.get("logIndex")
+            if tree_index != log_index - offset:
+                raise MirrorError(
+                    f"log index {log_index} is at tree index {tree_index}, "
+                    f"want {log_index - offset}"
+                )
+            leaf_hashes.append(compute_leaf_hash(entry.body))
+
+        try:
+            proof = request_consistency_proof(
+                old_size, new_size, self.state["treeID"], self.client
+            )
+            verify_consistency(
+                FastDefaultHasher, old_size, new_size, proof, old_root, new_root
+            )
+        except (ValueError, RootMismatchError) as e:
+            raise MirrorError(
+                f"tree size {new_size} is not consistent with {old_size}: {e}"
+            ) from e
+
+        # the new leaves have to be the ones the log signed for, a tree
+        # that fails this isn't saved and the mirror stops
+        self.tree.extend(leaf_hashes)
+        self._check_root(new_size, new_root)
+
+        self.state["treeSize"] = new_size
+        self.state["rootHash"] = new_root
+        self._save()
+        return {
+            "treeSize": new_size,
+            "newEntries": new_size - old_size,
+            "consistent": True,
+        }
+
+    def run(self, interval=DEFAULT_POLL_INTERVAL, ticks=None, output=None):
+        """
+        ticks every interval seconds, forever or for the given number of
+        ticks, and writes one json line per tick, request failures are
+        reported and retried on the next tick while a MirrorError stops it
+        """
+
+        if output is None:
+            output = sys.stdout
+        count = 0
+        while ticks is None or count < ticks:
+            started = time.monotonic()
+            try:
+                result = self.tick()
+            except requests.exceptions.RequestException as e:
+                result = {"error": f"request failed: {e}"}
+            result["seconds"] = time.monotonic() - started
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+            count += 1
+            if ticks is None or count < ticks:
+                time.sleep(interval)
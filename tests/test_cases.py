@@ -1,11 +1,43 @@
 """test cases"""
 
+import base64
+import asyncio
+import hashlib
+import http.client
+import io
 import os
+import pstats
+import socket
 import sys
 import subprocess
+import tempfile
 import json
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
 from jsonschema import validate
+import cli
 import main
+import merkle_proof
+import merkle_tree
+import metrics
+import mirror
+import profiling
+import rekor_client
+import rekor_async
+import results
+import benchmark
+import bundle
+import cache
+import checkpoint_note
+import daemon
+import fake_rekor
+import util
 
 curr_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(curr_dir)
@@ -187,7 +219,7 @@ def test_inclusion_invalid_unsigned_artifact():
     try:
         main.inclusion(547323620, "artifact.bundle")
         assert False
-    except Exception:
+    except SystemExit:
         assert True
 
 
@@ -207,3 +239,1583 @@ def test_consistency_empty_checkpoint():
         assert True
     except SystemExit:
         assert False
+
+
+# case 11
+# makes sure that the batch file
+# reader skips blank lines and comments
+# and keeps malformed log indexes so they
+# can be reported instead of stopping the run
+def test_read_batch_file():
+    """test 11"""
+    batch_file = io.StringIO(
+        "# index artifact\n\n547323620 artifact.md\nnot-an-index artifact.md\n"
+    )
+    pairs = list(main.read_batch_file(batch_file))
+    assert pairs == [(547323620, "artifact.md"), ("not-an-index", "artifact.md")]
+
+
+# case 12
+# makes sure that a failed entry
+# in a batch doesn't stop the rest
+# of the batch and that one result
+# is written per entry
+def test_inclusion_batch_continues_after_failure():
+    """test 12"""
+    output = io.StringIO()
+    failures = main.inclusion_batch(
+        [("not-an-index", "artifact.md"), (547323620, "missing.md")], output
+    )
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert failures == 2
+    assert len(results) == 2
+    assert not results[0]["verified"]
+    assert results[1]["error"] == "The filepath is not sane"
+
+
+# builds a log entry in the format the rekor api returns
+# from the body in artifact.bundle with a single leaf tree
+# as its inclusion proof so that it can be verified offline
+def bundle_entry_json(log_index=None):
+    """returns a log entry for artifact.md in json format"""
+    with open("artifact.bundle", "r", encoding="utf-8") as bundle_file:
+        payload = json.load(bundle_file)["rekorBundle"]["Payload"]
+    if log_index is None:
+        log_index = payload["logIndex"]
+    return {
+        f"bundle-entry-{log_index}": {
+            "body": payload["body"],
+            "logIndex": log_index,
+            "verification": {
+                "inclusionProof": {
+                    "logIndex": 0,
+                    "treeSize": 1,
+                    "hashes": [],
+                    "rootHash": merkle_proof.compute_leaf_hash(payload["body"]),
+                }
+            },
+        }
+    }
+
+
+# case 13
+# makes sure that a log entry is
+# decoded once into its signature,
+# certificate and inclusion proof
+def test_log_entry_decoding():
+    """test 13"""
+    entry = main.LogEntry(bundle_entry_json())
+    assert entry.uuid.startswith("bundle-entry")
+    assert entry.certificate.startswith(b"-----BEGIN CERTIFICATE-----")
+    assert entry.spec["signature"]["content"]
+    assert entry.inclusion_proof["treeSize"] == 1
+    assert main.get_verification_proof(0, entry) is entry.inclusion_proof
+
+
+# case 14
+# makes sure that an already fetched
+# entry is verified without fetching
+# it again
+def test_verify_entry_with_fetched_entry():
+    """test 14"""
+    entry = main.LogEntry(bundle_entry_json())
+    result = main.verify_entry(entry.log_index, "artifact.md", entry)
+    assert result["verified"]
+    assert result["error"] is None
+
+
+# a local stand-in for the rekor server that answers
+# each api path with the next response queued for it,
+# a queued function is called with the posted json or
+# the query parameters instead
+class LocalRekor:
+    """serves queued (status, json) responses on a local port"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+        local = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """answers requests from the queued responses"""
+
+            def do_GET(self):  # pylint: disable=invalid-name
+                """answers a GET request"""
+                self.respond(dict(parse_qsl(urlparse(self.path).query)))
+
+            def do_POST(self):  # pylint: disable=invalid-name
+                """answers a POST request"""
+                length = int(self.headers.get("Content-Length", 0))
+                self.respond(json.loads(self.rfile.read(length)))
+
+            def respond(self, posted):
+                """writes the next queued response"""
+                local.requests.append(self.path)
+                queue = local.responses[urlparse(self.path).path]
+                response = queue.pop(0) if len(queue) > 1 else queue[0]
+                status, body = response(posted) if callable(response) else response
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                """keeps the test output quiet"""
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+# answers a bulk retrieve request with an entry for
+# every requested log index below 1000
+def retrieve_response(posted):
+    """returns the (status, json) response for a retrieve request"""
+    return 200, [
+        bundle_entry_json(log_index)
+        for log_index in posted["logIndexes"]
+        if log_index < 1000
+    ]
+
+
+local_checkpoint = {
+    "inactiveShards": [],
+    "rootHash": "6e9b436995ed0978ea0acc8d86dc8375c08c7c0e2c8e62cc5fe4285fe63a024f",
+    "signedTreeHead": "",
+    "treeID": "1193050959916656506",
+    "treeSize": 566822630,
+}
+
+
+# case 15
+# makes sure that the client can
+# be pointed at another rekor server
+def test_checkpoint_from_local_server():
+    """test 15"""
+    with LocalRekor({"/api/v1/log/": [(200, local_checkpoint)]}) as rekor:
+        client = rekor_client.RekorClient(rekor.url)
+        result = main.get_latest_checkpoint(client)
+    validate(instance=result, schema=checkpoint)
+
+
+# case 16
+# makes sure that a 5xx response is
+# retried on the pooled client
+def test_client_retries_server_errors():
+    """test 16"""
+    responses = {"/api/v1/log/": [(503, {}), (503, {}), (200, local_checkpoint)]}
+    with LocalRekor(responses) as rekor:
+        client = rekor_client.RekorClient(rekor.url, retries=3, backoff_factor=0)
+        result = main.get_latest_checkpoint(client)
+    assert result == local_checkpoint
+    assert len(rekor.requests) == 3
+
+
+# case 17
+# makes sure that inclusion works
+# end to end against a local server
+# and only fetches the entry once
+def test_inclusion_from_local_server():
+    """test 17"""
+    responses = {"/api/v1/log/entries": [(200, bundle_entry_json())]}
+    with LocalRekor(responses) as rekor:
+        client = rekor_client.RekorClient(rekor.url)
+        try:
+            main.inclusion(0, "artifact.md", client)
+            assert True
+        except SystemExit:
+            assert False
+    assert len(rekor.requests) == 1
+
+
+# case 18
+# makes sure that the async checkpoint
+# fetch returns the same checkpoint
+def test_checkpoint_async():
+    """test 18"""
+    with LocalRekor({"/api/v1/log/": [(200, local_checkpoint)]}) as rekor:
+        client = rekor_client.RekorClient(rekor.url)
+        result = asyncio.run(rekor_async.get_latest_checkpoint_async(client))
+    assert result == local_checkpoint
+
+
+# case 19
+# makes sure that the async batch verifier
+# returns one result per entry in input order
+# and records failures without stopping
+def test_verify_batch_async():
+    """test 19"""
+    pairs = [(0, "artifact.md"), (1, "missing.md"), (2, "artifact.md")]
+    responses = {"/api/v1/log/entries/retrieve": [retrieve_response]}
+    output = io.StringIO()
+    with LocalRekor(responses) as rekor:
+        client = rekor_client.RekorClient(rekor.url)
+        results = asyncio.run(
+            rekor_async.verify_batch_async(pairs, 2, client, output=output)
+        )
+    assert [result["logIndex"] for result in results] == [0, 1, 2]
+    assert [result["verified"] for result in results] == [True, False, True]
+    assert len(output.getvalue().splitlines()) == 3
+    assert len(rekor.requests) == 1
+
+
+# case 20
+# makes sure that batch entries are
+# fetched with bulk retrieve requests
+# of at most ten log indexes each and
+# that missing entries are reported
+def test_inclusion_batch_bulk_retrieve():
+    """test 20"""
+    pairs = [(log_index, "artifact.md") for log_index in range(25)]
+    pairs.append((5000, "artifact.md"))
+    responses = {"/api/v1/log/entries/retrieve": [retrieve_response]}
+    output = io.StringIO()
+    with LocalRekor(responses) as rekor:
+        client = rekor_client.RekorClient(rekor.url)
+        failures = main.inclusion_batch(pairs, output, client)
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert failures == 1
+    assert len(rekor.requests) == 3
+    assert results[-1]["error"] == "The log index was not sane"
+    assert all(result["verified"] for result in results[:-1])
+
+
+# case 21
+# makes sure that fetched entries are
+# cached on disk and served from the
+# cache in offline mode
+def test_entry_cache_offline():
+    """test 21"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        responses = {"/api/v1/log/entries": [(200, bundle_entry_json(7))]}
+        with LocalRekor(responses) as rekor:
+            client = rekor_client.RekorClient(
+                rekor.url, cache=cache.EntryCache(cache_dir)
+            )
+            main.inclusion(7, "artifact.md", client)
+            main.inclusion(7, "artifact.md", client)
+            client.close()
+        assert len(rekor.requests) == 1
+
+        offline_client = rekor_client.RekorClient(
+            rekor.url, cache=cache.EntryCache(cache_dir), offline=True
+        )
+        try:
+            main.inclusion(7, "artifact.md", offline_client)
+            assert True
+        except SystemExit:
+            assert False
+        try:
+            main.inclusion(8, "artifact.md", offline_client)
+            assert False
+        except SystemExit:
+            assert True
+        assert offline_client.cache.get_body(7)["kind"] == "hashedrekord"
+        offline_client.close()
+
+
+# case 22
+# makes sure that the least recently
+# used entries are evicted once the
+# cache is over its size
+def test_entry_cache_eviction():
+    """test 22"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        entry_cache = cache.EntryCache(cache_dir)
+        entry_cache.put(bundle_entry_json(1))
+        entry_size = entry_cache.size()
+        entry_cache.max_bytes = entry_size * 2
+        entry_cache.put(bundle_entry_json(2))
+        entry_cache.get_by_index(1)
+        entry_cache.put(bundle_entry_json(3))
+        assert len(entry_cache) == 2
+        assert entry_cache.get_by_index(2) is None
+        assert entry_cache.get_by_index(1) is not None
+        assert entry_cache.size() <= entry_size * 2
+        entry_cache.close()
+
+
+# case 23
+# makes sure that concurrent callers
+# within the ttl share one checkpoint fetch
+def test_checkpoint_cache_single_flight():
+    """test 23"""
+    checkpoint_cache = cache.CheckpointCache(ttl=60)
+    fetches = []
+
+    def fetch():
+        fetches.append(1)
+        time.sleep(0.2)
+        return local_checkpoint
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(checkpoint_cache.get(fetch)))
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(fetches) == 1
+    assert results == [local_checkpoint] * 8
+    assert checkpoint_cache.get(fetch) == local_checkpoint
+    assert len(fetches) == 1
+
+
+# case 24
+# makes sure that the checkpoint cache
+# expires after its ttl and keeps the
+# newest verified checkpoint between runs
+def test_checkpoint_cache_ttl_and_verified():
+    """test 24"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        path = os.path.join(cache_dir, "checkpoint.json")
+        checkpoint_cache = cache.CheckpointCache(ttl=0, path=path)
+        responses = {"/api/v1/log/": [(200, local_checkpoint)]}
+        with LocalRekor(responses) as rekor:
+            client = rekor_client.RekorClient(
+                rekor.url, checkpoint_cache=checkpoint_cache
+            )
+            main.get_latest_checkpoint(client)
+            main.get_latest_checkpoint(client)
+        assert len(rekor.requests) == 2
+
+        older = dict(local_checkpoint, treeSize=1)
+        checkpoint_cache.remember_verified(local_checkpoint)
+        checkpoint_cache.remember_verified(older)
+
+        reloaded = cache.CheckpointCache(path=path)
+        last_verified = reloaded.last_verified(local_checkpoint["treeID"])
+        assert last_verified["treeSize"] == local_checkpoint["treeSize"]
+        assert reloaded.get(lambda: None) == local_checkpoint
+
+
+# case 25
+# makes sure that the streamed digest of
+# an artifact matches hashing it in one go
+# and that the signature still verifies
+def test_streaming_artifact_hash():
+    """test 25"""
+    with open("artifact.md", "rb") as artifact_file:
+        data = artifact_file.read()
+    assert util.hash_artifact("artifact.md") == hashlib.sha256(data).digest()
+
+    entry = main.LogEntry(bundle_entry_json())
+    public_key = util.extract_public_key(entry.certificate)
+    assert util.verify_artifact_signature(
+        entry.signature, public_key, "artifact.md", False
+    )
+    assert not util.verify_artifact_signature(
+        entry.signature, public_key, "artifact.bundle", False
+    )
+
+
+# case 26
+# makes sure that the signature scheduler
+# returns every result in input order or
+# as completed and reports throughput
+def test_verify_signatures_in_pool():
+    """test 26"""
+    entry = main.LogEntry(bundle_entry_json())
+    jobs = [
+        (entry.signature, entry.certificate, "artifact.md"),
+        (entry.signature, entry.certificate, "artifact.bundle"),
+        (entry.signature, entry.certificate, "artifact.md"),
+    ]
+    results, stats = util.verify_signatures(jobs, max_workers=2)
+    assert results == [(0, True), (1, False), (2, True)]
+    assert stats["jobs"] == 3 and stats["valid"] == 2
+    assert stats["jobsPerSecond"] > 0
+
+    results, stats = util.verify_signatures(
+        jobs, max_workers=2, use_processes=False, ordered=False
+    )
+    assert sorted(results) == [(0, True), (1, False), (2, True)]
+
+
+# case 27
+# makes sure that the async batch verifier
+# can run its checks on worker processes
+def test_verify_batch_async_with_processes():
+    """test 27"""
+    pairs = [(log_index, "artifact.md") for log_index in range(4)]
+    responses = {"/api/v1/log/entries/retrieve": [retrieve_response]}
+    with LocalRekor(responses) as rekor:
+        client = rekor_client.RekorClient(rekor.url)
+        with ProcessPoolExecutor(max_workers=2) as cpu_executor:
+            failures = rekor_async.inclusion_batch_async(
+                pairs, io.StringIO(), client, 2, cpu_executor
+            )
+    assert failures == 0
+
+
+# case 28
+# makes sure that a cert is parsed once
+# and its key object is reused to verify
+def test_public_key_cache():
+    """test 28"""
+    entry = main.LogEntry(bundle_entry_json())
+    first = util.load_public_key(entry.certificate)
+    hits = util.key_cache_stats["hits"]
+    second = util.load_public_key(entry.certificate)
+    assert first is second
+    assert util.key_cache_stats["hits"] == hits + 1
+    assert util.verify_artifact_signature(entry.signature, second, "artifact.md", False)
+    assert util.extract_public_key(entry.certificate).startswith(
+        b"-----BEGIN PUBLIC KEY-----"
+    )
+
+
+# a reference rfc 6962 tree hash and inclusion path
+# used to build proofs for the merkle tests offline
+def reference_root(leaves):
+    """returns the root hash of a list of leaf hashes"""
+    if len(leaves) == 1:
+        return leaves[0]
+    split = 1 << ((len(leaves) - 1).bit_length() - 1)
+    return merkle_proof.DefaultHasher.hash_children(
+        reference_root(leaves[:split]), reference_root(leaves[split:])
+    )
+
+
+def reference_path(index, leaves):
+    """returns the inclusion proof of a leaf as a list of hashes"""
+    if len(leaves) == 1:
+        return []
+    split = 1 << ((len(leaves) - 1).bit_length() - 1)
+    if index < split:
+        return reference_path(index, leaves[:split]) + [reference_root(leaves[split:])]
+    return reference_path(index - split, leaves[split:]) + [
+        reference_root(leaves[:split])
+    ]
+
+
+# case 29
+# makes sure that the batch inclusion
+# verifier agrees with verify_inclusion
+# and reports each bad proof on its own
+def test_verify_inclusion_batch():
+    """test 29"""
+    hasher = merkle_proof.DefaultHasher
+    leaves = [hasher.hash_leaf(str(i).encode()) for i in range(13)]
+    root = reference_root(leaves)
+    items = [
+        (i, 13, leaves[i].hex(), [h.hex() for h in reference_path(i, leaves)])
+        for i in range(13)
+    ]
+    for index, size, leaf_hash, proof in items:
+        merkle_proof.verify_inclusion(hasher, index, size, leaf_hash, proof, root.hex())
+    items.append((4, 13, leaves[5].hex(), items[4][3]))
+    items.append((4, 13, leaves[4].hex(), items[4][3][:-1]))
+    items.append((13, 13, leaves[4].hex(), items[4][3]))
+    results = merkle_proof.verify_inclusion_batch(hasher, items, root.hex())
+    assert results == [True] * 13 + [False, False, False]
+
+    # a forged proof that reaches a node a valid proof went through
+    # is still checked against the root, one that can't be decoded
+    # only fails its own item
+    leaves = [hasher.hash_leaf(str(i).encode()) for i in range(16)]
+    root = reference_root(leaves)
+    valid = (13, 16, leaves[13].hex(), [h.hex() for h in reference_path(13, leaves)])
+    forged = (12, 16, leaves[12].hex(), [leaves[13].hex()] + ["00" * 32] * 3)
+    undecodable = (12, 16, leaves[12].hex(), [None] * 4)
+    assert merkle_proof.verify_inclusion_batch(hasher, [forged], root.hex()) == [False]
+    results = merkle_proof.verify_inclusion_batch(
+        hasher, [valid, forged, undecodable, valid], root.hex()
+    )
+    assert results == [True, False, False, True]
+
+    # proofs given as bytes are checked against the hex ones they share
+    # nodes with, whatever the hashes were written as
+    as_bytes = [
+        (index, size, bytes.fromhex(leaf_hash), [bytes.fromhex(h) for h in proof])
+        for index, size, leaf_hash, proof in (valid, forged)
+    ]
+    neighbour = (
+        12,
+        16,
+        leaves[12].hex(),
+        [h.hex() for h in reference_path(12, leaves)],
+    )
+    results = merkle_proof.verify_inclusion_batch(
+        hasher, [neighbour] + as_bytes, root.hex()
+    )
+    assert results == [True, True, False]
+
+
+# case 30
+# makes sure that the fast hasher computes
+# the same hashes as the default hasher
+def test_fast_hasher_matches_default():
+    """test 30"""
+    fast = merkle_proof.FastDefaultHasher
+    default = merkle_proof.DefaultHasher
+    leaves = [str(i).encode() for i in range(9)]
+    leaf_hashes = fast.hash_leaves(leaves)
+    assert leaf_hashes == [default.hash_leaf(leaf) for leaf in leaves]
+    pairs = list(zip(leaf_hashes, reversed(leaf_hashes)))
+    assert fast.hash_pairs(pairs) == [default.hash_children(l, r) for l, r in pairs]
+    assert fast.size() == default.size()
+    assert fast.empty_root() == default.empty_root()
+    assert not hasattr(fast, "__dict__")
+    root = reference_root(leaf_hashes)
+    proof = [h.hex() for h in reference_path(3, leaf_hashes)]
+    merkle_proof.verify_inclusion(fast, 3, 9, leaf_hashes[3].hex(), proof, root.hex())
+
+
+# case 31
+# makes sure that the proofs of the local
+# tree round trip through verify_inclusion
+# and verify_consistency for every size
+def test_local_tree_proofs():
+    """test 31"""
+    hasher = merkle_proof.FastDefaultHasher
+    tree = merkle_tree.MerkleTree()
+    for i in range(21):
+        tree.append(str(i).encode())
+    assert tree.root() == reference_root(tree.leaves)
+    for size in range(1, 22):
+        root = tree.root(size).hex()
+        for index in range(size):
+            merkle_proof.verify_inclusion(
+                hasher,
+                index,
+                size,
+                tree.leaves[index].hex(),
+                tree.inclusion_proof(index, size),
+                root,
+            )
+        for size1 in range(size + 1):
+            merkle_proof.verify_consistency(
+                hasher,
+                size1,
+                size,
+                tree.consistency_proof(size1, size),
+                tree.root(size1).hex(),
+                root,
+            )
+
+
+# case 32
+# makes sure that the local tree is
+# reloaded from disk and that a frontier
+# only tree keeps the same root
+def test_local_tree_on_disk():
+    """test 32"""
+    leaf_hashes = merkle_proof.FastDefaultHasher.hash_leaves(
+        [str(i).encode() for i in range(11)]
+    )
+    with tempfile.TemporaryDirectory() as tree_dir:
+        path = os.path.join(tree_dir, "tree")
+        tree = merkle_tree.MerkleTree(path=path)
+        tree.extend(leaf_hashes[:6])
+        tree.flush()
+        tree.extend(leaf_hashes[6:])
+        tree.flush()
+
+        reloaded = merkle_tree.MerkleTree(path=path)
+        assert reloaded.size == 11
+        assert reloaded.root() == tree.root()
+        assert reloaded.inclusion_proof(3) == tree.inclusion_proof(3)
+
+        compact = merkle_tree.MerkleTree(path=path, store_leaves=False)
+        assert compact.root() == tree.root()
+        try:
+            compact.inclusion_proof(3)
+            assert False
+        except ValueError:
+            assert True
+
+
+# serves a local tree of entries for artifact.md whose
+# log indexes start after an inactive shard of 100 entries
+class MirroredLog:
+    """answers checkpoint, retrieve and proof requests from a local tree"""
+
+    offset = 100
+
+    def __init__(self, sizes, forged=None):
+        self.body = main.LogEntry(bundle_entry_json()).body
+        self.tree = merkle_tree.MerkleTree()
+        self.tree.extend([merkle_proof.compute_leaf_hash(self.body)] * max(sizes))
+        self.sizes = list(sizes)
+        # the tree index whose entry is answered with another body
+        self.forged = forged
+
+    def checkpoint(self, _):
+        """returns the next checkpoint"""
+        size = self.sizes.pop(0) if len(self.sizes) > 1 else self.sizes[0]
+        return 200, dict(
+            local_checkpoint,
+            treeSize=size,
+            rootHash=self.tree.root(size).hex(),
+            inactiveShards=[{"treeSize": self.offset}],
+        )
+
+    def retrieve(self, posted):
+        """returns the entries of the requested log indexes"""
+        entries = []
+        for log_index in posted["logIndexes"]:
+            entry = bundle_entry_json(log_index)
+            raw = next(iter(entry.values()))
+            tree_index = log_index - self.offset
+            raw["verification"]["inclusionProof"] = {
+                "logIndex": tree_index,
+                "treeSize": self.tree.size,
+                "rootHash": self.tree.root().hex(),
+                "hashes": self.tree.inclusion_proof(tree_index),
+            }
+            if tree_index == self.forged:
+                body = json.loads(base64.b64decode(raw["body"]))
+                raw["body"] = base64.b64encode(json.dumps(body).encode()).decode()
+            entries.append(entry)
+        return 200, entries
+
+    def proof(self, query):
+        """returns the consistency proof between two sizes"""
+        first, last = int(query["firstSize"]), int(query["lastSize"])
+        return 200, {"hashes": self.tree.consistency_proof(first, last)}
+
+    def responses(self):
+        """returns the LocalRekor responses"""
+        return {
+            "/api/v1/log/": [self.checkpoint],
+            "/api/v1/log/entries/retrieve": [self.retrieve],
+            "/api/v1/log/proof": [self.proof],
+        }
+
+
+# case 33
+# makes sure that each tick of the mirror
+# fetches only the new entries and checks
+# consistency from the stored checkpoint
+def test_log_mirror_tail():
+    """test 33"""
+    log = MirroredLog([0, 5, 5, 12])
+    with tempfile.TemporaryDirectory() as state_dir:
+        state_path = os.path.join(state_dir, "mirror.json")
+        with LocalRekor(log.responses()) as rekor:
+            client = rekor_client.RekorClient(rekor.url)
+            log_mirror = mirror.LogMirror(state_path, client, store_leaves=True)
+            ticks = [log_mirror.tick() for _ in range(3)]
+            assert [tick["newEntries"] for tick in ticks] == [0, 5, 0]
+
+            resumed = mirror.LogMirror(state_path, client, store_leaves=True)
+            requests_before = len(rekor.requests)
+            assert resumed.tick()["newEntries"] == 7
+            retrieves = [
+                path for path in rekor.requests[requests_before:] if "retrieve" in path
+            ]
+            assert len(retrieves) == 1
+        assert resumed.tree.root() == log.tree.root(12)
+
+
+# case 34
+# makes sure that the mirror stops when
+# the log is not consistent with its state
+def test_log_mirror_inconsistent():
+    """test 34"""
+    log = MirroredLog([3, 6])
+    with tempfile.TemporaryDirectory() as state_dir:
+        state_path = os.path.join(state_dir, "mirror.json")
+        with LocalRekor(log.responses()) as rekor:
+            client = rekor_client.RekorClient(rekor.url)
+            log_mirror = mirror.LogMirror(state_path, client)
+            log_mirror.tick()
+            log_mirror.state["rootHash"] = "00" * 32
+            try:
+                log_mirror.tick()
+                assert False
+            except mirror.MirrorError:
+                assert True
+
+
+# returns the checkpoints of a local tree at the given sizes
+def chain_checkpoints(log, sizes):
+    """returns a checkpoint for each size of the mirrored log"""
+    return [
+        {
+            "treeID": local_checkpoint["treeID"],
+            "treeSize": size,
+            "rootHash": log.tree.root(size).hex(),
+        }
+        for size in sizes
+    ]
+
+
+# case 35
+# makes sure that a chain of checkpoints
+# is verified hop by hop and that verified
+# hops are not fetched again on a replay
+def test_consistency_chain():
+    """test 35"""
+    log = MirroredLog([31])
+    checkpoints = chain_checkpoints(log, [2, 5, 9, 9, 31])
+    with LocalRekor(log.responses()) as rekor:
+        client = rekor_client.RekorClient(rekor.url)
+        report = main.consistency_chain(checkpoints, client)
+        assert report["verified"] == 4 and report["divergence"] is None
+        assert len(rekor.requests) == 3
+
+        replay = main.consistency_chain(checkpoints[1:], client)
+        assert replay["memoized"] == 3 and replay["divergence"] is None
+        assert len(rekor.requests) == 3
+
+
+# case 36
+# makes sure that the first hop that
+# diverges is reported
+def test_consistency_chain_divergence():
+    """test 36"""
+    log = MirroredLog([40])
+    checkpoints = chain_checkpoints(log, [3, 17, 22, 40])
+    checkpoints[2]["rootHash"] = "00" * 32
+    with LocalRekor(log.responses()) as rekor:
+        client = rekor_client.RekorClient(rekor.url)
+        report = main.consistency_chain(checkpoints, client)
+    assert report["verified"] == 1
+    assert report["divergence"]["hop"] == 1
+
+
+class LocalLogKey:
+    """a signing key standing in for the key of a rekor log"""
+
+    def __init__(self):
+        self.private_key = ec.generate_private_key(ec.SECP256R1())
+        public_key = self.private_key.public_key()
+        self.pem = public_key.public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        der = public_key.public_bytes(
+            serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        self.key_hash = hashlib.sha256(der).digest()[:4]
+
+    def sign(self, data):
+        """returns the signature of the log over data"""
+        return self.private_key.sign(data, ec.ECDSA(hashes.SHA256()))
+
+    def note(self, tree_size, root_hash):
+        """returns a checkpoint note signed by the log"""
+        root = base64.b64encode(bytes.fromhex(root_hash)).decode()
+        text = f"rekor.local - 1234\n{tree_size}\n{root}\n"
+        encoded = base64.b64encode(self.key_hash + self.sign(text.encode()))
+        return f"{text}\n— rekor.local {encoded.decode()}\n"
+
+
+# returns the cosign bundle of artifact.md with its signed
+# entry timestamp signed by log_key instead of by rekor
+def cosign_bundle_signed_by(log_key):
+    with open("artifact.bundle", "r", encoding="utf-8") as bundle_file:
+        cosign_bundle = json.load(bundle_file)
+    payload = cosign_bundle["rekorBundle"]["Payload"]
+    promise = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    cosign_bundle["rekorBundle"]["SignedEntryTimestamp"] = base64.b64encode(
+        log_key.sign(promise.encode())
+    ).decode()
+    return cosign_bundle
+
+
+# returns a log key in pem format and a checkpoint json
+# whose signed tree head the key signed
+def signed_checkpoint(tree_size=3, root_hash="ab" * 32):
+    """returns (log key pem, checkpoint) for a local log"""
+    log_key = LocalLogKey()
+    return log_key.pem, {
+        "inactiveShards": [],
+        "rootHash": root_hash,
+        "signedTreeHead": log_key.note(tree_size, root_hash),
+        "treeID": "1234",
+        "treeSize": tree_size,
+    }
+
+
+# case 37
+# makes sure that a checkpoint note is parsed
+# and that its signature is only verified once
+def test_verify_signed_tree_head():
+    """test 37"""
+    pem, signed = signed_checkpoint()
+    note = checkpoint_note.verify_signed_tree_head(signed, pem)
+    assert note.size == 3 and note.root_hash == bytes.fromhex("ab" * 32)
+    assert note.tree_id() == "1234"
+
+    hits = checkpoint_note.note_cache_stats["hits"]
+    checkpoint_note.verify_signed_tree_head(signed, pem)
+    assert checkpoint_note.note_cache_stats["hits"] == hits + 1
+
+    # another key or a root hash the log didn't sign is rejected
+    other_pem, _ = signed_checkpoint()
+    for key, tampered in (
+        (other_pem, signed),
+        (pem, dict(signed, rootHash="cd" * 32)),
+    ):
+        try:
+            checkpoint_note.verify_signed_tree_head(tampered, key)
+            assert False
+        except checkpoint_note.CheckpointError:
+            assert True
+
+
+# case 38
+# makes sure that a client with a log key
+# refuses a checkpoint that isn't signed
+def test_checkpoint_with_log_key():
+    """test 38"""
+    pem, signed = signed_checkpoint()
+    forged = dict(signed, treeSize=4)
+    responses = {"/api/v1/log/": [(200, signed), (200, forged)]}
+    with LocalRekor(responses) as rekor:
+        client = rekor_client.RekorClient(rekor.url, log_key=pem)
+        assert main.get_latest_checkpoint(client) == signed
+        try:
+            main.get_latest_checkpoint(client)
+            assert False
+        except SystemExit:
+            assert True
+
+
+# case 39
+# makes sure that the cosign bundle verifies
+# the artifact without contacting rekor
+def test_bundle_offline():
+    """test 39"""
+    log_key = LocalLogKey()
+    parsed = bundle.parse_bundle(cosign_bundle_signed_by(log_key))
+    # the artifact is only read once for the digest and the signature
+    hashed = []
+    hash_artifact = bundle.hash_artifact
+    bundle.hash_artifact = lambda path: hashed.append(path) or hash_artifact(path)
+    try:
+        checks = bundle.verify_bundle(parsed, "artifact.md", log_key.pem)
+    finally:
+        bundle.hash_artifact = hash_artifact
+    assert checks == ["signature", "body", "signedEntryTimestamp"]
+    assert hashed == ["artifact.md"]
+
+    # the bundle alone, a timestamp the key didn't sign and
+    # a key that isn't one don't authenticate the log entry
+    rekor_signed = bundle.load_bundle("artifact.bundle")
+    for parsed_bundle, key in (
+        (parsed, None),
+        (rekor_signed, log_key.pem),
+        (parsed, b"not a key"),
+    ):
+        try:
+            bundle.verify_bundle(parsed_bundle, "artifact.md", key)
+            assert False
+        except bundle.BundleError:
+            assert True
+    result = bundle.verify_bundle_pair(("artifact.md", "artifact.bundle"), b"not a key")
+    assert not result["verified"] and "can't be loaded" in result["error"]
+    for key in (None, b"not a key"):
+        try:
+            main.bundle_inclusion("artifact.bundle", "artifact.md", key)
+            assert False
+        except SystemExit:
+            assert True
+
+    with tempfile.TemporaryDirectory() as directory:
+        other = os.path.join(directory, "artifact.md")
+        with open(other, "w", encoding="utf-8") as other_file:
+            other_file.write("not the signed artifact\n")
+        try:
+            bundle.verify_bundle(parsed, other, log_key.pem)
+            assert False
+        except bundle.BundleError:
+            assert True
+
+
+# case 40
+# makes sure that a sigstore bundle has its inclusion
+# proof, checkpoint and signed entry timestamp verified
+def test_sigstore_bundle_offline():
+    """test 40"""
+    with open("artifact.bundle", "r", encoding="utf-8") as bundle_file:
+        cosign_bundle = json.load(bundle_file)
+    payload = cosign_bundle["rekorBundle"]["Payload"]
+    log_key = LocalLogKey()
+    root_hash = merkle_proof.compute_leaf_hash(payload["body"])
+    promise = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    der = x509.load_pem_x509_certificate(
+        base64.b64decode(cosign_bundle["cert"])
+    ).public_bytes(serialization.Encoding.DER)
+    sigstore_bundle = {
+        "mediaType": "application/vnd.dev.sigstore.bundle.v0.3+json",
+        "verificationMaterial": {
+            "certificate": {"rawBytes": base64.b64encode(der).decode()},
+            "tlogEntries": [
+                {
+                    "logIndex": str(payload["logIndex"]),
+                    "logId": {
+                        "keyId": base64.b64encode(
+                            bytes.fromhex(payload["logID"])
+                        ).decode()
+                    },
+                    "integratedTime": str(payload["integratedTime"]),
+                    "inclusionPromise": {
+                        "signedEntryTimestamp": base64.b64encode(
+                            log_key.sign(promise.encode())
+                        ).decode()
+                    },
+                    "inclusionProof": {
+                        "logIndex": "0",
+                        "rootHash": base64.b64encode(bytes.fromhex(root_hash)).decode(),
+                        "treeSize": "1",
+                        "hashes": [],
+                        "checkpoint": {"envelope": log_key.note(1, root_hash)},
+                    },
+                    "canonicalizedBody": payload["body"],
+                }
+            ],
+        },
+        "messageSignature": {"signature": cosign_bundle["base64Signature"]},
+    }
+    parsed = bundle.parse_bundle(sigstore_bundle)
+    checks = bundle.verify_bundle(parsed, "artifact.md", log_key.pem)
+    assert checks == [
+        "signature",
+        "body",
+        "inclusion",
+        "checkpoint",
+        "signedEntryTimestamp",
+    ]
+
+    # a bundle checked with another log's key is rejected
+    try:
+        bundle.verify_bundle(parsed, "artifact.md", LocalLogKey().pem)
+        assert False
+    except bundle.BundleError:
+        assert True
+
+    # a proof without the checkpoint the log signed for it is rejected
+    tlog_entry = sigstore_bundle["verificationMaterial"]["tlogEntries"][0]
+    del tlog_entry["inclusionProof"]["checkpoint"]
+    try:
+        bundle.verify_bundle(
+            bundle.parse_bundle(sigstore_bundle), "artifact.md", log_key.pem
+        )
+        assert False
+    except bundle.BundleError as e:
+        assert "checkpoint" in str(e)
+
+
+# case 41
+# makes sure that every bundle in a directory tree
+# is paired with its artifact and that a result
+# is streamed for each of them
+def test_verify_bundle_tree():
+    """test 41"""
+    with tempfile.TemporaryDirectory() as directory:
+        for subdirectory in ("a", os.path.join("a", "b"), "c"):
+            os.makedirs(os.path.join(directory, subdirectory))
+        pairs = {
+            "good": os.path.join(directory, "a", "artifact.md"),
+            "tampered": os.path.join(directory, "a", "b", "artifact.md"),
+            "missing": os.path.join(directory, "c", "artifact.md"),
+        }
+        log_key = LocalLogKey()
+        for name, artifact in pairs.items():
+            with open(artifact + ".bundle", "w", encoding="utf-8") as bundle_file:
+                json.dump(cosign_bundle_signed_by(log_key), bundle_file)
+            if name != "missing":
+                with open("artifact.md", "rb") as artifact_file:
+                    data = artifact_file.read()
+                with open(artifact, "wb") as artifact_file:
+                    artifact_file.write(data if name == "good" else data + b"!")
+        # a file without a bundle is not an artifact
+        with open(os.path.join(directory, "README"), "w", encoding="utf-8") as f:
+            f.write("release notes\n")
+
+        walked = sorted(bundle.walk_bundle_pairs(directory))
+        assert walked == sorted((a, a + ".bundle") for a in pairs.values())
+
+        output = io.StringIO()
+        failures = bundle.verify_bundle_tree(
+            directory, output, max_workers=2, log_key=log_key.pem, use_processes=False
+        )
+    results = {
+        result["artifact"]: result
+        for result in map(json.loads, output.getvalue().splitlines())
+    }
+    assert failures == 2 and len(results) == 3
+    assert results[pairs["good"]]["verified"]
+    assert results[pairs["tampered"]]["error"] == "log entry is for another artifact"
+    assert not results[pairs["missing"]]["verified"]
+
+
+# case 42
+# makes sure that the inclusion check returns
+# a typed result instead of printing or exiting
+def test_check_inclusion_result():
+    """test 42"""
+    responses = {"/api/v1/log/entries": [(200, bundle_entry_json())]}
+    with LocalRekor(responses) as rekor:
+        client = rekor_client.RekorClient(rekor.url)
+        result = main.check_inclusion(0, "artifact.md", client)
+        unsigned = main.check_inclusion(0, "artifact.bundle", client)
+    assert result.ok and result.included and result.signature_valid
+    assert result.computed_root == result.expected_root
+    assert {"fetch", "hash", "verify", "inclusion"} <= set(result.timings)
+    assert result.raise_for_status() is result
+    json.dumps(result.to_dict())
+
+    assert unsigned.category == results.SIGNATURE and unsigned.included
+    try:
+        unsigned.raise_for_status()
+        assert False
+    except results.SignatureError as e:
+        assert e.result is unsigned
+
+    entry_json = bundle_entry_json()
+    next(iter(entry_json.values()))["verification"]["inclusionProof"]["rootHash"] = (
+        "00" * 32
+    )
+    with LocalRekor({"/api/v1/log/entries": [(200, entry_json)]}) as rekor:
+        client = rekor_client.RekorClient(rekor.url)
+        mismatch = main.check_inclusion(0, "artifact.md", client)
+    assert mismatch.category == results.INCLUSION and not mismatch.included
+    assert mismatch.computed_root == result.computed_root
+
+
+# case 43
+# makes sure that a root hash that doesn't match
+# is a consistency failure and not an uncaught error
+def test_check_consistency_result():
+    """test 43"""
+    log = MirroredLog([6])
+    prev_checkpoint = {
+        "treeID": local_checkpoint["treeID"],
+        "treeSize": 3,
+        "rootHash": log.tree.root(3).hex(),
+    }
+    with LocalRekor(log.responses()) as rekor:
+        client = rekor_client.RekorClient(rekor.url)
+        result = main.check_consistency(prev_checkpoint, client)
+        assert result.ok and result.checkpoint["treeSize"] == 6
+
+        tampered = dict(prev_checkpoint, rootHash="00" * 32)
+        mismatch = main.check_consistency(tampered, client)
+        assert mismatch.category == results.CONSISTENCY
+        try:
+            mismatch.raise_for_status()
+            assert False
+        except results.ConsistencyError:
+            assert True
+        try:
+            main.consistency(tampered, client)
+            assert False
+        except SystemExit:
+            assert True
+    assert main.check_consistency({}).category == results.INPUT
+
+
+# sends a request to the verification server and
+# returns the status and the decoded json answer
+def daemon_request(connection, method, path, payload=None):
+    """returns (status, json) of a request to the verification server"""
+    body = None if payload is None else json.dumps(payload)
+    connection.request(method, path, body=body)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+# case 44
+# makes sure that the server answers checkpoint,
+# inclusion and consistency queries with one warm client
+def test_daemon_http():
+    """test 44"""
+    log = MirroredLog([6])
+    responses = dict(log.responses())
+    responses["/api/v1/log/entries"] = [(200, bundle_entry_json(0))]
+    with LocalRekor(responses) as rekor, tempfile.TemporaryDirectory() as cache_dir:
+        client = rekor_client.RekorClient(rekor.url, cache=cache.EntryCache(cache_dir))
+        server = daemon.make_server("127.0.0.1:0", client)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            connection = http.client.HTTPConnection(*server.server_address)
+            status, checkpoint_json = daemon_request(connection, "GET", "/checkpoint")
+            assert status == 200 and checkpoint_json["treeSize"] == 6
+
+            query = "/inclusion?logIndex=0&artifact=artifact.md"
+            status, result = daemon_request(connection, "GET", query)
+            assert status == 200 and result["included"]
+            status, result = daemon_request(
+                connection,
+                "POST",
+                "/inclusion",
+                {"logIndex": 0, "artifact": "artifact.bundle"},
+            )
+            assert status == 422 and result["category"] == results.SIGNATURE
+
+            prev_checkpoint = {
+                "treeID": local_checkpoint["treeID"],
+                "treeSize": 2,
+                "rootHash": log.tree.root(2).hex(),
+            }
+            status, result = daemon_request(
+                connection, "POST", "/consistency", prev_checkpoint
+            )
+            assert status == 200 and result["status"] == results.OK
+            status, _ = daemon_request(connection, "POST", "/consistency", {})
+            assert status == 400
+        finally:
+            server.shutdown()
+            server.server_close()
+            client.close()
+    # the entry cache stayed warm between the two inclusion queries
+    assert (
+        sum(1 for path in rekor.requests if path.startswith("/api/v1/log/entries?"))
+        == 1
+    )
+
+
+# case 45
+# makes sure that the server can listen on a unix socket
+def test_daemon_unix_socket():
+    """test 45"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "verifier.sock")
+        server = daemon.make_server("unix:" + path)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.connect(path)
+                sock.sendall(
+                    b"GET /health HTTP/1.1\r\n"
+                    b"Host: localhost\r\nConnection: close\r\n\r\n"
+                )
+                answer = b"".join(iter(lambda: sock.recv(4096), b""))
+        finally:
+            server.shutdown()
+            server.server_close()
+    assert answer.startswith(b"HTTP/1.1 200")
+    assert answer.endswith(b'{"status": "ok"}')
+
+    # a file that isn't a socket is never replaced
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "notasocket.txt")
+        with open(path, "w", encoding="utf-8") as not_a_socket:
+            not_a_socket.write("kept")
+        try:
+            daemon.make_server("unix:" + path)
+            assert False
+        except ValueError:
+            assert True
+        with open(path, "r", encoding="utf-8") as not_a_socket:
+            assert not_a_socket.read() == "kept"
+
+
+# the cumulative microseconds importing main may take in a fresh
+# interpreter, loading cryptography alone goes over it
+IMPORT_BUDGET_US = 250_000
+
+
+# case 46
+# makes sure that importing main for a command like
+# --checkpoint doesn't load cryptography or the merkle code
+def test_import_time_budget():
+    """test 46"""
+    heavy = ["cryptography", "merkle_proof", "multiprocessing", "util", "bundle"]
+    script = (
+        "import sys, json, main; "
+        f"print(json.dumps([m for m in {heavy!r} if m in sys.modules]))"
+    )
+    # the fastest of a few imports so that a busy machine doesn't fail it
+    fastest = None
+    for _ in range(3):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            capture_output=True,
+            text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True,
+        )
+        assert json.loads(result.stdout) == []
+        cumulative = [
+            int(line.split("|")[1])
+            for line in result.stderr.splitlines()
+            if line.split("|")[-1].strip() == "main"
+        ]
+        assert cumulative
+        fastest = min(cumulative[0], fastest or cumulative[0])
+    assert fastest < IMPORT_BUDGET_US
+
+
+# case 47
+# makes sure that the benchmark suite runs offline
+# and that a slower run is reported as a regression
+def test_benchmark_suite():
+    """test 47"""
+    options = {
+        "hasher": {"nodes": 100, "repeat": 1},
+        "inclusion": {"sizes": (7, 33), "repeat": 1, "number": 2},
+        "inclusion_batch": {"size": 33, "repeat": 1},
+        "consistency": {"size": 33, "repeat": 1, "number": 2},
+        "leaf_hash": {"repeat": 1, "number": 2},
+        "signature": {"sizes": (1024,), "repeat": 1},
+        "end_to_end": {"repeat": 1, "number": 2},
+    }
+    results = benchmark.run_suite(options=options)
+    assert set(results["benchmarks"]) == set(benchmark.BENCHMARKS)
+    json.loads(json.dumps(results))
+
+    timings = dict(benchmark.flatten_timings(results["benchmarks"]))
+    assert "inclusion/size=33/index=32" in timings
+    assert not any("speedup" in name or "PerSecond" in name for name in timings)
+    assert benchmark.compare(results, results) == []
+
+    faster = json.loads(json.dumps(results))
+    faster["benchmarks"]["leaf_hash"]["compute_leaf_hash"] /= 10
+    assert [name for name, _, _ in benchmark.compare(faster, results)] == [
+        "leaf_hash/compute_leaf_hash"
+    ]
+
+
+# case 48
+# makes sure that the fake rekor serves signed entries,
+# checkpoints and proofs that verify like the real ones
+def test_fake_rekor():
+    """test 48"""
+    log = fake_rekor.FakeLog(12)
+    with fake_rekor.FakeRekor(log) as fake, tempfile.TemporaryDirectory() as directory:
+        client = rekor_client.RekorClient(fake.url, log_key=log.log_key_pem)
+        artifact = os.path.join(directory, "artifact")
+        with open(artifact, "wb") as artifact_file:
+            artifact_file.write(fake_rekor.synthetic_artifact(5))
+        assert main.check_inclusion(5, artifact, client).raise_for_status().included
+
+        entries = main.load_entries(range(12), client)
+        assert all(isinstance(entry, main.LogEntry) for entry in entries.values())
+        assert main.check_inclusion(12, artifact, client).category == results.HTTP
+
+        prev_checkpoint = main.request_checkpoint(client)
+        log.grow(5)
+        result = main.check_consistency(prev_checkpoint, client)
+        assert result.ok and result.checkpoint["treeSize"] == 17
+
+
+# case 49
+# makes sure that the fake rekor injects errors and latency
+def test_fake_rekor_error_injection():
+    """test 49"""
+    log = fake_rekor.FakeLog(1)
+    with fake_rekor.FakeRekor(log, latency=0.05, error_rate=1.0) as fake:
+        client = rekor_client.RekorClient(fake.url, retries=0)
+        started = time.monotonic()
+        result = main.check_inclusion(0, "artifact.md", client)
+        entries = main.load_entries([0], client)
+    # a server error is not reported as a bad log index
+    assert result.category == results.UNAVAILABLE
+    assert result.error == "The rekor server is unavailable"
+    assert str(entries[0]) == "The rekor server is unavailable"
+    assert time.monotonic() - started >= 0.05
+
+    # nothing listens on the port of the stopped server
+    client = rekor_client.RekorClient(fake.url, retries=0)
+    assert str(main.load_entries([0], client)[0]) == (
+        "Could not connect to the rekor server"
+    )
+
+
+# case 50
+# makes sure that the metrics record the stages, bytes and
+# hashes of an inclusion check only while they are enabled
+def test_metrics():
+    """test 50"""
+    registry = metrics.METRICS
+    responses = {"/api/v1/log/entries": [(200, bundle_entry_json())]}
+    with LocalRekor(responses) as rekor:
+        client = rekor_client.RekorClient(rekor.url)
+        registry.reset()
+        registry.enable(False)
+        main.check_inclusion(0, "artifact.md", client)
+        assert not registry.snapshot()["stages"]
+
+        registry.enable()
+        try:
+            result = main.check_inclusion(0, "artifact.md", client)
+            snapshot = registry.snapshot()
+            prometheus = registry.to_prometheus()
+        finally:
+            registry.enable(False)
+            registry.reset()
+    assert result.ok
+    assert {"http", "decode", "ecdsa_verify", "merkle"} <= set(snapshot["stages"])
+    assert snapshot["counters"]["http_requests"] == 1
+    assert snapshot["counters"]["bytes_fetched"] > 0
+    assert snapshot["counters"]["merkle_hashes"] >= 1
+    assert "public_key" in snapshot["caches"]
+    json.loads(json.dumps(snapshot))
+    assert 'rekor_verifier_stage_seconds_count{stage="http"} 1' in prometheus
+    assert "rekor_verifier_merkle_hashes_total" in prometheus
+
+
+# case 51
+# makes sure that a profiled call writes its stats and
+# summary even when the command exits with an error
+def test_profile_call():
+    """test 51"""
+
+    def failing_command(log_index):
+        main.check_inclusion(
+            log_index, "artifact.md", rekor_client.RekorClient(offline=True)
+        )
+        sys.exit("Error: failed\n")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        stats_path = os.path.join(tmp, "inclusion.prof")
+        output = io.StringIO()
+        try:
+            profiling.profile_call(
+                failing_command, (-1,), stats_path, 5, profiling.CPROFILE, output
+            )
+            assert False
+        except SystemExit:
+            pass
+        stats = pstats.Stats(stats_path)
+    assert any(name == "check_inclusion" for _, _, name in stats.stats)
+    assert "check_inclusion" in output.getvalue()
+    assert profiling.pick_profiler(profiling.AUTO) in (
+        profiling.CPROFILE,
+        profiling.SAMPLING,
+    )
+
+
+# case 52
+# makes sure that a mirror that starts on a non empty log checks
+# the new leaves against the signed root and that a tree saved
+# ahead of the state is brought back to it
+def test_log_mirror_verifies_leaves():
+    """test 52"""
+    with tempfile.TemporaryDirectory() as state_dir:
+        state_path = os.path.join(state_dir, "mirror.json")
+        with LocalRekor(MirroredLog([5, 9], forged=7).responses()) as rekor:
+            client = rekor_client.RekorClient(rekor.url)
+            log_mirror = mirror.LogMirror(state_path, client)
+            log_mirror.tick()
+            assert log_mirror.tree.root() == MirroredLog([5]).tree.root()
+            try:
+                log_mirror.tick()
+                assert False
+            except mirror.MirrorError as e:
+                assert "local root" in str(e)
+
+        log = MirroredLog([5, 9, 13])
+        with LocalRekor(log.responses()) as rekor:
+            client = rekor_client.RekorClient(rekor.url)
+            os.unlink(state_path)
+            log_mirror = mirror.LogMirror(state_path, client)
+            log_mirror.tick()
+            log_mirror.tick()
+            # a crash after the tree was written but before the state was
+            log_mirror.tree.extend([log.tree.leaves[0]] * 2)
+            log_mirror.tree.flush()
+            resumed = mirror.LogMirror(state_path, client)
+            assert resumed.tree.size == 11
+            assert resumed.tick()["newEntries"] == 4
+        assert resumed.tree.size == 13
+        assert resumed.tree.root() == log.tree.root(13)
+
+
+# case 53
+# makes sure that a cached entry of another kind fails only its
+# own batch entry and that main closes the client it made
+def test_cached_entry_of_another_kind():
+    """test 53"""
+    other_kind = bundle_entry_json(3)
+    raw = next(iter(other_kind.values()))
+    raw["body"] = base64.b64encode(
+        json.dumps({"kind": "intoto", "spec": {}}).encode()
+    ).decode()
+    closed = []
+
+    class ClosingClient(rekor_client.RekorClient):
+        """records that it was closed"""
+
+        def close(self):
+            closed.append(self)
+            super().close()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        entry_cache = cache.EntryCache(cache_dir)
+        entry_cache.put(other_kind)
+        entry_cache.put(bundle_entry_json(4))
+        client = rekor_client.RekorClient(cache=entry_cache, offline=True)
+        pairs = [(3, "artifact.md"), (4, "artifact.md")]
+        output = io.StringIO()
+        assert main.inclusion_batch(pairs, output, client) == 1
+        first, second = map(json.loads, output.getvalue().splitlines())
+        assert first["error"] == "The log entry could not be decoded"
+        assert second["verified"]
+        client.close()
+
+        argv = sys.argv
+        sys.argv = ["main.py", "--cache-dir", cache_dir, "--offline"]
+        sys.argv += ["--inclusion", "3", "--artifact", "artifact.md"]
+        try:
+            cli.RekorClient = ClosingClient
+            main.main()
+            assert False
+        except SystemExit:
+            assert True
+        finally:
+            cli.RekorClient = rekor_client.RekorClient
+            sys.argv = argv
+    assert len(closed) == 1
+
+
+# case 54
+# makes sure that a proof that can't be
+# fetched isn't reported as a divergence
+# and that hops are memoized per tree
+def test_consistency_chain_fetch_error():
+    """test 54"""
+    log = MirroredLog([40])
+    # a tree id of its own keeps the hops of the other chains out of the memo
+    checkpoints = [
+        dict(checkpoint, treeID="54")
+        for checkpoint in chain_checkpoints(log, [3, 17, 22])
+    ]
+    responses = log.responses()
+    responses["/api/v1/log/proof"] = [(503, {"message": "unavailable"})]
+    with LocalRekor(responses) as rekor:
+        client = rekor_client.RekorClient(rekor.url, retries=0)
+        report = main.consistency_chain(checkpoints, client)
+    assert report["divergence"] is None and report["verified"] == 0
+    assert report["fetchError"]["hop"] == 0
+    assert report["fetchError"]["category"] == results.UNAVAILABLE
+
+    with LocalRekor(log.responses()) as rekor:
+        client = rekor_client.RekorClient(rekor.url)
+        assert main.consistency_chain(checkpoints, client)["verified"] == 2
+        other_tree = [dict(checkpoint, treeID="55") for checkpoint in checkpoints]
+        report = main.consistency_chain(other_tree, client)
+    assert report["memoized"] == 0 and report["verified"] == 2
+
+
+# case 55
+# makes sure that the server only reads
+# artifacts from within its artifact root
+def test_daemon_artifact_root():
+    """test 55"""
+    with tempfile.TemporaryDirectory() as artifact_root:
+        os.symlink("/etc/hostname", os.path.join(artifact_root, "outside"))
+        server = daemon.make_server("127.0.0.1:0", artifact_root=artifact_root)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            connection = http.client.HTTPConnection(*server.server_address)
+            for artifact in (
+                "/etc/hostname",
+                "../etc/hostname",
+                "a/../../x",
+                "outside",
+            ):
+                status, result = daemon_request(
+                    connection,
+                    "POST",
+                    "/inclusion",
+                    {"logIndex": 0, "artifact": artifact},
+                )
+                assert status == 400 and "artifact root" in result["error"]
+        finally:
+            server.shutdown()
+            server.server_close()
+    assert server.server_address[0] == daemon.DEFAULT_HOST
+    server = daemon.make_server(":0")
+    server.server_close()
+    assert server.server_address[0] == daemon.DEFAULT_HOST
+
+
+# case 56
+# makes sure that a note verified with one key
+# isn't taken as verified with another key that
+# happens to have the same 4 byte key hash
+def test_checkpoint_memo_full_fingerprint():
+    """test 56"""
+    log_key, other_key = LocalLogKey(), LocalLogKey()
+    note = log_key.note(3, "ab" * 32)
+    checkpoint_note.verify_checkpoint(note, log_key.pem)
+
+    key, _, fingerprint = checkpoint_note.load_log_key(other_key.pem)
+    # the other key is given the key hash of the log key
+    # pylint: disable=protected-access
+    checkpoint_note._log_keys[hashlib.sha256(other_key.pem).digest()] = (
+        key,
+        log_key.key_hash,
+        fingerprint,
+    )
+    try:
+        checkpoint_note.verify_checkpoint(note, other_key.pem)
+        assert False
+    except checkpoint_note.CheckpointError:
+        assert True
+
+
+# case 57
+# makes sure that get_log_entry returns the
+# entry and exits when the index isn't sane
+def test_get_log_entry():
+    """test 57"""
+    responses = {"/api/v1/log/entries": [(200, bundle_entry_json(0)), (404, {})]}
+    with LocalRekor(responses) as rekor:
+        client = rekor_client.RekorClient(rekor.url, retries=0)
+        assert main.get_log_entry(0, client) == bundle_entry_json(0)
+        try:
+            main.get_log_entry(1, client)
+            assert False
+        except SystemExit as e:
+            assert "The log index was not sane" in str(e)
+        client.close()
+
+
+# case 58
+# makes sure that hits don't write to the
+# database and that an entry replaced by its
+# log index is taken off the cache size
+def test_entry_cache_replace_by_index():
+    """test 58"""
+    with tempfile.TemporaryDirectory() as cache_dir:
+        entry_cache = cache.EntryCache(cache_dir)
+        entry_cache.put(bundle_entry_json(5))
+        entry_size = entry_cache.size()
+        # pylint: disable=protected-access
+        changes = entry_cache._db.total_changes
+        assert entry_cache.get_by_index(5) is not None
+        assert entry_cache._db.total_changes == changes
+        entry_cache.put({"other-entry-5": bundle_entry_json(5)["bundle-entry-5"]})
+        assert len(entry_cache) == 1
+        assert entry_cache.size() == entry_size
+        assert "other-entry-5" in entry_cache.get_by_index(5)
+        entry_cache.close()
+
+
+# case 59
+# makes sure that a bare consistency check asks
+# for the previous checkpoint without contacting
+# the log when there is no checkpoint cache
+def test_consistency_without_checkpoint():
+    """test 59"""
+    result = subprocess.run(
+        [sys.executable, "main.py", "--rekor-url", "http://127.0.0.1:9"]
+        + ["--retries", "0", "--consistency"],
+        capture_output=True,
+        text=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        check=False,
+    )
+    assert result.stdout == "please specify tree id for prev checkpoint\n"
+    assert result.returncode == 0
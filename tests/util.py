@@ -1,24 +1,69 @@
-from cryptography import x509
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import serialization
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
 
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.asymmetric import ec
-from cryptography.hazmat.primitives.serialization import load_pem_public_key
-from cryptography.exceptions import InvalidSignature
+# cryptography and the executors are imported by the functions that
+# use them, importing them takes longer than most commands run for
+
+from metrics import METRICS
+from results import INPUT, KEY, SIGNATURE, SignatureResult
+
+# how many parsed public keys are kept in memory
+KEY_CACHE_SIZE = 1024
+
+# parsed public keys keyed by the fingerprint of their cert,
+# the least recently used key is dropped once the cache is full
+_key_cache: OrderedDict[bytes, Any] = OrderedDict()
+_key_cache_lock = threading.Lock()
+key_cache_stats = {"hits": 0, "misses": 0}
+METRICS.register_cache(
+    "public_key", lambda: (key_cache_stats["hits"], key_cache_stats["misses"])
+)
+
+
+# loads and returns the public key object from a given cert (in pem format)
+# entries signed by the same short lived cert share one parsed key, the
+# fingerprint is the sha256 of the pem bytes so a hit needs no parsing
+def load_public_key(cert):
+    fingerprint = hashlib.sha256(cert).digest()
+    with _key_cache_lock:
+        public_key = _key_cache.get(fingerprint)
+        if public_key is not None:
+            _key_cache.move_to_end(fingerprint)
+            key_cache_stats["hits"] += 1
+            return public_key
+        key_cache_stats["misses"] += 1
+
+    # pylint: disable=import-outside-toplevel
+    from cryptography import x509
+    from cryptography.hazmat.backends import default_backend
+
+    with METRICS.stage("certificate"):
+        certificate = x509.load_pem_x509_certificate(cert, default_backend())
+        public_key = certificate.public_key()
+
+    with _key_cache_lock:
+        _key_cache[fingerprint] = public_key
+        if len(_key_cache) > KEY_CACHE_SIZE:
+            _key_cache.popitem(last=False)
+    return public_key
 
 
 # extracts and returns public key from a given cert (in pem format)
 def extract_public_key(cert):
+    # pylint: disable=import-outside-toplevel
+    from cryptography.hazmat.primitives import serialization
+
     # read the certificate
     #    with open("cert.pem", "rb") as cert_file:
     #        cert_data = cert_file.read()
 
-    # load the certificate
-    certificate = x509.load_pem_x509_certificate(cert, default_backend())
-
-    # extract the public key
-    public_key = certificate.public_key()
+    # load the certificate and extract the public key
+    public_key = load_public_key(cert)
 
     # save the public key to a PEM file
     #    with open("cert_public.pem", "wb") as pub_key_file:
@@ -34,7 +79,65 @@ def extract_public_key(cert):
     return pem_public_key
 
 
-def verify_artifact_signature(signature, public_key, artifact_filename):
+# hashes the artifact in chunks so that memory use stays the same
+# however large the artifact is, returns the sha256 digest
+def hash_artifact(artifact_filename):
+    with open(artifact_filename, "rb") as data_file:
+        return hashlib.file_digest(data_file, "sha256").digest()
+
+
+# verifies the signature over an artifact whose sha256 digest was already
+# computed so that the artifact isn't read again, returns whether it is valid
+def check_digest_signature(signature, public_key, digest):
+    # pylint: disable=import-outside-toplevel
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.asymmetric import ec
+    from cryptography.hazmat.primitives.asymmetric.utils import Prehashed
+
+    try:
+        public_key.verify(signature, digest, ec.ECDSA(Prehashed(hashes.SHA256())))
+    except InvalidSignature:
+        return False
+    return True
+
+
+# checks the signature over the artifact and returns a SignatureResult
+# the public key can be pem bytes or a key object from load_public_key
+def check_artifact_signature(signature, public_key, artifact_filename):
+    # pylint: disable=import-outside-toplevel
+    from cryptography.hazmat.primitives.serialization import load_pem_public_key
+
+    result = SignatureResult(artifact_filename)
+    try:
+        if isinstance(public_key, bytes):
+            public_key = load_pem_public_key(public_key)
+    except ValueError as e:
+        return result.fail(KEY, f"Loading the public key failed: {e}")
+
+    # hash the data to be verified without reading all of it into memory
+    try:
+        with result.timed("hash"), METRICS.stage("artifact_hash"):
+            digest = hash_artifact(artifact_filename)
+    except OSError as e:
+        return result.fail(INPUT, f"Reading the artifact failed: {e}")
+
+    # verify the signature against the precomputed digest
+    try:
+        with result.timed("verify"), METRICS.stage("ecdsa_verify"):
+            valid = check_digest_signature(signature, public_key, digest)
+    except Exception as e:
+        return result.fail(SIGNATURE, f"Exception in verifying artifact signature: {e}")
+    if not valid:
+        return result.fail(SIGNATURE, "Signature is invalid")
+    result.valid = True
+    return result
+
+
+# verifies the signature over the artifact and returns whether it was valid
+# the public key can be pem bytes or a key object from load_public_key
+# verbose=False keeps batch runs from printing a line per artifact
+def verify_artifact_signature(signature, public_key, artifact_filename, verbose=True):
     # load the public key
     # with open("cert_public.pem", "rb") as pub_key_file:
     #    public_key = load_pem_public_key(pub_key_file.read())
@@ -43,20 +146,77 @@ def verify_artifact_signature(signature, public_key, artifact_filename):
     #    with open("hello.sig", "rb") as sig_file:
     #        signature = sig_file.read()
 
-    public_key = load_pem_public_key(public_key)
-    # load the data to be verified
-    with open(artifact_filename, "rb") as data_file:
-        data = data_file.read()
+    result = check_artifact_signature(signature, public_key, artifact_filename)
+    if verbose:
+        print("Signature is valid" if result.valid else result.error)
+    return result.valid
+
+
+# returns the number of cores this process is allowed to run on
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
 
-    valid = True
-    # verify the signature
+
+# writes data as json to a temporary file first and moves it
+# over path so that a crash never leaves a half written file behind
+def write_json(path, data):
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as json_file:
+        json.dump(data, json_file)
+    os.replace(temp_path, path)
+
+
+# verifies a single (signature, certificate, artifact filename) job,
+# it is kept at module level so that a process pool can pickle it
+def verify_job(job):
+    signature, certificate, artifact_filename = job
     try:
-        public_key.verify(signature, data, ec.ECDSA(hashes.SHA256()))
-    except InvalidSignature as e:
-        valid = False
-        print("Signature is invalid")
-    except Exception as e:
-        valid = False
-        print("Exception in verifying artifact signature:", e)
-    if valid:
-        print("Signature is valid")
+        public_key = load_public_key(certificate)
+    except ValueError:
+        return False
+    return verify_artifact_signature(signature, public_key, artifact_filename, False)
+
+
+# verifies many (signature, certificate, artifact filename) jobs across
+# a process pool (or a thread pool) sized to the cores available
+# returns a list of (job index, valid) in input order, or in the order
+# they finished when ordered is False, and a dict of throughput stats
+def verify_signatures(jobs, max_workers=None, use_processes=True, ordered=True):
+    # pylint: disable=import-outside-toplevel
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+    jobs = list(jobs)
+    if max_workers is None:
+        max_workers = available_cores()
+    pool = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+
+    start = time.perf_counter()
+    with pool(max_workers=max_workers) as executor:
+        if ordered:
+            # large chunks keep the pickling overhead per job low
+            chunksize = max(1, len(jobs) // (max_workers * 4))
+            if use_processes:
+                valid = executor.map(verify_job, jobs, chunksize=chunksize)
+            else:
+                valid = executor.map(verify_job, jobs)
+            results = list(enumerate(valid))
+        else:
+            futures = {
+                executor.submit(verify_job, job): index
+                for index, job in enumerate(jobs)
+            }
+            results = [
+                (futures[future], future.result()) for future in as_completed(futures)
+            ]
+    seconds = time.perf_counter() - start
+
+    stats = {
+        "jobs": len(jobs),
+        "valid": sum(1 for _, valid in results if valid),
+        "workers": max_workers,
+        "seconds": seconds,
+        "jobsPerSecond": len(jobs) / seconds if seconds > 0 else 0.0,
+    }
+    return results, stats